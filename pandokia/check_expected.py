@@ -48,6 +48,8 @@ import datetime
 
 import pandokia.common as common
 import pandokia
+import pandokia.test_identity
+import pandokia.test_name_tree
 pdk_db = pandokia.cfg.pdk_db
 
 import pandokia.helpers.easyargs as easyargs
@@ -55,6 +57,13 @@ import pandokia.helpers.easyargs as easyargs
 ##80######################################################################
 
 
+# the tests we expect, and whether one of them is in the test run
+expected_sql = "SELECT project, host, test_name, context FROM expected %s "
+found_sql = """SELECT status FROM result_scalar
+                WHERE test_run = :1 AND project = :2 AND host = :3 AND
+                test_name = :4 AND context = :5 """
+
+
 def run(args):
 
     spec = {
@@ -97,6 +106,10 @@ def run(args):
         print("this test run name is probably a mistake")
         return 1
 
+    # find out if there is a test name index to keep up to date; do
+    # this before we change anything in the database
+    pandokia.test_name_tree.have_table(pdk_db)
+
     # construct the query for the set of tests that we are expecting
 
     select_args = [('test_run_type', test_run_type)]
@@ -110,7 +123,7 @@ def run(args):
 
     where_text, where_dict = pdk_db.where_dict(select_args)
 
-    s = "SELECT project, host, test_name, context FROM expected %s " % where_text
+    s = expected_sql % where_text
 
     if verbose > 1:
         print(s)
@@ -131,9 +144,7 @@ def run(args):
         if verbose > 2:
             print("CHECK %s %s %s" % (project, host, test_name))
 
-        c1 = pdk_db.execute("""SELECT status FROM result_scalar
-                WHERE test_run = :1 AND project = :2 AND host = :3 AND
-                test_name = :4 AND context = :5 """,
+        c1 = pdk_db.execute(found_sql,
                             (test_run, project, host, test_name, context)
                             )
 
@@ -141,17 +152,16 @@ def run(args):
             # it wasn't there
             if verbose:
                 print("        MISSING: %s %s %s" % (project, host, test_name))
-            pdk_db.execute(
-                """INSERT INTO result_scalar
-                ( test_run, project, host, context, test_name, status, attn )
-                VALUES ( :1, :2, :3, :4, :5, :6, :7 )""",
-                (test_run,
-                 project,
-                 host,
-                 context,
-                 test_name,
-                 'M',
-                 'Y'))
+            pandokia.test_identity.insert_result(pdk_db, [
+                ('test_run', test_run),
+                ('project', project),
+                ('host', host),
+                ('context', context),
+                ('test_name', test_name),
+                ('status', 'M'),
+                ('attn', 'Y')])
+            # the missing test is in the treewalk too
+            pandokia.test_name_tree.add(pdk_db, test_run, test_name)
             detected = detected + 1
 
             # do some commits from time to time to avoid lock timeouts
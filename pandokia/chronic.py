@@ -1,6 +1,7 @@
 
 import pandokia
 import pandokia.common as common
+import pandokia.test_identity
 
 pdk_db = pandokia.cfg.pdk_db
 
@@ -119,7 +120,8 @@ def check_chronic(
         if res == 'C':
             print("chronic %d" % key_id)
             pdk_db.execute(
-                "UPDATE result_scalar SET chronic = '1' WHERE key_id = :1", (key_id, ))
+                "UPDATE %s SET chronic = '1' WHERE key_id = :1" %
+                pandokia.test_identity.result_table(pdk_db), (key_id, ))
             pdk_db.commit()
         elif res == 'F':
             print("fixed")
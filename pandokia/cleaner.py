@@ -22,6 +22,8 @@ import time
 import sys
 import os
 import pandokia.common
+import pandokia.test_name_tree
+import pandokia.test_identity
 
 import pandokia
 
@@ -39,7 +41,7 @@ def delete_by_query(where_str, where_dict):
     c = pdk_db.execute(
         "INSERT INTO delete_queue SELECT key_id FROM result_scalar %s" %
         where_str, where_dict)
-    c = pdk_db.execute("DELETE FROM result_scalar %s" % where_str, where_dict)
+    pandokia.test_identity.delete_where(pdk_db, where_str, where_dict)
     pdk_db.commit()
 
 
@@ -85,8 +87,8 @@ def delete_background_step(n=200, verbose=False):
     if verbose:
         print("result_scalar")
     pdk_db.execute(
-        "DELETE FROM result_scalar WHERE key_id IN ( %s )" %
-        parm, keys)
+        "DELETE FROM %s WHERE key_id IN ( %s )" %
+        (pandokia.test_identity.result_table(pdk_db), parm), keys)
     if verbose:
         print(time.time() - start)
         print("result_tda")
@@ -224,10 +226,14 @@ def block_last_record():
     #
     # We do this by always inserting a record that we are not going to delete.  We only
     # need one, though, at the end of the table.
-    pdk_db.execute(
-        "DELETE FROM result_scalar where test_run IS NULL AND project IS NULL AND host IS NULL AND context IS NULL AND test_name IS NULL ")
-    pdk_db.execute(
-        "INSERT INTO result_scalar ( test_run, project, host, context, test_name ) VALUES (NULL,NULL,NULL,NULL,NULL)")
+    pandokia.test_identity.delete_where(
+        pdk_db,
+        "WHERE test_run IS NULL AND project IS NULL AND host IS NULL AND context IS NULL AND test_name IS NULL ",
+        {})
+    pandokia.test_identity.insert_result(
+        pdk_db,
+        [('test_run', None), ('project', None), ('host', None),
+         ('context', None), ('test_name', None)])
 
 
 ##########
@@ -236,6 +242,9 @@ def block_last_record():
 # creates them in response to some queries, but we need some way to get
 # rid of them.
 #
+expired_qids_sql = "SELECT qid FROM query_id WHERE  expires > 0 AND expires < :1 LIMIT 400"
+
+
 def clean_queries():
 
     now = time.time()
@@ -257,8 +266,7 @@ def clean_queries():
     while mt < now:
 
         # get a bunch of records
-        c = pdk_db.execute(
-            "SELECT qid FROM query_id WHERE  expires > 0 AND expires < :1 LIMIT 400", (mt,))
+        c = pdk_db.execute(expired_qids_sql, (mt,))
         l = []
 
         # make a list of the qids
@@ -518,6 +526,10 @@ def delete(args):
         else:
             print(x)
             delete_by_query(where_str, where_dict)
+            if len(lll) > 0:
+                # only some of the test run is gone; the treewalk index
+                # may still list names that are not there any more
+                pandokia.test_name_tree.rebuild(pdk_db, x)
 
         recount([x], verbose=0)
 
@@ -561,14 +573,15 @@ def recount(args, verbose=1):
                 print("no test run found matching %s" % test_run)
 
 
+recount_sql = "SELECT COUNT(*), MIN(start_time), MAX(end_time) FROM result_scalar WHERE test_run = :1"
+
+
 def recount_test_run(test_run):
-    c = pdk_db.execute(
-        "SELECT COUNT(*), MIN(start_time), MAX(end_time) FROM result_scalar WHERE test_run = :1",
-        (test_run,
-         ))
+    c = pdk_db.execute(recount_sql, (test_run, ))
     x = c.fetchone()
     count = x[0]
     if count == 0:
+        pandokia.test_name_tree.delete(pdk_db, test_run)
         pdk_db.execute(
             "DELETE FROM distinct_test_run WHERE test_run = :1", (test_run,))
     else:
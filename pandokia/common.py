@@ -237,13 +237,16 @@ def find_test_run(run):
     return run
 
 
+previous_run_sql = "SELECT test_run FROM distinct_test_run WHERE test_run LIKE :1 AND test_run < :2 ORDER BY test_run DESC LIMIT 1"
+
+
 def run_previous(prefix, test_run):
     if prefix is None:
         prefix = recurring_test_run(test_run)
         if prefix is None:
             return None
     c = pandokia.cfg.pdk_db.execute(
-        "SELECT test_run FROM distinct_test_run WHERE test_run LIKE :1 AND test_run < :2 ORDER BY test_run DESC LIMIT 1",
+        previous_run_sql,
         (prefix +
          '%',
          test_run))
@@ -280,6 +283,69 @@ def run_next(prefix, test_run):
     return x[0]
 
 
+#
+# create a new qid - this is the identity of a list of test results.
+# The caller fills in the query table and commits.
+#
+def new_qid(expire=None):
+    pdk_db = pandokia.cfg.pdk_db
+    now = time.time()
+    if expire is None:
+        expire = now + cfg.default_qid_expire_days * 86400
+    if pdk_db.next:
+        qid = pdk_db.next('sequence_qid')
+        pdk_db.execute(
+            "INSERT INTO query_id ( qid, time, expires ) VALUES ( :1, :2, :3 ) ",
+            (qid, now, expire))
+    else:
+        c = pdk_db.execute(
+            "INSERT INTO query_id ( time, expires ) VALUES ( :1, :2 ) ",
+            (now, expire))
+        qid = c.lastrowid
+    qid_changed(qid)
+    return qid
+
+
+#
+# A qid that was made or changed in the last replica_lag seconds may not
+# have reached the read replica yet.  The pages that change a qid set
+# query_id.changed.  (Not query_id.time; the summary sets that every
+# time it shows the qid, which does not change the qid.)  Only a
+# database with replicas needs this, so only a database with replicas
+# needs the changed column.
+#
+def qid_changed(qid):
+    pdk_db = pandokia.cfg.pdk_db
+    if not pdk_db.replica_access_args:
+        return
+    pdk_db.execute(
+        "UPDATE query_id SET changed = :1 WHERE qid = :2 ",
+        (int(time.time()), qid))
+
+
+#
+# read from a replica for the rest of this process, if the database
+# has any.  For a page about a qid, only if the qid is old enough to be
+# on the replica; the check is on the primary, because that is where
+# the recent changes are.
+#
+def use_replica(qid=None):
+    pdk_db = pandokia.cfg.pdk_db
+    if not pdk_db.replica_access_args:
+        return
+    if qid is not None:
+        c = pdk_db.execute(
+            "SELECT changed FROM query_id WHERE qid = :1 ", (int(qid),))
+        x = c.fetchone()
+        if x is None:
+            return
+        # None is a qid that nobody changed since the column was added
+        if x[0] is not None and \
+                x[0] > time.time() - getattr(cfg, 'replica_lag', 60):
+            return
+    pdk_db.use_replica()
+
+
 #
 # look up a contact for a test
 #
@@ -18,6 +18,60 @@ re_funky_chars = re.compile('[^ -~]')
 
 re_star_x_star = re.compile('^\*[^*]*\*$')
 
+# statements that can go to a read replica, and statements that change
+# the database; see where_dict_base.replica().  Anything else (SET,
+# START TRANSACTION, ...) goes to the primary without changing where
+# the next query goes.
+replica_statements = ('SELECT', 'SHOW', 'EXPLAIN')
+write_statements = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE',
+                    'DROP', 'ALTER', 'TRUNCATE', 'LOCK', 'GRANT')
+
+re_word = re.compile('[A-Za-z_][A-Za-z_0-9]*')
+
+
+def statement_keyword(statement):
+    '''the keyword that says what statement does, in upper case
+
+    This is the first word, except for WITH: "WITH x AS ( ... ) SELECT"
+    only reads, but "WITH x AS ( ... ) DELETE" writes, so we skip over
+    the common table expressions and return the word after them.
+    '''
+    statement = statement.lstrip()
+    m = re_word.match(statement)
+    if m is None:
+        return ''
+    word = m.group(0).upper()
+    if word != 'WITH':
+        return word
+
+    # the first word outside the parentheses of the common table
+    # expressions that is not part of their definition
+    depth = 0
+    quote = None
+    i = m.end()
+    while i < len(statement):
+        c = statement[i]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '\'"`':
+            quote = c
+        elif c == '(':
+            depth = depth + 1
+        elif c == ')':
+            depth = depth - 1
+        elif depth == 0:
+            m = re_word.match(statement, i)
+            if m is not None:
+                word = m.group(0).upper()
+                if word in replica_statements or word in write_statements:
+                    return word
+                i = m.end()
+                continue
+        i = i + 1
+    # we cannot tell; the caller treats it as neither
+    return 'WITH'
+
 
 class name_sequence(object):
 
@@ -43,6 +97,10 @@ class where_dict_base(object):
     This class exists so you can subclass from it in the database driver.
     It is (so far) the same for every database driver.
     '''
+    # a pandokia.querylog.query_timer when query timing is on; the
+    # drivers pass each statement to it instead of executing it directly
+    query_timer = None
+
     #
     # convert a list of (name,value) to an sql WHERE clause.  value may be
     # a list to mean any one of the list elements.
@@ -159,6 +217,106 @@ class where_dict_base(object):
             res = "WHERE " + res
         return res, ns.dict
 
+    #
+    # find out whether a table (or view) exists, without causing an
+    # error that would need a rollback.  This version is for databases
+    # that have an information_schema; the sqlite driver has its own.
+    #
+    def has_table(self, name):
+        c = self.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_name = :1",
+            (name,))
+        return c.fetchone() is not None
+
+    #
+    # execute a statement for a list of key_ids, a chunk at a time:
+    #
+    #   pdk_db.execute_key_ids(
+    #       "DELETE FROM query WHERE qid = :1 AND key_id IN ( %s )",
+    #       key_ids, (qid,))
+    #
+    # The %s in stmt becomes a list of key_ids.  Some databases do not
+    # like a very long IN list, so we do it chunk_size at a time.  The
+    # key_ids are integers, so they go directly into the statement
+    # instead of taking up parameters.  Returns the number of key_ids.
+    #
+    def execute_key_ids(self, stmt, key_ids, params=(), chunk_size=500):
+        key_ids = [int(x) for x in key_ids]
+        for n in range(0, len(key_ids), chunk_size):
+            chunk = key_ids[n:n + chunk_size]
+            self.execute(stmt % ', '.join([str(x) for x in chunk]), params)
+        return len(key_ids)
+
+    #
+    # start a transaction for a batch of inserts.  The other database
+    # engines start a transaction by themselves and lock only the rows
+    # that they change, so there is nothing to do; sqlite takes the write
+    # lock here.
+    #
+    def start_write_batch(self):
+        pass
+
+    #
+    # read replicas
+    #
+    # A driver that supports replicas takes them as a list of access
+    # args, in the same form as the access arg of the primary:
+    #
+    #   pdk_db = dbd.PandokiaDB(primary_arg, replicas=[replica1_arg, ...])
+    #
+    # Nothing changes until the program calls use_replica().  After
+    # that, statements that only read (SELECT and the like) go to one of
+    # the replicas, chosen at random when the first one is executed.
+    # The first statement that writes goes to the primary, and so does
+    # every statement after it, so the program always sees its own
+    # writes.  The CGI does this for the report pages; see pcgi.py.
+    #
+    # If no replica can be reached, everything goes to the primary.
+    #
+    replica_access_args = ()
+    replica_db = None
+    reading_replica = False
+
+    def use_replica(self):
+        if self.replica_access_args:
+            self.reading_replica = True
+
+    def use_primary(self):
+        self.reading_replica = False
+
+    #
+    # the replica connection to execute statement on, or None for the
+    # primary.  The driver defines _replica_connect( access_arg ), which
+    # returns a connection that commits by itself, so that a long
+    # running reader never holds a transaction open on the replica.
+    #
+    def replica(self, statement):
+        if not self.reading_replica:
+            return None
+
+        w = statement_keyword(statement)
+        if w not in replica_statements:
+            if w in write_statements:
+                # stay on the primary from now on
+                self.reading_replica = False
+            return None
+
+        if self.replica_db is None:
+            import random
+            l = list(self.replica_access_args)
+            random.shuffle(l)
+            for x in l:
+                try:
+                    self.replica_db = self._replica_connect(x)
+                    break
+                except self.DatabaseError:
+                    pass
+            else:
+                self.reading_replica = False
+                return None
+
+        return self.replica_db
+
     #
     # extract a table as a csv file
     # used for testing
@@ -48,15 +48,25 @@ class PandokiaDB(pandokia.db.where_dict_base):
 
     db = None
 
-    def __init__(self, access_arg):
-        self.db_access_arg = access_arg
+    def __init__(self, access_arg, replicas=()):
+        self.db_access_arg = self._str_args(access_arg)
+        # read replicas; see use_replica() in pandokia.db
+        self.replica_access_args = [self._str_args(x) for x in replicas]
+
+    def _str_args(self, access_arg):
         # the mysqldb package I have installed chokes if you give
         # it unicode strings.  So convert any unicode back to str.
-        for x in access_arg:
+        for x in list(access_arg):
             if isinstance(access_arg[x], str):
-                self.db_access_arg[str(x)] = str(access_arg[x])
+                access_arg[str(x)] = str(access_arg[x])
             else:
-                self.db_access_arg[str(x)] = access_arg[x]
+                access_arg[str(x)] = access_arg[x]
+        return access_arg
+
+    def _replica_connect(self, access_arg):
+        db = db_module.connect(** access_arg)
+        db.autocommit(True)
+        return db
 
     def open(self):
         # If the user explicitly calls open(), then we know they want
@@ -137,9 +147,6 @@ class PandokiaDB(pandokia.db.where_dict_base):
     _pat_to = '%(\\1)s '
 
     def execute(self, statement, parameters=[], db=None):
-        if self.db is None:
-            self.open()
-
         # convert the parameters, as necessary
         if isinstance(parameters, dict):
             # dict does not need to be converted
@@ -157,10 +164,17 @@ class PandokiaDB(pandokia.db.where_dict_base):
             raise self.ProgrammingError
 
         # for mysql, convert :xxx to %(xxx)s
+        text = statement
         statement = self._pat_from.sub(self._pat_to, statement)
 
-        # create a cursor, execute the statement
-        c = self.db.cursor()
+        # create a cursor, execute the statement.  A report that reads
+        # only from a replica never connects to the primary.
+        db = self.replica(text)
+        if db is None:
+            if self.db is None:
+                self.open()
+            db = self.db
+        c = db.cursor()
 
         if debug:
             stmt_keys_start = statement.find('(')
@@ -184,6 +198,9 @@ class PandokiaDB(pandokia.db.where_dict_base):
             c.execute("SHOW WARNINGS")
             print("\n\n\n")
 
+        if self.query_timer is not None:
+            return self.query_timer.execute(c, statement, parameters, text)
+
         # print parameters,"<br>"
         c.execute(statement, parameters)
 
@@ -206,6 +223,13 @@ class PandokiaDB(pandokia.db.where_dict_base):
 
         return tables + indexes
 
+    # information_schema lists the tables of every database on the server
+    def has_table(self, name):
+        c = self.execute(
+            "SELECT table_name FROM information_schema.tables WHERE table_name = :1 AND table_schema = DATABASE()",
+            (name,))
+        return c.fetchone() is not None
+
     # mysql does not use database sequences because it can do auto-increments
     # fields
     next = None
@@ -54,8 +54,17 @@ class PandokiaDB(pandokia.db.where_dict_base):
 
     db = None
 
-    def __init__(self, access_arg):
+    def __init__(self, access_arg, replicas=()):
         self.db_access_arg = access_arg
+        # read replicas; see use_replica() in pandokia.db
+        self.replica_access_args = list(replicas)
+
+    def _replica_connect(self, access_arg):
+        # autocommit, so a long report does not hold a transaction open
+        # on a hot standby and hold up the replay of the primary's changes
+        db = db_module.connect(** access_arg)
+        db.autocommit = True
+        return db
 
     def open(self):
         if self.db is None:
@@ -106,9 +115,6 @@ class PandokiaDB(pandokia.db.where_dict_base):
     _pat_to = '%(\\1)s '
 
     def execute(self, statement, parameters=[]):
-        if self.db is None:
-            self.open()
-
         # convert the parameters, as necessary
         if isinstance(parameters, dict):
             # dict does not need to be converted
@@ -126,10 +132,20 @@ class PandokiaDB(pandokia.db.where_dict_base):
             raise self.ProgrammingError
 
         # for mysql, convert :xxx to %(xxx)s
+        text = statement
         statement = self._pat_from.sub(self._pat_to, statement)
 
-        # create a cursor, execute the statement
-        c = self.db.cursor()
+        # create a cursor, execute the statement.  A report that reads
+        # only from a replica never connects to the primary.
+        db = self.replica(text)
+        if db is None:
+            if self.db is None:
+                self.open()
+            db = self.db
+        c = db.cursor()
+
+        if self.query_timer is not None:
+            return self.query_timer.execute(c, statement, parameters, text)
 
         # print parameters,"<br>"
         c.execute(statement, parameters)
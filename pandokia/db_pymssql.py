@@ -141,6 +141,7 @@ class PandokiaDB(pandokia.db.where_dict_base):
             raise self.ProgrammingError
 
         # for mysql, convert :xxx to %(xxx)s
+        text = statement
         statement = self._pat_from.sub(self._pat_to, statement)
 
         # create a cursor, execute the statement
@@ -156,6 +157,9 @@ class PandokiaDB(pandokia.db.where_dict_base):
                 _tty.write(str(x) + "\n")
             _tty.write("\n\n\n")
 
+        if self.query_timer is not None:
+            return self.query_timer.execute(c, statement, parameters, text)
+
         # print parameters,"<br>"
         c.execute(statement, parameters)
 
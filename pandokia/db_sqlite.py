@@ -54,6 +54,45 @@ threadsafety = db_module.threadsafety
 # lot of writes, but we have a problem once or twice a year that seems to
 # be related to killing an import.
 #
+# The tuned profile:
+#
+#   pdk_db = dbd.PandokiaDB(db_arg, tuned=True)
+#
+# sqlite locks the whole database file.  In the default (rollback
+# journal) mode, a reader keeps the importer from committing, and the
+# importer keeps the readers out while it commits.  The tuned profile
+# uses these settings (see tuned_settings below) to let the CGI and the
+# importer share the database:
+#
+# PRAGMA journal_mode = WAL
+#   Readers read from the database file while a writer appends to the
+#   write-ahead log, so readers and one writer do not block each other.
+#   This is stored in the database file; once set, every connection
+#   uses it.  The directory must be writable, for the -wal and -shm files.
+#   Do not use WAL on a network file system.
+#
+# PRAGMA mmap_size, PRAGMA cache_size
+#   read the database through memory mapped I/O, and keep more pages
+#   in the page cache of each connection
+#
+# PRAGMA busy_timeout
+#   when the database is locked, wait this many milliseconds for the lock
+#   instead of failing at once with "database is locked"
+#
+# cgi_read_only
+#   the CGI opens the database with a read-only connection.  The first
+#   statement that is not a query (the CGI makes qids, sets attention,
+#   ...) reopens it for writing.
+#
+# Any of these can also be passed by name, e.g.
+#   PandokiaDB(db_arg, tuned=True, mmap_size=0)
+#   PandokiaDB(db_arg, busy_timeout=60000)
+#
+# The importer can use start_write_batch() to take the write lock once
+# for a batch of records instead of once per record; see "pdk import
+# --batch".  "pdk sqlitebench" shows how these settings change the
+# speed of the readers and the writer.
+#
 # db.text_factory = str
 #   cause all strings to be extracted as str instead of unicode.
 #
@@ -73,6 +112,19 @@ db_driver = 'sqlite'
 #
 
 
+tuned_settings = {
+    'journal_mode': 'WAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # negative is KB instead of pages
+    'cache_size': -64 * 1024,
+    'busy_timeout': 30000,
+    'cgi_read_only': True,
+}
+
+# statements that a read-only connection can do
+read_only_statements = ('SELECT', 'EXPLAIN', 'PRAGMA')
+
+
 class PandokiaDB(pandokia.db.where_dict_base):
 
     IntegrityError = db_module.IntegrityError
@@ -85,7 +137,10 @@ class PandokiaDB(pandokia.db.where_dict_base):
 
     db = None
 
-    def __init__(self, access_arg):
+    # true while self.db is a read-only connection
+    read_only = False
+
+    def __init__(self, access_arg, tuned=False, **settings):
         if isinstance(access_arg, dict):
             access_arg['database'] = os.path.abspath(access_arg['database'])
         else:
@@ -93,9 +148,27 @@ class PandokiaDB(pandokia.db.where_dict_base):
 
         self.db_access_arg = access_arg
 
-    def open(self):
+        # the PRAGMA settings and cgi_read_only; see tuned_settings
+        self.settings = {}
+        if tuned:
+            self.settings.update(tuned_settings)
+        self.settings.update(settings)
+        if 'busy_timeout' in self.settings and 'timeout' not in access_arg:
+            # python's own wait for a locked database, in seconds
+            access_arg['timeout'] = self.settings['busy_timeout'] / 1000.0
+
+    def open(self, read_only=None):
         if self.db is None:
-            self.db = db_module.connect(**self.db_access_arg)
+            if read_only is None:
+                read_only = self.settings.get('cgi_read_only') and \
+                    ('QUERY_STRING' in os.environ or 'GATEWAY_INTERFACE' in os.environ)
+
+            if read_only:
+                self.db = self._connect_read_only()
+            self.read_only = self.db is not None
+            if self.db is None:
+                self.db = db_module.connect(**self.db_access_arg)
+
             self.db.execute("PRAGMA synchronous = NORMAL;")
             self.db.text_factory = str
 
@@ -103,6 +176,16 @@ class PandokiaDB(pandokia.db.where_dict_base):
             # indexes.  With non-case-sensitive like, any LIKE clause
             # turns into a linear search of the table.
             self.db.execute("PRAGMA case_sensitive_like = true;")
+
+            st = self.settings
+            if 'busy_timeout' in st:
+                self.db.execute("PRAGMA busy_timeout = %d" % int(st['busy_timeout']))
+            if 'journal_mode' in st and not self.read_only:
+                self.db.execute("PRAGMA journal_mode = %s" % st['journal_mode']).fetchall()
+            if 'mmap_size' in st:
+                self.db.execute("PRAGMA mmap_size = %d" % int(st['mmap_size'])).fetchall()
+            if 'cache_size' in st:
+                self.db.execute("PRAGMA cache_size = %d" % int(st['cache_size']))
             return
 
         # other database drivers may test for a timed-out connection here,
@@ -110,11 +193,48 @@ class PandokiaDB(pandokia.db.where_dict_base):
         # timing out of connections
         return
 
+    def _connect_read_only(self):
+        # a read-only connection needs a URI file name (python 3.4 and
+        # later); if we cannot have one, the caller uses a normal one.
+        try:
+            from urllib.request import pathname2url
+        except ImportError:
+            return None
+        args = dict(self.db_access_arg)
+        args['database'] = 'file:%s?mode=ro' % pathname2url(args['database'])
+        args['uri'] = True
+        try:
+            return db_module.connect(**args)
+        except (TypeError, db_module.Error):
+            return None
+
+    def _writable(self):
+        # We have been reading on a read-only connection and now we want
+        # to write.  A read-only connection never has anything to commit,
+        # so just open a new one; the old one goes away when nobody is
+        # using its cursors any more.
+        self.db = None
+        self.open(read_only=False)
+
     def start_transaction(self):
         if self.db is None:
             self.open()
         self.execute("BEGIN TRANSACTION")
 
+    def start_write_batch(self):
+        # Take the write lock now, for a batch of inserts.  Otherwise
+        # the transaction starts as a reader and has to upgrade to a
+        # writer at the first INSERT, which fails at once if another
+        # connection is writing, no matter what the busy timeout is.
+        # (In WAL mode, this is the same as BEGIN EXCLUSIVE: readers
+        # can still read.)
+        if self.db is None or self.read_only:
+            self.db = None
+            self.open(read_only=False)
+        if getattr(self.db, 'in_transaction', False):
+            return
+        self.execute("BEGIN IMMEDIATE")
+
     def commit(self):
         if self.db is None:
             return
@@ -168,15 +288,28 @@ class PandokiaDB(pandokia.db.where_dict_base):
         # for sqlite3, :xxx is already a valid parameter format, so no change
         # is necessary
 
+        if self.read_only:
+            w = pandokia.db.statement_keyword(statement)
+            if w not in read_only_statements:
+                self._writable()
+
         #
         c = self.db.cursor()
+        if self.query_timer is not None:
+            return self.query_timer.execute(c, statement, parameters)
         c.execute(statement, parameters)
 
         return c
 
     # how much disk space is used
     def table_usage(self):
-        return os.path.getsize(self.db_access_arg)
+        return os.path.getsize(self.db_access_arg['database'])
+
+    def has_table(self, name):
+        c = self.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ( 'table', 'view' ) AND name = :1",
+            (name,))
+        return c.fetchone() is not None
 
     # sqlite has no "next" function - it has implicit sequences and lastrowid
     next = None
@@ -0,0 +1,468 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# pdk dbstats - see how the database performs for the queries that
+# pandokia actually makes, and what indexes would help
+#
+# The catalogue below names the statements that the CGI and the pdk
+# commands make most often.  The SQL is imported from the module that
+# executes it, so we time what pandokia really does.  The parameters
+# are filled in from a sample test result in the database.  For each
+# statement, we run it a few times, ask the database for the query
+# plan, and report the time and whether the plan reads a whole table.
+#
+# A query may name the index that it wants: the columns that it compares
+# with "=" and the columns that it sorts or ranges on, in that order.
+# If no existing index starts with those columns, we recommend one; with
+# --create, we make it.  The recommended name is not one that is
+# already in use, and we do not recommend an index on a table that the
+# database does not have.
+#
+# The query plans come from EXPLAIN, which is different in each
+# database engine.  sqlite, MySQL and PostgreSQL are supported.
+#
+
+import sys
+import time
+
+import pandokia
+import pandokia.text_table as text_table
+import pandokia.test_identity
+
+#
+# the query catalogue:
+#   ( name, module, statement, where, parameters, wanted index )
+#
+# The statement is the name of a string in the module.  If it has a %s
+# for a where clause, where is the list of ( column, sample name ) that
+# the module gives to where_dict(); if it has a %s for something else,
+# where is the string to put there; otherwise, where is None.
+# parameters is the list of sample names for :1, :2, ...
+#
+# The wanted index is ( index_name, table, equal_columns, order_columns )
+# or None.
+#
+
+catalogue = [
+
+    ('treewalk_prefixes', 'pandokia.pcgi_treewalk', 'prefixes_sql',
+     [('test_name', 'name_glob'), ('test_run', 'test_run')], [],
+     None),
+
+    ('day_report_runs', 'pandokia.pcgi_day_report', 'runs_sql',
+     [('test_run', 'run_glob')], [],
+     ('distinct_test_run_test_run', 'distinct_test_run', [], ['test_run'])),
+
+    ('day_report_hosts', 'pandokia.pcgi_day_report', 'hosts_sql',
+     [('test_run', 'test_run')], [],
+     ('result_scalar_test_run_only', 'result_scalar', ['test_run'], [])),
+
+    ('day_report_count', 'pandokia.pcgi_day_report', 'count_sql',
+     '', ['test_run', 'project', 'host', 'status', 'context'],
+     ('result_scalar_day_report', 'result_scalar',
+      ['context', 'status', 'host', 'project', 'test_run'], [])),
+
+    ('previous_run', 'pandokia.common', 'previous_run_sql',
+     None, ['run_prefix', 'test_run'],
+     ('distinct_test_run_test_run', 'distinct_test_run', [], ['test_run'])),
+
+    ('summary_qid', 'pandokia.helpers.dbaccess', 'qid_sql',
+     None, ['qid'],
+     ('query_index', 'query', ['qid'], [])),
+
+    ('summary_compare', 'pandokia.pcgi_summary', 'other_status_sql',
+     None, ['test_run', 'project', 'host', 'test_name', 'context'],
+     ('result_scalar_test_identity', 'result_scalar',
+      ['test_run', 'project', 'host', 'test_name', 'context'], [])),
+
+    ('summary_tda', 'pandokia.pcgi_summary', 'tda_sql',
+     None, ['key_id'],
+     ('result_tda_key_id', 'result_tda', ['key_id'], [])),
+
+    ('summary_tra', 'pandokia.pcgi_summary', 'tra_sql',
+     None, ['key_id'],
+     ('result_tra_key_id', 'result_tra', ['key_id'], [])),
+
+    ('detail_log', 'pandokia.pcgi_detail', 'log_sql',
+     None, ['key_id'],
+     ('result_log_index', 'result_log', ['key_id'], [])),
+
+    ('test_history', 'pandokia.pcgi_detail', 'history_sql',
+     None, ['test_name', 'context', 'host', 'project'],
+     ('result_scalar_history', 'result_scalar',
+      ['project', 'host', 'context', 'test_name'], ['test_run'])),
+
+    ('cleaner_recount', 'pandokia.cleaner', 'recount_sql',
+     None, ['test_run'],
+     ('result_scalar_test_run_only', 'result_scalar', ['test_run'], [])),
+
+    ('cleaner_queries', 'pandokia.cleaner', 'expired_qids_sql',
+     None, ['now'],
+     ('query_id_expires', 'query_id', [], ['expires'])),
+
+    ('check_expected_list', 'pandokia.check_expected', 'expected_sql',
+     [('test_run_type', 'test_run_type')], [],
+     ('expected_unique', 'expected', ['test_run_type'], [])),
+
+    ('check_expected_test', 'pandokia.check_expected', 'found_sql',
+     None, ['test_run', 'project', 'host', 'test_name', 'context'],
+     ('result_scalar_test_identity', 'result_scalar',
+      ['test_run', 'project', 'host', 'test_name', 'context'], [])),
+
+]
+
+
+def statement(db, module, name, where, parameters, sample):
+    '''the sql and parameters for a catalogue entry'''
+    __import__(module)
+    sql = getattr(sys.modules[module], name)
+    if where is None:
+        params = []
+    elif isinstance(where, list):
+        where_text, params = db.where_dict(
+            [(col, sample[x]) for col, x in where])
+        sql = sql % where_text
+    else:
+        sql = sql % where
+        params = []
+    if parameters:
+        params = [sample[x] for x in parameters]
+    return sql, params
+
+
+##########
+#
+# sample values for the query parameters, from the newest test run
+# (or the one the user asked for)
+#
+
+def sample_parameters(db, test_run=None):
+    if test_run is None:
+        c = db.execute("SELECT MAX(test_run) FROM distinct_test_run")
+        test_run, = c.fetchone()
+
+    c = db.execute(
+        "SELECT key_id, test_run, project, host, context, test_name, status FROM result_scalar WHERE test_run = :1",
+        (test_run,))
+    x = c.fetchone()
+    if x is None:
+        return None
+    # some databases do not like an unfinished cursor
+    c.fetchall()
+
+    d = {}
+    (d['key_id'], d['test_run'], d['project'], d['host'], d['context'],
+     d['test_name'], d['status']) = x
+
+    d['name_glob'] = d['test_name'][:1] + '*'
+    d['run_glob'] = d['test_run'][:1] + '*'
+    d['run_prefix'] = d['test_run'][:1] + '%'
+    d['now'] = time.time()
+
+    c = db.execute("SELECT MAX(qid) FROM query")
+    d['qid'], = c.fetchone()
+    if d['qid'] is None:
+        d['qid'] = 0
+
+    d['test_run_type'] = None
+    if db.has_table('expected'):
+        c = db.execute("SELECT MAX(test_run_type) FROM expected")
+        d['test_run_type'], = c.fetchone()
+    if d['test_run_type'] is None:
+        d['test_run_type'] = 'daily'
+
+    return d
+
+
+##########
+#
+# query plans
+#
+# plan() returns ( list of lines of text, True if a table is read from
+# beginning to end )
+#
+
+def plan(db, sql, params):
+    driver = db.pandokia_driver_name
+
+    if driver == 'sqlite':
+        c = db.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        lines = [str(x[-1]) for x in c]
+        # "SCAN result_scalar" reads the table, but "SCAN result_scalar
+        # USING INDEX ..." only reads an index.  (Older sqlite says
+        # "SCAN TABLE".)
+        scan = [x for x in lines if x.startswith('SCAN') and 'INDEX' not in x]
+        return lines, len(scan) > 0
+
+    if driver == 'mysqldb':
+        c = db.execute('EXPLAIN ' + sql, params)
+        names = [x[0].lower() for x in c.description]
+        lines = []
+        scan = False
+        for x in c:
+            x = dict(zip(names, x))
+            lines.append('table=%s type=%s key=%s rows=%s %s' %
+                         (x.get('table'), x.get('type'), x.get('key'),
+                          x.get('rows'), x.get('extra') or ''))
+            if x.get('type') == 'ALL':
+                scan = True
+        return lines, scan
+
+    if driver == 'psycopg2':
+        c = db.execute('EXPLAIN ' + sql, params)
+        lines = [x[0] for x in c]
+        scan = [x for x in lines if 'Seq Scan' in x]
+        return lines, len(scan) > 0
+
+    return ['(no query plans for %s)' % driver], None
+
+
+##########
+#
+# existing indexes
+#
+# table_indexes() returns a list of ( index_name, [ column, ... ] )
+#
+
+def table_indexes(db, table):
+    driver = db.pandokia_driver_name
+    l = []
+
+    if driver == 'sqlite':
+        # the INTEGER PRIMARY KEY is the rowid, not an index
+        c = db.execute('PRAGMA table_info(%s)' % table)
+        pk = [x[1] for x in c if x[5]]
+        if pk:
+            l.append(('primary key', pk))
+        c = db.execute('PRAGMA index_list(%s)' % table)
+        for name in [x[1] for x in c]:
+            c = db.execute('PRAGMA index_info(%s)' % name)
+            l.append((name, [x[2] for x in c]))
+
+    elif driver == 'mysqldb':
+        c = db.execute('SHOW INDEX FROM %s' % table)
+        names = [x[0].lower() for x in c.description]
+        d = {}
+        for x in c:
+            x = dict(zip(names, x))
+            d.setdefault(x['key_name'], []).append(
+                (x['seq_in_index'], x['column_name']))
+        for name in d:
+            l.append((name, [col for seq, col in sorted(d[name])]))
+
+    elif driver == 'psycopg2':
+        c = db.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :1",
+            (table,))
+        for name, indexdef in c:
+            cols = indexdef[indexdef.rindex('(') + 1: indexdef.rindex(')')]
+            l.append((name, [x.strip() for x in cols.split(',')]))
+
+    return l
+
+
+def index_names(db, table):
+    # the names that a new index on table cannot have.  In sqlite and
+    # PostgreSQL, an index has a name that no other table or index in
+    # the database has; in MySQL, the name only has to be unique in the
+    # table.
+    driver = db.pandokia_driver_name
+    if driver == 'sqlite':
+        c = db.execute("SELECT name FROM sqlite_master")
+    elif driver == 'psycopg2':
+        c = db.execute("SELECT relname FROM pg_class")
+    else:
+        return set([x for x, columns in table_indexes(db, table)])
+    return set([x for x, in c])
+
+
+def index_serves(columns, equal_columns, order_columns):
+    # An index serves the query if it starts with the "=" columns, in
+    # any order, followed by the order columns.
+    n = len(equal_columns)
+    if len(columns) < n + len(order_columns):
+        return False
+    if set(columns[:n]) != set(equal_columns):
+        return False
+    return columns[n:n + len(order_columns)] == list(order_columns)
+
+
+##########
+#
+# main
+#
+
+def measure(db, sql, params, repeat):
+    best = None
+    rows = 0
+    for x in range(repeat):
+        start = time.time()
+        c = db.execute(sql, params)
+        rows = len(c.fetchall())
+        t = time.time() - start
+        if best is None or t < best:
+            best = t
+    return best, rows
+
+
+helpstr = '''
+pdk dbstats [ --test_run name ] [ --repeat n ] [ --plans ] [ --create ]
+
+Run the queries that pandokia makes most often against the database,
+report how long each one takes and whether the database reads a whole
+table to answer it, and list the indexes that would help.
+
+--test_run name
+    take the sample values for the queries from this test run; the
+    default is the newest test run
+
+--repeat n
+    run each query n times and report the fastest (default 3)
+
+--plans
+    show the query plan of each query
+
+--create
+    create the recommended indexes
+'''
+
+
+def run(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='pdk dbstats',
+        description='report query times and recommend indexes')
+    parser.add_argument('--test_run', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--plans', action='store_true')
+    parser.add_argument('--create', action='store_true')
+    if '-h' in args or '--help' in args:
+        print(helpstr)
+        return 0
+    args = parser.parse_args(args)
+
+    db = pandokia.cfg.pdk_db
+
+    if args.test_run is not None:
+        import pandokia.common as common
+        args.test_run = common.find_test_run(args.test_run)
+
+    params = sample_parameters(db, args.test_run)
+    if params is None:
+        print("no test results to take sample values from")
+        return 1
+
+    print("database: %s" % db.pandokia_driver_name)
+    try:
+        print("size: %s" % db.table_usage())
+    except Exception as e:
+        print("size: unknown (%s)" % e)
+    print("sample: test_run=%s project=%s host=%s context=%s test_name=%s" %
+          (params['test_run'], params['project'], params['host'],
+           params['context'], params['test_name']))
+    print("")
+
+    # In the normalized schema, result_scalar is a view; its indexes
+    # are on the tables in pandokia/test_identity.py
+    views = set()
+    if pandokia.test_identity.normalized(db):
+        views.add('result_scalar')
+
+    indexes = {}
+    recommend = []
+
+    t = text_table.text_table()
+    t.define_column('query')
+    t.define_column('from')
+    t.define_column('ms')
+    t.define_column('rows')
+    t.define_column('scan')
+    t.define_column('index')
+
+    plans = []
+
+    for row, (name, module, attr, where, parameters, want) in \
+            enumerate(catalogue):
+        t.set_value(row, 'query', name)
+        t.set_value(row, 'from', module.split('.')[-1])
+
+        # an old database may not have every table
+        if want is not None and not db.has_table(want[1]):
+            t.set_value(row, 'index', '(no table)')
+            continue
+
+        sql, p = statement(db, module, attr, where, parameters, params)
+        elapsed, rows = measure(db, sql, p, args.repeat)
+        lines, scan = plan(db, sql, p)
+        plans.append((name, sql, lines))
+
+        t.set_value(row, 'ms', '%.2f' % (elapsed * 1000))
+        t.set_value(row, 'rows', rows)
+        if scan:
+            t.set_value(row, 'scan', 'FULL')
+        elif scan is None:
+            t.set_value(row, 'scan', '?')
+
+        if want is None:
+            continue
+
+        index_name, table, equal_columns, order_columns = want
+        if table in views:
+            t.set_value(row, 'index', '(view)')
+            continue
+
+        if table not in indexes:
+            indexes[table] = table_indexes(db, table)
+        have = [x for x, columns in indexes[table]
+                if index_serves(columns, equal_columns, order_columns)]
+        if have:
+            t.set_value(row, 'index', have[0])
+        else:
+            t.set_value(row, 'index', 'MISSING')
+            r = (index_name, table, tuple(equal_columns + order_columns))
+            if r not in recommend:
+                recommend.append(r)
+
+    # the names the recommended indexes will have
+    used = set()
+    for n, (index_name, table, columns) in enumerate(recommend):
+        taken = index_names(db, table) | used
+        name = index_name
+        count = 2
+        while name in taken:
+            name = '%s_%d' % (index_name, count)
+            count += 1
+        used.add(name)
+        recommend[n] = (name, table, columns)
+
+    sys.stdout.write(t.get_rst(headings=1))
+
+    if args.plans:
+        for name, sql, lines in plans:
+            print("")
+            print("%s:" % name)
+            print("    %s" % sql)
+            for x in lines:
+                print("        %s" % x)
+
+    print("")
+    if not recommend:
+        print("no missing indexes")
+        return 0
+
+    print("recommended indexes:")
+    for index_name, table, columns in recommend:
+        s = "CREATE INDEX %s ON %s ( %s )" % (
+            index_name, table, ', '.join(columns))
+        print("    %s ;" % s)
+        if args.create:
+            start = time.time()
+            db.execute(s)
+            db.commit()
+            print("        created in %.1f seconds" % (time.time() - start))
+
+    return 0
@@ -95,6 +95,13 @@ if 0:
 
     pdk_db = dbd.PandokiaDB(db_arg)
 
+    # With read replicas (hot standby servers), the report pages in the
+    # CGI read from one of them; see replica_lag below.
+    #   pdk_db = dbd.PandokiaDB(db_arg, replicas=[
+    #       {'database': 'pandokia', 'host': 'replica1'},
+    #       {'database': 'pandokia', 'host': 'replica2'},
+    #   ])
+
 
 # Database: MySQL
 if 0:
@@ -113,6 +120,10 @@ if 0:
     # This does not actually open the database unless you try to talk to it
     pdk_db = dbd.PandokiaDB(db_arg)
 
+    # With read replicas, the report pages in the CGI read from one of
+    # them; each replica is a dict like db_arg.  See replica_lag below.
+    #   pdk_db = dbd.PandokiaDB(db_arg, replicas=[replica1_arg, replica2_arg])
+
 
 ######
 # Who are authorized users:
@@ -185,6 +196,24 @@ runner_glob = [
 
 debug = True
 
+#
+# query timing:  set query_timing = True to time every database statement.
+# If debug is also on, the CGI shows the times at the bottom of each page.
+# If query_log is the name of a file, the times are also appended to that
+# file as one line of JSON for each CGI request or pdk command; "pdk
+# querylog" reports on them.  When the file is bigger than
+# query_log_max_bytes, it is renamed to query_log + '.1' and a new one
+# is started.  The file must be writable by the CGI.
+query_timing = False
+query_log = None
+query_log_max_bytes = 10 * 1024 * 1024
+
+#
+# replica_lag: with read replicas, a report page about a qid that was
+# made or changed less than this many seconds ago reads from the
+# primary, in case the change has not reached the replica yet.
+replica_lag = 60
+
 #
 # set server_maintenance to a string to cause the cgi to issue a
 # "server maintenance" page in response to any transaction.
@@ -238,6 +267,15 @@ default_user_email_preferences = [
 # how many days old must a qid be to expire
 default_qid_expire_days = 30
 
+# the summary page shows this many tests at a time; 0 shows them all on
+# one page.  The csv, rst and tab formats always have all of them.
+summary_page_size = 1000
+
+# the history column on the summary page shows the status of each test
+# in this many of the latest runs of a recurring test run (see
+# recurring_prefix); 0 to leave it out
+summary_history_runs = 10
+
 
 #####
 #
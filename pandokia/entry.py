@@ -19,13 +19,25 @@ pdk clean [ max_records records_per_step sleep_between_steps ]
 pdk clean_queries
     delete old qids
 
+pdk dbstats [ --plans ] [ --create ]
+    time the queries that pandokia makes most often, show which read
+    a whole table, and recommend (or create) indexes that would help
+
 pdk delete -test_run xx -project xx -context xx -host xx -status xx
         -n -wild -count
     delete records from the database
 
+pdk envcheck [ -c context ] [ directories ]
+    resolve the environment for every directory in the tree and
+    report how long it took
+
 pdk export test_run_pattern [ -h host ] [ -p project ] [ -c context ]
     export records from the database in pandokia import format
 
+pdk filecompbench [ --size MB ] [ --skip-old ]
+    time the text and binary file comparisons on large files, and
+    the way they used to work
+
 pdk gen_expected test_run_type test_run
     declares that all the tests seen in the named test_run are expected
     in runs of type test_run_type
@@ -35,8 +47,9 @@ pdk email
 pdk getenv
     get environment that would be used
 
-pdk import files
-    import pdk result files into the database
+pdk import [ --batch n ] files
+    import pdk result files into the database; --batch n inserts n
+    records per transaction
 
 pdk import_contact < contact_file
     purges the projects listed in contact_file from the contact table,
@@ -44,17 +57,37 @@ pdk import_contact < contact_file
     table to generate the matching patterns, so you may need to
     'pdk gen_expected' first.
 
+pdk ingestd [ --socket name ]
+    run a daemon that inserts test results into the database as they
+    arrive from test runners that have PDK_INGEST set to the socket name
+
+pdk migrate_identity [ --drop ]
+    convert the database to the normalized result table, where each
+    test run and test identity is stored once
+
 pdk ok [ okfiles ]
     Tests that use reference files can leave behind 'okfiles' when
     they run.  The okfile contains the information necessary to copy the
     output files to the reference files.  This command performs that copy.
 
+pdk querylog [ --sort total|max|calls|rows|avg ] [ files ]
+    report the statements that took the most time in the query log
+    (see query_timing in the config)
+
 pdk run
     run tests; use 'pdk run --help' for more detail
 
 pdk runstatus
     show status of actively running tests
 
+pdk sqlitebench [ --readers n ] [ --seconds n ]
+    measure how the importer and the CGI share a sqlite database,
+    with and without the tuned sqlite settings
+
+pdk treeindex test_run [ test_run ... ]
+    build the index of test names that the treewalk uses, for test
+    runs that were imported before the database had one
+
 pdk webserver
     start up a development web server.  The root of the server is the
     current directory.  It serves pages on port localhost:7070.
@@ -89,6 +122,11 @@ def run(argv=sys.argv):
     cmd = argv[1]
     args = argv[2:]
 
+    # time the database statements of this command, if the config
+    # asks for it
+    import pandokia.querylog
+    pandokia.querylog.enable_from_config()
+
     # each entry here follows the general form of:
     #   if cmd == 'whatever' :
     #       execute_command
@@ -129,6 +167,10 @@ def run(argv=sys.argv):
         print(f)
         return 0
 
+    if cmd == 'dbstats':
+        import pandokia.dbstats
+        return pandokia.dbstats.run(args)
+
     if cmd == 'delete':
         import pandokia.cleaner
         return pandokia.cleaner.delete(args)
@@ -141,10 +183,18 @@ def run(argv=sys.argv):
         import pandokia.contact_notify_select
         return pandokia.contact_notify_select.run(args)
 
+    if cmd == 'envcheck':
+        import pandokia.run as x
+        return x.envcheck(args)
+
     if cmd == 'export':
         import pandokia.export
         return pandokia.export.run(args)
 
+    if cmd == 'filecompbench':
+        import pandokia.filecomp_bench
+        return pandokia.filecomp_bench.run(args)
+
     if cmd == 'gen_contact':
         import pandokia.gen_contact as x
         return x.run(args)
@@ -173,10 +223,22 @@ def run(argv=sys.argv):
         import pandokia.import_contact as x
         return x.run()
 
+    if cmd == 'ingestd':
+        import pandokia.ingestd as x
+        return x.run(args)
+
+    if cmd == 'migrate_identity':
+        import pandokia.test_identity
+        return pandokia.test_identity.run(args)
+
     if cmd == 'ok' or cmd == 'okify':
         import pandokia.ok
         return pandokia.ok.run(args)
 
+    if cmd == 'querylog':
+        import pandokia.querylog
+        return pandokia.querylog.run(args)
+
     if cmd == 'run':
         import pandokia.run as x
         (err, lstat) = x.run(args)
@@ -190,6 +252,10 @@ def run(argv=sys.argv):
         import pandokia.db
         return pandokia.db.sql_files(args)
 
+    if cmd == 'sqlitebench':
+        import pandokia.sqlite_bench
+        return pandokia.sqlite_bench.run(args)
+
     if cmd == 'runstatus':
         import pandokia.run_status as x
         err = x.display_interactive(args)
@@ -201,6 +267,10 @@ def run(argv=sys.argv):
         print(os.path.dirname(pandokia.__file__))
         return 0
 
+    if cmd == 'treeindex':
+        import pandokia.test_name_tree
+        return pandokia.test_name_tree.run(args)
+
     if cmd == 'webserver':
         import pandokia.webserver
         return pandokia.webserver.run(args)
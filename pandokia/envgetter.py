@@ -20,6 +20,12 @@ x.export('/some/fully/specified/directory',format='tca',fh=fh, full=False)
 Export the environment as a pdk_environment file:
 x.export('/some/fully/specified/directory',format='env',fh=fh, full=False)
 
+Parsed pdk_environment files are cached by file name and checked
+against the file modification time, so each file is only parsed once.
+If PDK_ENVCACHE names a file, the cache is loaded from there when an
+EnvGetter is created and x.save_cache() writes it back, so later
+invocations of pdkrun do not parse the files again either.
+
 If either .envdir or .populate have been called, you can also:
 
 Obtain the location of the top of the tree:
@@ -32,6 +38,7 @@ go all the way to the top of the file system.
 import os
 import sys
 import re
+import json
 import warnings
 
 try:
@@ -166,6 +173,9 @@ class DirLevel(object):
             return
 
         else:
+            if self.parent is None:
+                # the parent may already be known from a sibling directory
+                self.parent = self.container.nodes.get(parent)
             if self.parent is None:
                 self.parent = DirLevel(parent, container=self.container)
                 self.container.nodes[parent] = self.parent
@@ -180,14 +190,14 @@ class DirLevel(object):
         special case of keys in the default dict that end with PATH (case-
         INsensitive), for which internal substitution will be applied."""
 
-        self.final = dict(self.container.defdict,
-                          **self.leveldict)
+        self.final = dict(self.container.defdict)
+        self.final.update(self.leveldict)
 
         # Apply special path handling
         for key, val in list(self.leveldict.items()):
             try:
-                if re.match(pat['pathkey'], key) and ':' in val:
-                    m = re.search(pat['pathval'], self.final[key])
+                if pat['pathkey'].match(key) and ':' in val:
+                    m = pat['pathval'].search(self.final[key])
                     if m:
                         newval = val.replace(m.group(1),
                                              self.container.defdict[key])
@@ -201,9 +211,10 @@ class DirLevel(object):
         apply the substitutions from all the values. This produces the final
         dictionary that can be supplied as the environment of a process."""
 
+        envpat = pat['envpat']
         for key, val in list(self.final.items()):
             try:
-                for sub in re.findall(pat['envpat'], val):
+                for sub in envpat.findall(val):
                     self.final[key] = val.replace("$%s" % sub, self.final[sub])
             except TypeError:
                 pass  # ok to skip non-string values
@@ -303,6 +314,11 @@ class EnvGetter(object):
         self.nodes = dict()  # dictionary of DirLevel objects
         self.context = context  # contexts modify default environment
 
+        # persistent cache of parsed pdk_environment files
+        self.cache_file = os.environ.get('PDK_ENVCACHE', None)
+        if self.cache_file is not None:
+            load_cache(self.cache_file)
+
         # Platform info
         self.platform = PlatformType()
 
@@ -316,9 +332,8 @@ class EnvGetter(object):
         if dirname in self.nodes:
             return
         else:
+            # DirLevel merges and substitutes as it is created
             self.nodes[dirname] = DirLevel(dirname, container=self)
-            self.nodes[dirname].merge()
-            self.nodes[dirname].substitute()
 
     def envdir(self, dirname):
         """User interface to obtain a dictionary containing a
@@ -354,28 +369,107 @@ class EnvGetter(object):
         # delegate:
         self.nodes[dirname].export(format=format, fh=fh, full=full)
 
+    def save_cache(self):
+        """Write the parsed-file cache to PDK_ENVCACHE, if it is set."""
+        if self.cache_file is not None:
+            save_cache(self.cache_file)
+
+
+# Cache of parsed pdk_environment files.
+#
+# key is the file name; value is [ mtime, size, sections ], where
+# sections is a dict of { section_name : { key : value } }.  A file
+# that does not exist is cached with mtime None.
+#
+# The cache holds every section of the file, so one entry serves any
+# context and any platform.
+file_cache = {}
+
+# set when file_cache has something that is not in the cache file yet
+file_cache_dirty = False
+
+# counters, for "pdk envcheck"
+parse_count = 0
+cache_hit_count = 0
+
+
+def load_cache(fname):
+    global file_cache
+    try:
+        f = open(fname, 'r')
+    except IOError:
+        return
+    try:
+        d = json.load(f)
+    except ValueError:
+        # a damaged cache is just an empty cache
+        d = {}
+    f.close()
+    for k in d:
+        if k not in file_cache:
+            file_cache[k] = d[k]
+
+
+def save_cache(fname):
+    global file_cache_dirty
+    if not file_cache_dirty:
+        return
+    # Several pdkrun processes may be saving at the same time.  Write a
+    # private temp file and rename it, so a reader never sees half a file.
+    tmp = '%s.%d.tmp' % (fname, os.getpid())
+    f = open(tmp, 'w')
+    json.dump(file_cache, f)
+    f.close()
+    os.rename(tmp, fname)
+    file_cache_dirty = False
+
+
+def read_sections(fname):
+    """Return the sections of a pdk_environment file as a dict of dicts,
+    parsing the file only if it is not already in the cache or has
+    changed since it was cached."""
+    global parse_count, cache_hit_count, file_cache_dirty
+
+    try:
+        st = os.stat(fname)
+        mtime = st.st_mtime
+        size = st.st_size
+    except OSError:
+        mtime = None
+        size = None
+
+    c = file_cache.get(fname)
+    if c is not None and c[0] == mtime and c[1] == size:
+        cache_hit_count += 1
+        return c[2]
+
+    sections = {}
+    if mtime is not None:
+        parse_count += 1
+        cfg = configparser.SafeConfigParser()
+        cfg.optionxform = str  # retain case sensitivity!!
+        cfg.read(fname)
+        for section in cfg.sections():
+            try:
+                sections[section] = dict(cfg.items(section))
+            except configparser.Error as e:
+                warnings.warn("%s: section %s: %s" % (fname, section, e))
+
+    file_cache[fname] = [mtime, size, sections]
+    file_cache_dirty = True
+    return sections
+
 
 def parsefile(fname, platform=''):
-    """Helper function: Make a configparser, parse the file,
+    """Helper function: Parse the file (or find it in the cache),
     return the dictionary."""
-    cfg = configparser.SafeConfigParser()
-    cfg.optionxform = str  # retain case sensitivity!!
-    cfg.read(fname)
-    ans = {}
+    sections = read_sections(fname)
     # Process defaults
-    try:
-        for key, val in cfg.items('default'):
-            ans[key] = val
-    except configparser.NoSectionError:
-        pass  # ok to have no defaults
+    ans = dict(sections.get('default', {}))
     # Apply any platform-specific overrides
-
-    for section in platform:
-        try:
-            for key, val in cfg.items(section):
-                ans[key] = val
-        except configparser.NoSectionError:
-            pass  # defaults are OK
-        except TypeError:
-            pass  # we didn't get a platform
+    try:
+        for section in platform:
+            ans.update(sections.get(section, {}))
+    except TypeError:
+        pass  # we didn't get a platform
     return ans
@@ -129,6 +129,9 @@ def run(args):
 
     output = sys.stdout
 
+    # export only reads, so it can read from a replica
+    pdk_db.use_replica()
+
     for x, y in options:
         if x == '-c':
             query_dict['context'] = y
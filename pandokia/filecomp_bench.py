@@ -0,0 +1,238 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# pdk filecompbench - how fast are the file comparisons in
+# pandokia.helpers.filecomp on big outputs, and how much memory do they
+# need?
+#
+# We make a pair of text files and a pair of binary files of --size MB
+# each, the same except near the end, and time each comparison in a
+# child process so we can also report the most memory it used.  The
+# "old" cases are the way cmp_text and cmp_binary used to work (read
+# all the lines of both files into memory and run the ignore patterns
+# on every line; read 64 KB blocks), for comparison.  For a multi-GB
+# size, you may want --skip-old, because the old cmp_text needs memory
+# for both files.
+#
+# The first case that reads a file brings it into the page cache, so
+# the cases after it measure the comparison and not the disk.  Run it
+# twice if the first case looks slow.
+#
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+import pandokia.text_table as text_table
+import pandokia.helpers.filecomp as filecomp
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# one block of text; the files are this over and over
+text_block = ''.join([
+    'Mon Jan 02 12:%02d:%02d EST 2017 step %4d  value %12.6f  flux %12.6e\n' %
+    (n % 60, n % 60, n, n * 0.25, n * 1.5e-3)
+    for n in range(1000)])
+
+
+def make_files(dir, size):
+    # size is in bytes; returns the names of the four files
+    names = [os.path.join(dir, x)
+             for x in ('test.txt', 'ref.txt', 'test.bin', 'ref.bin')]
+
+    block = text_block.encode('ascii')
+    n = max(1, size // len(block))
+    for fname in names[:2]:
+        f = open(fname, 'wb')
+        for i in range(n):
+            f.write(block)
+        f.close()
+
+    # the last line of the test file is different
+    f = open(names[0], 'ab')
+    f.write(b'this line is only in the test file\n')
+    f.close()
+    f = open(names[1], 'ab')
+    f.write(b'this line is only in the reference file\n')
+    f.close()
+
+    block = os.urandom(1024 * 1024)
+    n = max(1, size // len(block))
+    for fname in names[2:]:
+        f = open(fname, 'wb')
+        for i in range(n):
+            f.write(block)
+        f.close()
+
+    # the last byte of the test file is different
+    f = open(names[2], 'r+b')
+    f.seek(-1, 2)
+    c = f.read(1)
+    f.seek(-1, 2)
+    f.write(b'\0' if c != b'\0' else b'\1')
+    f.close()
+
+    return names
+
+
+##########
+#
+# the way the comparisons used to work
+#
+
+def old_cmp_text(the_file, reference_file, ignore_date=False):
+    ignorep = None
+    if ignore_date:
+        if filecomp.cmp_text_timestamp is None:
+            filecomp.cmp_text_assemble_timestamp()
+        ignorep = re.compile(filecomp.cmp_text_timestamp)
+    test = open(the_file).readlines()
+    ref = open(reference_file).readlines()
+    if len(test) != len(ref):
+        return False
+    diffs = []
+    for i in range(len(ref)):
+        if ignorep is not None:
+            tline = ignorep.sub(' IGNORE ', test[i])
+            rline = ignorep.sub(' IGNORE ', ref[i])
+        else:
+            tline = test[i]
+            rline = ref[i]
+        if tline != rline:
+            diffs.append((tline, rline))
+    return len(diffs) == 0
+
+
+def old_cmp_binary(res, ref):
+    f1 = open(res, 'rb')
+    f2 = open(ref, 'rb')
+    while True:
+        d1 = f1.read(65536)
+        d2 = f2.read(65536)
+        if not d1 and not d2:
+            return True
+        if d1 != d2:
+            return False
+
+
+##########
+#
+# the cases
+#
+
+def cases(names, skip_old):
+    test_txt, ref_txt, test_bin, ref_bin = names
+    l = []
+    if not skip_old:
+        l += [
+            ('old cmp_text', old_cmp_text, (test_txt, ref_txt), {}),
+            ('old cmp_text ignore_date', old_cmp_text, (test_txt, ref_txt),
+             {'ignore_date': True}),
+        ]
+    l += [
+        ('cmp_text', filecomp.cmp_text, (test_txt, ref_txt), {}),
+        ('cmp_text quiet', filecomp.cmp_text, (test_txt, ref_txt),
+         {'quiet': True}),
+        ('cmp_text ignore_date', filecomp.cmp_text, (test_txt, ref_txt),
+         {'ignore_date': True}),
+    ]
+    if not skip_old:
+        l += [
+            ('old cmp_binary', old_cmp_binary, (test_bin, ref_bin), {}),
+        ]
+    l += [
+        ('cmp_binary', filecomp.cmp_binary, (test_bin, ref_bin), {}),
+    ]
+    return l
+
+
+def maxrss_mb():
+    if resource is None:
+        return None
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on mac, KB everywhere else
+        return r / (1024.0 * 1024.0)
+    return r / 1024.0
+
+
+def run_case(fn, args, kwargs, result):
+    # the comparisons print a report; we only want the time
+    sys.stdout = open(os.devnull, 'w')
+    t = time.time()
+    same = fn(*args, **kwargs)
+    t = time.time() - t
+    result.put((t, same, maxrss_mb()))
+
+
+helpstr = '''
+pdk filecompbench [ --size MB ] [ --dir directory ] [ --skip-old ]
+
+Time the text and binary file comparisons in pandokia.helpers.filecomp
+on files of --size MB (default 256), and the way they used to work.
+The files are made in a temporary directory under --dir (default: the
+current directory), which must have room for 4 of them.
+'''
+
+
+def run(args):
+    import argparse
+
+    if '-h' in args or '--help' in args:
+        print(helpstr)
+        return 0
+
+    parser = argparse.ArgumentParser(prog='pdk filecompbench')
+    parser.add_argument('--size', type=float, default=256)
+    parser.add_argument('--dir', default='.')
+    parser.add_argument('--skip-old', action='store_true')
+    args = parser.parse_args(args)
+
+    dir = tempfile.mkdtemp(prefix='pdk_filecompbench_', dir=args.dir)
+
+    t = text_table.text_table()
+    columns = ('comparison', 'seconds', 'MB/s', 'max MB', 'same')
+    for x in columns:
+        t.define_column(x)
+
+    try:
+        print("making files...")
+        sys.stdout.flush()
+        names = make_files(dir, int(args.size * 1024 * 1024))
+        size_mb = os.path.getsize(names[0]) / (1024.0 * 1024.0)
+
+        row = 0
+        for name, fn, fargs, kwargs in cases(names, args.skip_old):
+            print("%s..." % name)
+            sys.stdout.flush()
+            result = multiprocessing.Queue()
+            p = multiprocessing.Process(target=run_case,
+                                        args=(fn, fargs, kwargs, result))
+            p.start()
+            secs, same, rss = result.get()
+            p.join()
+
+            t.set_value(row, 'comparison', name)
+            t.set_value(row, 'seconds', '%.2f' % secs)
+            t.set_value(row, 'MB/s', '%.0f' % (size_mb / max(secs, 1e-6)))
+            if rss is not None:
+                t.set_value(row, 'max MB', '%.0f' % rss)
+            t.set_value(row, 'same', str(same))
+            row += 1
+    finally:
+        shutil.rmtree(dir)
+
+    print("")
+    print("files of %.0f MB" % size_mb)
+    sys.stdout.write(t.get_rst(headings=1))
+    return 0
@@ -5,6 +5,7 @@
 
 import cgi
 import pandokia
+import pandokia.test_identity
 import os.path
 
 import pandokia
@@ -85,7 +86,8 @@ def flagok(key_id, trans_id):
          flagfile))
 
     pdk_db.execute(
-        "update result_scalar set attn = 'N' where key_id = :1 ", (key_id,))
+        "update %s set attn = 'N' where key_id = :1 " %
+        pandokia.test_identity.result_table(pdk_db), (key_id,))
 
     pdk_db.execute(
         "INSERT INTO ok_items (key_id, trans_id, status) values (:1, :2, :3)",
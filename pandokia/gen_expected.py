@@ -63,35 +63,61 @@ def run(args):
         print("?")
         sys.stdin.readline()
 
-    where_str, where_dict = pdk_db.where_dict(l)
-
-    sql = "select distinct project, host, context, test_name from result_scalar %s " % where_str
-    c = pdk_db.execute(sql, where_dict)
-
-    for (project, host, context, test_name) in c:
-        if test_name.endswith("nose.failure.Failure.runTest"):
-            # Sometimes nose generates this test name.  I don't want it in the database at all, because
-            # the name is not unique, and the record does not contain any useful information about the problem.
-            # In any case, we never want to list this test as "expected", even
-            # if it leaks into the database.
-            continue
+    # Sometimes nose generates a test named nose.failure.Failure.runTest.
+    # I don't want it in the database at all, because the name is not
+    # unique, and the record does not contain any useful information
+    # about the problem.  In any case, we never want to list this test
+    # as "expected", even if it leaks into the database.
+    not_nose = "test_name NOT LIKE :nose_failure"
+    nose_failure = '%nose.failure.Failure.runTest'
+
+    where_str, where_dict = pdk_db.where_dict(l, not_nose)
+    where_dict['nose_failure'] = nose_failure
+
+    # We do one project at a time, each in its own transaction, so we
+    # do not hold the database for the whole test run.
+    c = pdk_db.execute(
+        "SELECT DISTINCT project FROM result_scalar %s" % where_str,
+        where_dict)
+    projects = [x[0] for x in c]
+
+    # A test that is already expected.  NULL is not equal to anything,
+    # not even another NULL, so a test with no host or context has to
+    # be matched with IS NULL or we would add it again every time.
+    same = ' AND '.join([
+        '( expected.%s = t.%s OR ( expected.%s IS NULL AND t.%s IS NULL ) )' %
+        (x, x, x, x) for x in ('project', 'host', 'context', 'test_name')])
+
+    total = 0
+    for project in projects:
+        if project is None:
+            this_project = 'project IS NULL'
+        else:
+            this_project = 'project = :project'
+        where_str, where_dict = pdk_db.where_dict(
+            l, '%s AND %s' % (not_nose, this_project))
+        where_dict['nose_failure'] = nose_failure
+        where_dict['project'] = project
+        where_dict['test_run_type'] = test_run_type
 
         if debug:
-            print(
-                "expect %s %s %s %s %s" %
-                (test_run_type, project, host, context, test_name))
-        # insert to the expected table; if the record is already there, it's
-        # ok.
-        try:
-            pdk_db.execute(
-                'insert into expected ( test_run_type, project, host, context, test_name ) values ( :1, :2, :3, :4, :5 )',
-                (test_run_type,
-                 project,
-                 host,
-                 context,
-                 test_name))
-        except pdk_db.IntegrityError as e:
-            if debug:
-                print("exception %s" % e)
-            pass
-    pdk_db.commit()
+            print("expect %s %s" % (test_run_type, project))
+
+        # Insert all the tests of this project that are not already in
+        # the expected table, in one statement.
+        pdk_db.start_write_batch()
+        c = pdk_db.execute(
+            """INSERT INTO expected
+                ( test_run_type, project, host, context, test_name )
+            SELECT :test_run_type, project, host, context, test_name
+            FROM ( SELECT DISTINCT project, host, context, test_name
+                FROM result_scalar %s ) AS t
+            WHERE NOT EXISTS ( SELECT 1 FROM expected
+                WHERE expected.test_run_type = :test_run_type
+                AND %s )""" % (where_str, same),
+            where_dict)
+        pdk_db.commit()
+        if c.rowcount > 0:
+            total += c.rowcount
+
+    print("%d tests added to expected for %s" % (total, test_run_type))
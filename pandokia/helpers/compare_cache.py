@@ -0,0 +1,245 @@
+'''
+pandokia.helpers.compare_cache - remember which output files already
+    compared the same as their reference files
+
+Most of the time, an output file is byte-for-byte the same as its
+reference file.  filecomp.check_file asks this module first; if the
+content of the output is the same as the content of the reference,
+or if the same comparison of the same two contents passed before,
+there is no need to run the comparator.
+
+The cache is a sqlite file named by PDK_COMPARECACHE.  A name that is
+not absolute is in the top of the test tree (PDK_TOP), so there is one
+cache per tree.  If PDK_COMPARECACHE is not set, there is no cache.
+
+There are two tables:
+
+    refhash remembers the hash of each reference file, with its size,
+    mtime, and inode.  If none of those changed, we do not read the
+    reference file again, which matters when the reference tree is on
+    NFS.
+
+    verdict remembers each comparison that passed, keyed on the hash
+    of the output, the hash of the reference, the comparator, and its
+    args, with the tra attributes that the comparator wrote.  When we
+    know the comparison passes, the caller puts the same attributes in
+    its tra, so they do not depend on whether the comparator ran.  We
+    do not remember failures; the comparator has to run again anyway
+    to show what is different.
+
+Both tables keep the most recently used max_entries rows and forget
+the rest.  Any problem with the cache (a locked database, a damaged
+file) just means we run the comparator, the same as with no cache.
+
+contents of this module:
+
+    open_cache()
+        return a cache object for PDK_COMPARECACHE, or None
+
+    cache.lookup( output, reference, comparator, args )
+        return ( key, same, tra ); same is True if we know the files
+        compare the same, and tra is what the comparator wrote in the
+        tra then, if we know.  Pass key to remember() if the comparator
+        passes.
+
+    cache.remember( key, tra )
+
+    cache.close()
+
+'''
+
+import os
+import json
+import time
+import random
+import hashlib
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# how many rows each table keeps
+max_entries = 100000
+
+# clean out old rows after about this many inserts
+evict_every = 100
+
+# how much of a file to hash at a time
+hash_blksize = 1024 * 1024
+
+# how long to wait for another test process that is using the cache
+timeout = 10
+
+schema = [
+    '''CREATE TABLE IF NOT EXISTS refhash (
+        path TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime REAL,
+        ino INTEGER,
+        hash TEXT,
+        used REAL
+        )''',
+    'CREATE INDEX IF NOT EXISTS refhash_used ON refhash ( used )',
+    '''CREATE TABLE IF NOT EXISTS verdict (
+        key TEXT PRIMARY KEY,
+        used REAL,
+        tra TEXT
+        )''',
+    'CREATE INDEX IF NOT EXISTS verdict_used ON verdict ( used )',
+]
+
+
+def file_hash(fname):
+    # hash the file a block at a time, so it does not need to fit in memory
+    h = hashlib.sha1()
+    f = open(fname, 'rb')
+    try:
+        while True:
+            b = f.read(hash_blksize)
+            if not b:
+                break
+            h.update(b)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+
+def cache_file_name():
+    name = os.environ.get('PDK_COMPARECACHE', '')
+    if name == '':
+        return None
+    if not os.path.isabs(name):
+        name = os.path.join(os.environ.get('PDK_TOP', '.'), name)
+    return name
+
+
+def open_cache():
+    '''
+    Return a cache object for the file named by PDK_COMPARECACHE, or
+    None if there is no cache.
+    '''
+    if sqlite3 is None:
+        return None
+    name = cache_file_name()
+    if name is None:
+        return None
+    try:
+        return cache(name)
+    except sqlite3.Error:
+        return None
+
+
+class cache(object):
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename, timeout=timeout)
+        try:
+            with self.db:
+                for x in schema:
+                    self.db.execute(x)
+        except sqlite3.Error:
+            self.db.close()
+            raise
+
+    def close(self):
+        self.db.close()
+
+    def _evict(self, table, key):
+        # forget everything but the max_entries most recently used rows.
+        # This looks at every row, so we only do it for about one insert
+        # in evict_every; the table can go a little over max_entries.
+        if random.randrange(evict_every) != 0:
+            return
+        self.db.execute(
+            'DELETE FROM %s WHERE %s IN ( SELECT %s FROM %s '
+            'ORDER BY used DESC LIMIT -1 OFFSET ? )' %
+            (table, key, key, table), (max_entries,))
+
+    def reference_hash(self, reference):
+        # the hash of the reference file; from the cache if the file
+        # has not changed since we last looked at it
+        st = os.stat(reference)
+        path = os.path.abspath(reference)
+        now = time.time()
+        c = self.db.execute(
+            'SELECT size, mtime, ino, hash FROM refhash WHERE path = ?',
+            (path,))
+        r = c.fetchone()
+        if r is not None and tuple(r[0:3]) == (
+                st.st_size, st.st_mtime, st.st_ino):
+            with self.db:
+                self.db.execute(
+                    'UPDATE refhash SET used = ? WHERE path = ?', (now, path))
+            return r[3]
+
+        h = file_hash(reference)
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO refhash '
+                '( path, size, mtime, ino, hash, used ) '
+                'VALUES ( ?, ?, ?, ?, ?, ? )',
+                (path, st.st_size, st.st_mtime, st.st_ino, h, now))
+            self._evict('refhash', 'path')
+        return h
+
+    def lookup(self, output, reference, comparator, args):
+        '''
+        Return ( key, same, tra ).  same is True if this comparison of
+        these contents passed before, or if the output has the same
+        content as the reference.  tra is the dict of tra attributes
+        that the comparator wrote when it passed, or None if we do not
+        know them (the contents are the same, but the comparator never
+        ran on them with a tra).  key is what to give to remember() if
+        you run the comparator and it passes; it is None if we cannot
+        hash the files (for example, one of them does not exist), so
+        the comparator can report the problem.
+        '''
+        try:
+            out_hash = file_hash(output)
+            ref_hash = self.reference_hash(reference)
+        except (OSError, IOError, sqlite3.Error):
+            return None, False, None
+
+        key = json.dumps([out_hash, ref_hash, comparator, args],
+                         sort_keys=True, default=repr)
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        try:
+            with self.db:
+                c = self.db.execute(
+                    'SELECT tra FROM verdict WHERE key = ?', (key,))
+                r = c.fetchone()
+                if r is not None:
+                    self.db.execute(
+                        'UPDATE verdict SET used = ? WHERE key = ?',
+                        (time.time(), key))
+                    if r[0] is None:
+                        return key, True, None
+                    return key, True, json.loads(r[0])
+        except (sqlite3.Error, ValueError):
+            pass
+        return key, out_hash == ref_hash, None
+
+    def remember(self, key, tra=None):
+        '''
+        the comparison described by key passed; tra is a dict of the
+        tra attributes the comparator wrote, or None if it did not have
+        a tra to write in
+        '''
+        if key is None:
+            return
+        if tra is not None:
+            try:
+                tra = json.dumps(tra, sort_keys=True)
+            except (TypeError, ValueError):
+                # we could not give them back the same, so do not
+                # remember
+                return
+        try:
+            with self.db:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO verdict ( key, used, tra ) '
+                    'VALUES ( ?, ?, ? )', (key, time.time(), tra))
+                self._evict('verdict', 'key')
+        except sqlite3.Error:
+            pass
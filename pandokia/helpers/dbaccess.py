@@ -140,9 +140,12 @@ def load_identity(
 ##########
 
 
+qid_sql = "SELECT key_id FROM query WHERE qid = :1"
+
+
 def load_qid(qid):
     l = []
-    c = pdk_db.execute('SELECT key_id FROM query WHERE qid = :1', (qid,))
+    c = pdk_db.execute(qid_sql, (qid,))
     for key_id, in c:
         x = load_key_id(key_id)
         l.append(x)
@@ -221,19 +224,7 @@ def make_qid(tests=None, key_ids=None):
 
     # create a new qid - this is the identity of a list of test results
 
-    now = time.time()
-    expire = now + (30 * 86400)
-    if pdk_db.next:
-        newqid = pdk_db.next('sequence_qid')
-        c = pdk_db.execute(
-            "INSERT INTO query_id ( qid, time, expires ) VALUES ( :1, :2, :3 ) ",
-            (newqid,
-             now,
-             expire))
-    else:
-        c = pdk_db.execute(
-            "INSERT INTO query_id ( time, expires ) VALUES ( :1, :2 ) ", (now, expire))
-        newqid = c.lastrowid
+    newqid = pandokia.common.new_qid(time.time() + (30 * 86400))
 
     # Enter the test results into the qdb.
 
@@ -243,3 +234,159 @@ def make_qid(tests=None, key_ids=None):
     pdk_db.commit()
 
     return newqid
+
+##########
+#
+# qid algebra:  change the list of tests in qid according to the list of
+# tests in other_qid.  Each returns the number of tests added to or
+# removed from qid, and commits.
+#
+# The differences and the intersection find the key_ids to remove with
+# python sets and then delete them a chunk at a time.  (mysql does not
+# allow DELETE FROM query ... IN ( SELECT ... FROM query ), and a set
+# is much faster than asking the database to compare two large qids
+# test by test.)
+#
+
+
+def qid_key_ids(qid):
+    '''the set of key_ids in qid'''
+    c = pdk_db.execute(qid_sql, (qid,))
+    return set([x for x, in c])
+
+
+def qid_remove_key_ids(qid, key_ids):
+    '''remove key_ids from qid'''
+    n = pdk_db.execute_key_ids(
+        "DELETE FROM query WHERE qid = :1 AND key_id IN ( %s )",
+        sorted(key_ids), (qid,))
+    pdk_db.commit()
+    return n
+
+
+def qid_union(qid, other_qid):
+    '''add the tests in other_qid to qid'''
+    c = pdk_db.execute(
+        "INSERT INTO query ( qid, key_id ) SELECT DISTINCT :1, key_id FROM query WHERE qid = :2 AND key_id NOT IN ( SELECT key_id FROM query WHERE qid = :3 )",
+        (qid, other_qid, qid))
+    pdk_db.commit()
+    return max(c.rowcount, 0)
+
+
+def qid_intersection(qid, other_qid):
+    '''remove the tests in qid that are not in other_qid'''
+    return qid_remove_key_ids(qid, qid_key_ids(qid) - qid_key_ids(other_qid))
+
+
+def qid_difference(qid, other_qid):
+    '''remove the tests in qid that are also in other_qid'''
+    return qid_remove_key_ids(qid, qid_key_ids(qid) & qid_key_ids(other_qid))
+
+
+identity_fields = ('project', 'host', 'context', 'test_name')
+
+
+def qid_identity_difference(qid, other_qid, fields=identity_fields):
+    '''remove the tests in qid that match the identity of a test in other_qid
+
+    A test matches if it has the same values in all of fields as some
+    test in other_qid -- even if it is from a different test run.  Use
+    fields=('test_name',) to match only by test name.
+    '''
+    for x in fields:
+        if x not in identity_fields + ('test_run', 'status'):
+            raise ValueError('cannot compare qids by %s' % x)
+
+    cols = ', '.join(['result_scalar.' + x for x in fields])
+    s = "SELECT query.key_id, %s FROM query, result_scalar WHERE query.qid = :1 AND query.key_id = result_scalar.key_id" % cols
+
+    c = pdk_db.execute(s, (other_qid,))
+    other = set([tuple(x[1:]) for x in c])
+
+    c = pdk_db.execute(s, (qid,))
+    remove = set([x[0] for x in c if tuple(x[1:]) in other])
+
+    return qid_remove_key_ids(qid, remove)
+
+##########
+#
+# status history:  the status of many tests across the last several runs
+# of a recurring test run, a few queries for a whole page of tests
+# instead of one query for each test in each run.
+#
+#   runs = recent_test_runs('daily', 10, before='daily_2014-03-07')
+#   h = status_history([(project, host, context, test_name), ...], runs)
+#   h[(project, host, context, test_name)]['daily_2014-03-06']
+#       -> (status, key_id)
+#
+# The result_scalar_history index (or result_fact_history in the
+# normalized tables) answers these from the index.
+#
+
+
+def recent_test_runs(prefix, count=10, before=None):
+    '''the names of the newest count test runs that start with prefix,
+    oldest first.  With before, only test runs up to and including
+    before.'''
+    if before is None:
+        c = pdk_db.execute(
+            "SELECT test_run FROM distinct_test_run WHERE test_run LIKE :1 ORDER BY test_run DESC LIMIT %d" %
+            int(count), (prefix + '%',))
+    else:
+        c = pdk_db.execute(
+            "SELECT test_run FROM distinct_test_run WHERE test_run LIKE :1 AND test_run <= :2 ORDER BY test_run DESC LIMIT %d" %
+            int(count), (prefix + '%', before))
+    l = [x for x, in c]
+    l.reverse()
+    return l
+
+
+def status_history(identities, test_runs, chunk_size=200):
+    '''the status of each test identity in each test run
+
+    identities is a list of ( project, host, context, test_name ).
+    Returns a dict of { identity : { test_run : ( status, key_id ) } };
+    a test that is not in a test run is not in its dict.
+    '''
+    identities = set([tuple(x) for x in identities])
+    test_runs = list(test_runs)
+    history = dict([(x, {}) for x in identities])
+    if not identities or not test_runs:
+        return history
+
+    # Ask for every combination of the values in the chunk; the
+    # database finds each one in the index.  A combination that is not
+    # one of our tests is thrown away when we read the rows.  (None
+    # does not sort with strings, so it sorts as ''.)
+    identities = sorted(identities, key=lambda t: tuple(
+        '' if v is None else v for v in t))
+    for n in range(0, len(identities), chunk_size):
+        chunk = identities[n:n + chunk_size]
+        params = {}
+        where = []
+        for col, values in (
+                ('test_run', test_runs),
+                ('project', set([x[0] for x in chunk])),
+                ('host', set([x[1] for x in chunk])),
+                ('context', set([x[2] for x in chunk])),
+                ('test_name', set([x[3] for x in chunk]))):
+            if None in values:
+                # NULL is never IN a list; leave this column to the
+                # check below
+                continue
+            names = []
+            for i, v in enumerate(sorted(values)):
+                name = '%s_%d' % (col, i)
+                params[name] = v
+                names.append(':' + name)
+            where.append('%s IN ( %s )' % (col, ', '.join(names)))
+
+        c = pdk_db.execute(
+            "SELECT project, host, context, test_name, test_run, status, key_id FROM result_scalar WHERE " +
+            ' AND '.join(where), params)
+        for project, host, context, test_name, test_run, status, key_id in c:
+            d = history.get((project, host, context, test_name))
+            if d is not None:
+                d[test_run] = (status, key_id)
+
+    return history
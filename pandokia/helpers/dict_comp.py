@@ -38,6 +38,8 @@ import glob
 import re
 import errno
 import numbers
+from array import array
+from itertools import compress
 
 from pandokia.helpers.filecomp import safe_rm
 import pandokia.helpers.display as display
@@ -178,6 +180,84 @@ def append_okfile(okfh, output_file, reference_file):
         okfh.write('../%s ../%s\n' % (output_file, reference_file))
     okfh.flush()
 
+##########
+#
+# Compare many numbers at once.  A dict from a big calculation can have
+# 10^5 numbers in it; looking at them one at a time in the loop in
+# dictionary_comp takes longer than the test.  Instead, we line up the
+# data values, the reference values, and the tolerances in arrays and
+# compute all the discrepancies in one pass.
+#
+# These are the types that go the fast way, when at least one of the
+# two values is a float.  Two ints go the slow way so that they stay
+# exact: an int too big for a float still compares, and the
+# discrepancy of two ints with a 0 reference is an int, the same as
+# always.  bool is a Number, but True - False is not a useful
+# discrepancy, so it goes the slow way, as does anything else.
+#
+
+_fast_types = (int, float)
+
+
+def _compare_numbers(data, ref, tol):
+    # data and ref are lists of the same length; tol is a list like
+    # them or a single tolerance for all of them.  The discrepancy
+    # is (data - ref) / ref, or data - ref if ref is 0.  Returns a list
+    # of discrepancies, a list of the indexes where the discrepancy is
+    # bigger than the tolerance, and the index of the biggest
+    # discrepancy (or None).  The discrepancy of two zeros is 0, not
+    # 0.0, the same as in dictionary_comp.
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    if numpy is None:
+        data = array('d', data)
+        ref = array('d', ref)
+        if isinstance(tol, list):
+            tol = array('d', tol)
+        else:
+            tol = array('d', [tol]) * len(data)
+        discrep = []
+        bad = []
+        big = -1.0
+        ibig = None
+        for i in range(len(data)):
+            diff = data[i] - ref[i]
+            if ref[i] == 0 and data[i] == 0:
+                diff = 0
+            elif ref[i] != 0:
+                diff = diff / ref[i]
+            discrep.append(diff)
+            mag = abs(diff)
+            if mag > tol[i]:
+                bad.append(i)
+            if mag > big:
+                big = mag
+                ibig = i
+        return discrep, bad, ibig
+
+    data = numpy.array(data, dtype=numpy.float64)
+    ref = numpy.array(ref, dtype=numpy.float64)
+    tol = numpy.array(tol, dtype=numpy.float64)
+    diff = data - ref
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        discrep = numpy.where(ref == 0, diff, diff / ref)
+    mag = numpy.abs(discrep)
+    bad = numpy.flatnonzero(mag > tol).tolist()
+    # a NaN discrepancy never fails (just like abs(nan) > tol) and is
+    # never the biggest
+    mag[numpy.isnan(mag)] = -1.0
+    ibig = int(numpy.argmax(mag)) if len(mag) else None
+    if ibig is not None and mag[ibig] < 0:
+        ibig = None
+    zeros = numpy.flatnonzero((data == 0) & (ref == 0)).tolist()
+    discrep = discrep.tolist()
+    for i in zeros:
+        discrep[i] = 0
+    return discrep, bad, ibig
+
 ##########
 #
 # Compare all the interesting fields.  This function is used by
@@ -276,8 +356,53 @@ def dictionary_comp(
         tra['max_discrep'] = 0
         tra['max_discrep_var'] = None
 
-    # Loop over the interesting keys, comparing each one.
-    for k in interesting_fields:
+    # Compare all the fields that are plain numbers in both the data
+    # and the reference, and not both ints, at the same time.  A
+    # missing value comes out as None, so it is not one of them.
+    fields = list(interesting_fields)
+    data_values = [data_dict.get(k) for k in fields]
+    ref_values = [ref_dict.get(k) for k in fields]
+    fast = [type(d) in _fast_types and type(r) in _fast_types and
+            not (type(d) is int and type(r) is int)
+            for d, r in zip(data_values, ref_values)]
+    numeric = list(compress(fields, fast))
+
+    if numeric:
+        if tolerance_dict:
+            for k in numeric:
+                if k in tolerance_dict:
+                    tda['tol_%s' % k] = tolerance_dict[k]
+            tol = [tolerance_dict.get(k, fp_tolerance) for k in numeric]
+        else:
+            tol = fp_tolerance
+
+        discreps, bad, ibig = _compare_numbers(
+            list(compress(data_values, fast)),
+            list(compress(ref_values, fast)),
+            tol)
+
+        # Report every element, or just the ones that failed.
+        if fail_only:
+            report = bad
+        else:
+            report = range(len(numeric))
+        for i in report:
+            k = numeric[i]
+            tra[k] = str(data_dict[k])
+            tra['ref_%s' % k] = str(ref_dict[k])
+            tra['discrep_%s' % k] = discreps[i]
+
+        if bad:
+            failed.extend(numeric[i] for i in bad)
+            fail = True
+
+        # the biggest discrepancy of all the numbers, failed or not
+        if ibig is not None:
+            tra['numeric_max_discrep'] = abs(discreps[ibig])
+            tra['numeric_max_discrep_var'] = numeric[ibig]
+
+    # Loop over the rest of the interesting keys, comparing each one.
+    for k in [k for k, f in zip(fields, fast) if not f]:
 
         # flag of whether this iteration of the loop fails the compare
         this_fail = False
@@ -13,39 +13,55 @@ def dprint(d, indent=0, follow=''):
 
     print nested dictionaries in a nicely indented format
     """
+    # the pieces are collected in a list and joined once; adding to a
+    # string each time takes forever on a dict with 10^5 elements
+    s = []
+    _dprint(s, d, indent, follow)
+    return ''.join(s)
+
+
+def lprint(l, indent=0, follow=''):
+    s = []
+    _lprint(s, l, indent, follow)
+    return ''.join(s)
+
+
+def _dprint(s, d, indent, follow):
     indent_str = '    ' * indent
     l = sorted(d.keys())
-    s = indent_str + '{\n'
+    s.append(indent_str + '{\n')
     maxlen = 0
     for x in l:
         if len(x) > maxlen:
             maxlen = len(x)
     maxlen = maxlen + 3
     for x in l:
-        s = s + indent_str + ('%-*s :' % (maxlen, "'%s'" % x))
+        s.append(indent_str + ('%-*s :' % (maxlen, "'%s'" % x)))
         if isinstance(d[x], dict):
-            s = s + "\n" + dprint(d[x], indent + 1, follow=',')
+            s.append("\n")
+            _dprint(s, d[x], indent + 1, ',')
         elif isinstance(d[x], list):
-            s = s + "\n" + lprint(d[x], indent + 1, follow=',')
+            s.append("\n")
+            _lprint(s, d[x], indent + 1, ',')
         else:
-            s = s + " " + repr(d[x]) + ",\n"
-    s = s + indent_str + '}' + follow + '\n'
-    return s
+            s.append(" " + repr(d[x]) + ",\n")
+    s.append(indent_str + '}' + follow + '\n')
 
 
-def lprint(l, indent=0, follow=''):
+def _lprint(s, l, indent, follow):
     indent_str = '    ' * indent
-    s = indent_str + '[\n'
+    s.append(indent_str + '[\n')
     for x in l:
-        s = s + indent_str
+        s.append(indent_str)
         if isinstance(x, dict):
-            s = s + "\n" + dprint(x, indent + 1, follow=',')
+            s.append("\n")
+            _dprint(s, x, indent + 1, ',')
         elif isinstance(x, list):
-            s = s + "\n" + lprint(x, indent + 1, follow=',')
+            s.append("\n")
+            _lprint(s, x, indent + 1, ',')
         else:
-            s = s + repr(x) + ",\n"
-    s = s + indent_str + ']' + follow + '\n'
-    return s
+            s.append(repr(x) + ",\n")
+    s.append(indent_str + ']' + follow + '\n')
 
 #####
 #
@@ -48,8 +48,19 @@ import sys
 import difflib
 import traceback
 import glob
+import fnmatch
+import tempfile
+import threading
+
+try:
+    from itertools import zip_longest
+except ImportError:
+    from itertools import izip_longest as zip_longest
+
+from multiprocessing.pool import ThreadPool
 
 import pandokia.helpers.process as process
+import pandokia.helpers.compare_cache as compare_cache
 
 ###
 # Various file comparisons
@@ -121,6 +132,65 @@ def cmp_example(
 # binary file compare
 ###
 
+# Compare this much of the two files at a time.  We read each block
+# into the same buffer every time, so we never have more than a block
+# of either file in memory, no matter how big the files are.  (mmap
+# was tried; slicing the map copies the data and faults in every page,
+# so it was slower than read() and counted the whole file in the rss.)
+cmp_binary_blksize = 1024 * 1024
+
+
+def _readfull(f, buf):
+    # read into buf until it is full or the file ends; return the count
+    n = 0
+    view = memoryview(buf)
+    while n < len(buf):
+        got = f.readinto(view[n:])
+        if not got:
+            break
+        n += got
+    return n
+
+
+def _first_difference(f1, f2, length):
+    # Return the offset of the first byte that is different in the
+    # first length bytes of the two open files, or None if they are the
+    # same.
+    blksize = cmp_binary_blksize
+    b1 = bytearray(blksize)
+    b2 = bytearray(blksize)
+    offset = 0
+    while offset < length:
+        if length - offset < blksize:
+            b1 = bytearray(length - offset)
+            b2 = bytearray(length - offset)
+        n1 = _readfull(f1, b1)
+        n2 = _readfull(f2, b2)
+        if n1 != n2 or n1 == 0:
+            # the file changed size while we were reading it
+            return offset + min(n1, n2)
+        if b1 != b2:
+            # find the first difference in this block; compare smaller
+            # pieces first so we do not loop over every byte
+            d1 = bytes(b1)
+            d2 = bytes(b2)
+            while len(d1) > 4096:
+                half = len(d1) // 2
+                if d1[:half] != d2[:half]:
+                    d1 = d1[:half]
+                    d2 = d2[:half]
+                else:
+                    offset += half
+                    d1 = d1[half:]
+                    d2 = d2[half:]
+            for i in range(len(d1)):
+                if d1[i:i + 1] != d2[i:i + 1]:
+                    return offset + i
+            return offset + len(d1)
+        offset += n1
+    return None
+
+
 def cmp_binary(
         res,
         ref,
@@ -135,62 +205,69 @@ def cmp_binary(
         match exactly.  No kwargs are recognized.
     '''
     try:
-        f1 = open(res, 'r')
+        f1 = open(res, 'rb')
     except:
         print("cannot open result file: %s" % res)
         raise
 
     try:
-        f2 = open(ref, 'r')
+        f2 = open(ref, 'rb')
     except:
         f1.close()
         print("cannot open reference file %s" % ref)
         raise
 
-    # pick the length out of the stat structure
-    s1 = os.fstat(f1.fileno())[6]
-    s2 = os.fstat(f2.fileno())[6]
-
-    if s1 != s2:
-        print("files are different size:")
-        print("    %s %d" % (res, s1))
-        print("    %s %d" % (ref, s2))
+    try:
+        # pick the length out of the stat structure
+        s1 = os.fstat(f1.fileno())[6]
+        s2 = os.fstat(f2.fileno())[6]
+
+        if s1 != s2:
+            if not quiet:
+                print("files are different size:")
+                print("    %s %d" % (res, s1))
+                print("    %s %d" % (ref, s2))
+            if quiet:
+                return False
+
+        offset = _first_difference(f1, f2, min(s1, s2))
+    finally:
         f1.close()
         f2.close()
-        return False
 
-    blksize = 65536
-    offset = 0
-    while True:
-        d1 = f1.read(blksize)
-        d2 = f2.read(blksize)
-
-        if d1 == '' and d2 == '':
-            f1.close()
-            f2.close()
-            return True
-
-        if d1 == d2:
-            continue
-
-        # bug: be nice to show the offset where they are different
-        print("files are different: %s %s" % (res, ref))
-        f1.close()
-        f2.close()
+    if offset is None and s1 == s2:
         return True
 
-    # not reached
+    if not quiet:
+        if offset is None:
+            offset = min(s1, s2)
+        print("files are different: %s %s" % (res, ref))
+        print("    first difference at byte offset %d" % offset)
+    return False
 
 ###
 # FITS - Flexible Image Transport System
 ###
 
 #
-# This uses fitsdiff from STSCI_PYTHON, an astronomical data analysis package
+# If astropy is available, we compare the files right here: the
+# headers first, then the data of each HDU.  The data is memory mapped
+# and compared a chunk at a time with numpy, so an image does not need
+# to fit in memory.  Otherwise, we run fitsdiff (from astropy or from
+# STSCI_PYTHON) in a separate process, the way we always did.
 #
 # http://www.stsci.edu/institute/software_hardware/pyraf/stsci_python
 #
 
+# set this to True to always use the external fitsdiff
+cmp_fits_use_fitsdiff = False
+
+# compare this many array elements at a time
+cmp_fits_chunk = 1024 * 1024
+
+# show at most this many of the values that are different in a file
+cmp_fits_max_diffs = 10
+
 
 def cmp_fits(
         the_file,
@@ -204,13 +281,22 @@ def cmp_fits(
         ignorekeys=None,
         ignorecomm=None):
     '''
-    cmp_fits - compare fits files.  kwargs are passed through to fitsdiff
-    '''
+    cmp_fits - compare fits files.
 
-    if quiet:
-        sys.stdout.write("(sorry - fitsdiff does not know how to be quiet)\n")
+        maxdiff is the relative tolerance for floating point values,
+            like fitsdiff -r
 
-    safe_rm('filecomp.tmp')
+        ignorekeys is a list of header keywords to ignore, like
+            fitsdiff -k; they may contain wildcards
+
+        ignorecomm is a list of header keywords whose comments are
+            ignored, like fitsdiff -c
+
+    If the tra dict is given, the largest and the mean relative
+    difference of the data values are stored in it as max_rel_diff and
+    mean_rel_diff (with the attr_prefix), and the number of values that
+    are different as n_diff.
+    '''
 
     # fitsdiff does not know how to distinctively report that a reference
     # file was missing (it gives the same status as for a failed match)
@@ -219,9 +305,34 @@ def cmp_fits(
         print(e)
         raise e
 
+    if not cmp_fits_use_fitsdiff:
+        try:
+            import numpy
+            import astropy.io.fits as fits
+        except ImportError:
+            pass
+        else:
+            return _cmp_fits_astropy(numpy, fits, the_file, reference_file,
+                                     quiet, attr_prefix, tra, maxdiff,
+                                     ignorekeys, ignorecomm)
+
+    return _cmp_fits_fitsdiff(the_file, reference_file, quiet,
+                              maxdiff, ignorekeys, ignorecomm)
+
+
+def _cmp_fits_fitsdiff(the_file, reference_file, quiet,
+                       maxdiff, ignorekeys, ignorecomm):
+
+    if quiet:
+        sys.stdout.write("(sorry - fitsdiff does not know how to be quiet)\n")
+
+    # compare_files may run several of these at once, so each one needs
+    # its own file for the output
+    fd, tmp = tempfile.mkstemp(prefix='filecomp.', suffix='.tmp', dir='.')
+    os.close(fd)
+
     # run fitsdiff externally - if you call it directly, it does
-    # weird things to the tests. (This will change with Erik's new
-    # fitsdiff API, but it isn't here yet.)
+    # weird things to the tests.
 
     arglist = ['fitsdiff']
     if maxdiff is not None:
@@ -233,10 +344,10 @@ def cmp_fits(
     arglist = arglist + [the_file, reference_file]
 
     print(arglist)
-    status = process.run_process(arglist, output_file="filecomp.tmp")
+    status = process.run_process(arglist, output_file=tmp)
 
-    process.cat('filecomp.tmp')
-    safe_rm('filecomp.tmp')
+    process.cat(tmp)
+    safe_rm(tmp)
 
     if status == 0:
         return True
@@ -245,12 +356,275 @@ def cmp_fits(
     else:
         raise Exception("fitsdiff error - exited %d" % status)
 
+
+def _fits_match(key, patterns):
+    # is this header keyword in the list?  fitsdiff allows wildcards.
+    for x in patterns:
+        if fnmatch.fnmatchcase(key, x):
+            return True
+    return False
+
+
+def _fits_cards(header, ignorekeys):
+    # keyword -> list of (value, comment); COMMENT and HISTORY (and any
+    # other keyword that appears more than once) compare in order
+    d = {}
+    for card in header.cards:
+        key = card.keyword
+        if key == '' or _fits_match(key, ignorekeys):
+            continue
+        d.setdefault(key, []).append((card.value, card.comment))
+    return d
+
+
+def _fits_value_differs(v1, v2, rtol):
+    if isinstance(v1, float) and isinstance(v2, float) and rtol:
+        return abs(v1 - v2) > rtol * abs(v2)
+    return v1 != v2
+
+
+def _fits_header_diffs(h1, h2, rtol, ignorekeys, ignorecomm):
+    # return a list of lines describing how the headers are different
+    c1 = _fits_cards(h1, ignorekeys)
+    c2 = _fits_cards(h2, ignorekeys)
+    l = []
+    for key in sorted(set(c1) | set(c2)):
+        if key not in c2:
+            l.append("keyword %s only in test file" % key)
+            continue
+        if key not in c1:
+            l.append("keyword %s only in reference file" % key)
+            continue
+        l1 = c1[key]
+        l2 = c2[key]
+        if len(l1) != len(l2):
+            l.append("keyword %s appears %d times, reference %d" %
+                     (key, len(l1), len(l2)))
+            continue
+        for (v1, com1), (v2, com2) in zip(l1, l2):
+            if _fits_value_differs(v1, v2, rtol):
+                l.append("keyword %s: %r != %r" % (key, v1, v2))
+            elif com1 != com2 and not _fits_match(key, ignorecomm):
+                l.append("keyword %s comment: %r != %r" % (key, com1, com2))
+    return l
+
+
+def _fits_show(numpy, x):
+    # a numpy scalar shows as np.float32(1.5); we just want 1.5
+    if isinstance(x, numpy.generic):
+        return x.item()
+    return x
+
+
+def _fits_scaling(hdu):
+    # ( bscale, bzero, blank ) of an image HDU whose values are scaled,
+    # or None.  We open the files with do_not_scale_image_data, because
+    # astropy cannot memory map a scaled image (that is every unsigned
+    # 16 bit image), so we scale each chunk ourselves.
+    h = hdu.header
+    if not hdu.is_image:
+        return None
+    if 'BSCALE' not in h and 'BZERO' not in h and 'BLANK' not in h:
+        return None
+    return (h.get('BSCALE', 1), h.get('BZERO', 0), h.get('BLANK'))
+
+
+def _fits_scale(numpy, c, scale):
+    # the physical values of a chunk of raw image data; BLANK is NaN
+    if scale is None:
+        return c
+    bscale, bzero, blank = scale
+    v = numpy.asarray(c, dtype=numpy.float64) * bscale + bzero
+    if blank is not None and c.dtype.kind in 'iu':
+        v[c == blank] = numpy.nan
+    return v
+
+
+def _fits_array_diffs(numpy, a, b, rtol, stats, where, lines,
+                      scale1=None, scale2=None):
+    # Compare two arrays of the same shape a chunk at a time; a and b
+    # are usually memory mapped, so only the chunk we are looking at is
+    # in memory.  Numbers are the same if |a-b| <= rtol * |b|; NaN is
+    # the same as NaN.  stats is [ n_diff, max_rel, sum_rel, n_rel ],
+    # which we update.  The first few values that are different go in
+    # lines.  scale1 and scale2 are from _fits_scaling() if a or b are
+    # the raw values of a scaled image.
+    shape = a.shape
+    fa = a.reshape(-1)
+    fb = b.reshape(-1)
+    kind = a.dtype.kind + b.dtype.kind
+    if scale1 is not None or scale2 is not None:
+        kind += 'f'
+    numeric = all(k in 'biufc' for k in kind)
+    if 'c' in kind:
+        dtype = numpy.complex128
+    else:
+        dtype = numpy.float64
+    # integers compare exactly unless there is a tolerance; float64
+    # would lose the low bits of a big one
+    exact = not rtol and 'f' not in kind and 'c' not in kind
+
+    for lo in range(0, fa.size, cmp_fits_chunk):
+        hi = lo + cmp_fits_chunk
+        ca = sa = _fits_scale(numpy, fa[lo:hi], scale1)
+        cb = sb = _fits_scale(numpy, fb[lo:hi], scale2)
+        if ca.dtype.kind == 'O' or cb.dtype.kind == 'O':
+            # variable length array column; each element is an array
+            bad = numpy.array([not numpy.array_equal(x, y)
+                               for x, y in zip(ca, cb)], dtype=bool)
+        elif numeric:
+            if exact:
+                bad = numpy.asarray(ca != cb, dtype=bool)
+            ca = numpy.asarray(ca, dtype=dtype)
+            cb = numpy.asarray(cb, dtype=dtype)
+            with numpy.errstate(invalid='ignore', over='ignore',
+                                divide='ignore'):
+                diff = numpy.abs(ca - cb)
+                absb = numpy.abs(cb)
+                finite = numpy.isfinite(diff)
+                if not exact:
+                    bad = diff > rtol * absb
+                    # inf - inf is nan; -inf and inf are not the same
+                    bad |= (ca != cb) & ~finite
+                    bad &= ~(numpy.isnan(ca) & numpy.isnan(cb))
+                ok = finite & (absb != 0)
+                rel = diff[ok] / absb[ok]
+            if rel.size:
+                stats[1] = max(stats[1], float(rel.max()))
+                stats[2] += float(rel.sum())
+                stats[3] += rel.size
+        else:
+            bad = numpy.asarray(ca != cb, dtype=bool)
+
+        n = int(numpy.count_nonzero(bad))
+        if n == 0:
+            continue
+        show = max(0, cmp_fits_max_diffs - stats[0])
+        for i in numpy.flatnonzero(bad)[:show]:
+            idx = numpy.unravel_index(lo + int(i), shape)
+            lines.append("    %s at %s: %r != %r" %
+                         (where, tuple(int(x) for x in idx),
+                          _fits_show(numpy, sa[i]),
+                          _fits_show(numpy, sb[i])))
+        stats[0] += n
+
+
+def _fits_data_diffs(numpy, d1, d2, rtol, stats, scale1=None, scale2=None):
+    # return a list of lines describing how the data of an HDU is different
+    lines = []
+    if d1 is None or d2 is None:
+        if d1 is not None:
+            lines.append("data only in test file")
+        elif d2 is not None:
+            lines.append("data only in reference file")
+        return lines
+
+    names1 = d1.dtype.names
+    names2 = d2.dtype.names
+    if names1 is None and names2 is None:
+        # an image
+        if d1.shape != d2.shape:
+            lines.append("image shape %s != %s" % (d1.shape, d2.shape))
+            return lines
+        _fits_array_diffs(numpy, d1, d2, rtol, stats, 'value', lines,
+                          scale1, scale2)
+        return lines
+
+    if names1 is None or names2 is None:
+        lines.append("image in one file, table in the other")
+        return lines
+
+    # a table; compare the columns that are in both
+    if list(names1) != list(names2):
+        lines.append("columns %s != %s" % (list(names1), list(names2)))
+    if len(d1) != len(d2):
+        lines.append("table has %d rows, reference %d" % (len(d1), len(d2)))
+        return lines
+    for name in names1:
+        if name not in names2:
+            continue
+        c1 = d1[name]
+        c2 = d2[name]
+        if c1.shape != c2.shape:
+            lines.append("column %s shape %s != %s" %
+                         (name, c1.shape, c2.shape))
+            continue
+        _fits_array_diffs(numpy, c1, c2, rtol, stats,
+                          'column %s' % name, lines)
+    return lines
+
+
+def _cmp_fits_astropy(numpy, fits, the_file, reference_file, quiet,
+                      attr_prefix, tra, maxdiff, ignorekeys, ignorecomm):
+    rtol = float(maxdiff or 0.0)
+    ignorekeys = [x.upper() for x in (ignorekeys or [])]
+    ignorecomm = [x.upper() for x in (ignorecomm or [])]
+
+    report = []
+
+    # [ n_diff, max_rel, sum_rel, n_rel ] for all the HDUs
+    stats = [0, 0.0, 0.0, 0]
+
+    # the scaling keywords are compared with the rest of the header;
+    # _fits_data_diffs compares the scaled values
+    f1 = fits.open(the_file, memmap=True, do_not_scale_image_data=True)
+    try:
+        f2 = fits.open(reference_file, memmap=True,
+                       do_not_scale_image_data=True)
+        try:
+            if len(f1) != len(f2):
+                report.append("test file has %d HDUs, reference %d" %
+                              (len(f1), len(f2)))
+            for n, (hdu1, hdu2) in enumerate(zip(f1, f2)):
+                l = _fits_header_diffs(hdu1.header, hdu2.header, rtol,
+                                       ignorekeys, ignorecomm)
+                if quiet and l:
+                    return False
+                n_diff = stats[0]
+                l += _fits_data_diffs(numpy, hdu1.data, hdu2.data,
+                                      rtol, stats, _fits_scaling(hdu1),
+                                      _fits_scaling(hdu2))
+                if stats[0] > n_diff:
+                    l.insert(0, "%d data values are different" %
+                             (stats[0] - n_diff))
+                if l:
+                    report.append("HDU %d:" % n)
+                    report.extend("    " + x for x in l)
+                    if quiet:
+                        break
+        finally:
+            f2.close()
+    finally:
+        f1.close()
+
+    if tra is not None:
+        prefix = attr_prefix or ''
+        tra[prefix + 'max_rel_diff'] = stats[1]
+        tra[prefix + 'mean_rel_diff'] = stats[2] / stats[3] if stats[3] else 0.0
+        tra[prefix + 'n_diff'] = stats[0]
+
+    if not report:
+        return True
+
+    if not quiet:
+        print("files are different: %s %s" % (the_file, reference_file))
+        for x in report:
+            print(x)
+        if stats[0] and stats[3]:
+            print("max relative difference %g, mean %g" %
+                  (stats[1], stats[2] / stats[3]))
+    return False
+
 ###
 # text comparison
 ###
 
 cmp_text_timestamp = None
 
+# cmp_text shows at most this many of the lines that are different, so
+# a file that is different on every line does not have to fit in memory
+cmp_text_max_diffs = 1000
+
 
 def cmp_text_assemble_timestamp():
     # This module assembles regular expressions for many of the common
@@ -359,32 +733,50 @@ def cmp_text(
     else:
         ignorep = None
 
+    # Read both files a line at a time, so we never have more than a
+    # line of each in memory (plus the differences we are going to
+    # report).  Only a pair of lines that are different has to go
+    # through the ignore patterns; lines that are the same are still
+    # the same after we substitute the same patterns in both.
+    more_diffs = 0
     th = open(the_file)
-    rh = open(reference_file)
-
-    test = th.readlines()
-    ref = rh.readlines()
-
-    th.close()
-    rh.close()
-
-    if len(test) != len(ref):
-        # Files of different sizes cannot be identical
-        diffs = [('%d lines' % len(test), '%d lines' % len(ref))]
-        files_are_same = False
-
-    else:
-        for i in range(len(ref)):
-            # This may be slow, but it's clean
-            if ignorep is not None:
-                tline = ignorep.sub(' IGNORE ', test[i])
-                rline = ignorep.sub(' IGNORE ', ref[i])
-            else:
-                tline = test[i]
-                rline = ref[i]
-            if tline != rline:
+    try:
+        rh = open(reference_file)
+        try:
+            n = 0
+            tline = rline = ''
+            for tline, rline in zip_longest(th, rh):
+                if tline is None or rline is None:
+                    break
+                n += 1
+                if tline == rline:
+                    continue
+                if ignorep is not None:
+                    tline = ignorep.sub(' IGNORE ', tline)
+                    rline = ignorep.sub(' IGNORE ', rline)
+                    if tline == rline:
+                        continue
+                files_are_same = False
+                if quiet:
+                    # we do not need to know any more than that
+                    break
+                if len(diffs) < cmp_text_max_diffs:
+                    diffs.append((tline, rline))
+                else:
+                    more_diffs += 1
+
+            if tline is None or rline is None:
+                # Files of different sizes cannot be identical
                 files_are_same = False
-                diffs.append((tline, rline))
+                if not quiet:
+                    ntest = n + (tline is not None) + sum(1 for x in th)
+                    nref = n + (rline is not None) + sum(1 for x in rh)
+                    diffs = [('%d lines' % ntest, '%d lines' % nref)]
+                    more_diffs = 0
+        finally:
+            rh.close()
+    finally:
+        th.close()
 
     if files_are_same:
         return True
@@ -418,6 +810,8 @@ def cmp_text(
         fh.write("%-*s: %s\n" % (fwidth, the_file, tline.rstrip()))
         fh.write("%-*s: %s\n" % (fwidth, reference_file, rline.rstrip()))
         fh.write("\n")
+    if more_diffs:
+        fh.write("... and %d more lines that are different\n" % more_diffs)
     fh.flush()
 
     return False
@@ -532,6 +926,25 @@ def update_okfile(okfh, name, ref):
 ###
 
 
+def _remember_verdict(cache, key, prefix, tra, old_tra):
+    # tell the compare cache that this comparison passed, with the tra
+    # attributes that the comparator wrote (without the attr_prefix,
+    # because the same comparison may have a different prefix next
+    # time).  If it wrote an attribute that does not have the prefix,
+    # we do not know how to give it back, so we do not remember.
+    if tra is None:
+        cache.remember(key)
+        return
+    new_tra = {}
+    for x in tra:
+        if x in old_tra and old_tra[x] == tra[x]:
+            continue
+        if not x.startswith(prefix):
+            return
+        new_tra[x[len(prefix):]] = tra[x]
+    cache.remember(key, new_tra)
+
+
 def check_file(
         name,
         cmp,
@@ -571,7 +984,32 @@ def check_file(
     if cmp not in file_comparators:
         raise ValueError("file comparator %s not known" % str(cmp))
 
+    # If there is a compare cache, it may already know that these files
+    # are the same.  It also knows the tra attributes the comparator
+    # wrote when it passed, so the tra is the same whether we run the
+    # comparator or not.  If we need a tra and it does not know, we run
+    # the comparator anyway.
+    prefix = attr_prefix or ''
+    cache = compare_cache.open_cache()
+    cache_key = None
+    old_tra = None
+    if cache is not None:
+        cache_key, same, saved_tra = cache.lookup(name, ref, cmp, kwargs)
+        if same and (tra is None or saved_tra is not None):
+            cache.close()
+            if tra is not None:
+                for x in saved_tra:
+                    tra[prefix + x] = saved_tra[x]
+            if not quiet:
+                print("same as reference (compare cache): %s" % name)
+            if cleanup:
+                safe_rm(name)
+            return True
+        if tra is not None:
+            old_tra = dict(tra)
+
     # Do the comparison
+    r = False
     try:
         r = file_comparators[cmp](
             name,
@@ -588,6 +1026,12 @@ def check_file(
             update_okfile(okfh, name, ref)
         raise
 
+    finally:
+        if cache is not None:
+            if r:
+                _remember_verdict(cache, cache_key, prefix, tra, old_tra)
+            cache.close()
+
     # Clean up file that passed if we've been asked to
     if r:
         if cleanup:
@@ -652,7 +1096,145 @@ to pass), then use compare_files() at the end of your test.
         safe_rm(x['output'])
 
 
-def compare_files(clist, okroot=None, tda=None, tra=None, cleanup=True):
+def _compare_one(n, x, okfh, tda, tra):
+    # compare the n'th file of the list
+    # make sure we are looking in the right place for the reference file
+    if 'PDK_REFS' in list(os.environ.keys()):
+        PDK_REFS = os.environ['PDK_REFS']
+        here = os.path.abspath(os.curdir)
+        relpath = os.path.relpath(
+            here,
+            os.environ['PDK_TOP']
+        )
+        x['reference'] = os.path.join(PDK_REFS, relpath, x['reference'])
+
+    print("\nCOMPARE: %s" % x['output'])
+    attr_prefix = 'cmp_%d_' % n
+    for y in x['args']:
+        tda[attr_prefix + y] = x['args'][y]
+    tda[attr_prefix + 'file'] = x['output']
+    check_file(name=x['output'], cmp=x['comparator'],
+               ref=x['reference'], okfh=okfh, cleanup=False,
+               attr_prefix=attr_prefix,
+               tda=tda, tra=tra,
+               **x['args'])
+
+
+##
+# Comparing in parallel.  The comparisons run in a pool of threads;
+# most of the time goes to reading files, waiting for fitsdiff, or
+# numpy, which all let the other threads run.  (A pool of processes
+# could not use a comparator that the test defined for itself, and
+# could not give back the tra.)
+#
+# Each comparison writes its output, its okfile lines, and its tda/tra
+# into its own buffers.  compare_files takes the results in the order
+# of the list and copies them out, so everything comes out the same as
+# if we compared one file at a time.
+##
+
+class _thread_stdout(object):
+    # stands in for sys.stdout; a thread that has a buffer writes there,
+    # anything else goes to the real stdout
+
+    def __init__(self, real):
+        self.real = real
+        self.local = threading.local()
+
+    def write(self, s):
+        buf = getattr(self.local, 'buf', None)
+        if buf is None:
+            self.real.write(s)
+        else:
+            buf.append(s)
+
+    def flush(self):
+        if getattr(self.local, 'buf', None) is None:
+            self.real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+
+class _buffer(object):
+    # a file-like object for okfile lines
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, s):
+        self.lines.append(s)
+
+
+class _parallel(object):
+
+    def __init__(self, n):
+        self.pool = ThreadPool(n)
+        self.stdout = sys.stdout
+        sys.stdout = _thread_stdout(self.stdout)
+        self.results = []
+
+    def close(self):
+        sys.stdout = self.stdout
+        self.pool.close()
+        self.pool.join()
+
+
+def _compare_captured(out, n, x, have_tda, have_tra):
+    out.local.buf = output = []
+    okbuf = _buffer()
+    tda = {} if have_tda else None
+    tra = {} if have_tra else None
+    try:
+        _compare_one(n, x, okbuf, tda, tra)
+        exc = None
+    except Exception as e:
+        exc = e
+    out.local.buf = None
+    return output, okbuf, tda, tra, exc
+
+
+def _start_parallel(clist, tda, tra, n):
+    p = _parallel(n)
+    for n, x in enumerate(clist):
+        p.results.append(p.pool.apply_async(
+            _compare_captured,
+            (sys.stdout, n, x, tda is not None, tra is not None)))
+    return p
+
+
+def _finish_parallel(p, n, okfh, tda, tra):
+    # wait for the n'th comparison, then copy out what it did
+    output, okbuf, ctda, ctra, exc = p.results[n].get()
+    p.stdout.write(''.join(output))
+    if okfh:
+        for x in okbuf.lines:
+            okfh.write(x)
+    if ctda:
+        tda.update(ctda)
+    if ctra:
+        tra.update(ctra)
+    if exc is not None:
+        raise exc
+
+
+def _print_compare_exc():
+    # print the traceback of the exception we are handling, from
+    # _compare_one on down.  The frames above that are different when
+    # we compare in parallel, and they do not tell you anything.
+    etype, value, tb = sys.exc_info()
+    t = tb
+    while t is not None and t.tb_frame.f_code is not _compare_one.__code__:
+        t = t.tb_next
+    if t is None:
+        t = tb
+    sys.stderr.write('Traceback (most recent call last):\n')
+    sys.stderr.write(''.join(traceback.format_tb(t)))
+    sys.stderr.write(''.join(traceback.format_exception_only(etype, value)))
+
+
+def compare_files(clist, okroot=None, tda=None, tra=None, cleanup=True,
+                  parallel=None):
     '''
         clist is a tuple of (filename, comparator, args)
             filename is the name of a file in the directory out/; it is
@@ -676,6 +1258,11 @@ def compare_files(clist, okroot=None, tda=None, tra=None, cleanup=True):
 
         cleanup is true if it should delete output files from passing tests.
 
+        parallel is the number of comparisons to run at the same time.
+            The default is to compare one file at a time.  The output,
+            the okfile, the tda/tra attributes, and the exception that
+            is raised are the same either way.
+
     In your code, you would write something like:
 
         x = compare_files(
@@ -736,47 +1323,45 @@ def compare_files(clist, okroot=None, tda=None, tra=None, cleanup=True):
 
     _normalize_list(clist)
 
-    for n, x in enumerate(clist):
-        # make sure we are looking in the right place for the reference file
-        if 'PDK_REFS' in list(os.environ.keys()):
-            PDK_REFS = os.environ['PDK_REFS']
-            here = os.path.abspath(os.curdir)
-            relpath = os.path.relpath(
-                here,
-                os.environ['PDK_TOP']
-            )
-            x['reference'] = os.path.join(PDK_REFS, relpath, x['reference'])
-
-        # perform the comparison
-        try:
-            print("\nCOMPARE: %s" % x['output'])
-            attr_prefix = 'cmp_%d_' % n
-            for y in x['args']:
-                tda[attr_prefix + y] = x['args'][y]
-            tda[attr_prefix + 'file'] = x['output']
-            check_file(name=x['output'], cmp=x['comparator'],
-                       ref=x['reference'], okfh=okfh, cleanup=False,
-                       attr_prefix=attr_prefix,
-                       tda=tda, tra=tra,
-                       **x['args'])
-
-        # assertion error means the test fails
-        except AssertionError as e:
-            print("FAIL")
-            if ret_exc is None:
-                ret_exc = e
-
-        # any other exception means the test errors
-        except Exception as e:
-            print("ERROR %s" % e)
-            traceback.print_exc()
-            if (ret_exc is None) or (isinstance(e, AssertionError)):
-                ret_exc = e
+    # if we are comparing in parallel, start all the comparisons now;
+    # below, we take the results in order as if we did them one at a time
+    if parallel is not None and parallel > 1 and len(clist) > 1:
+        pending = _start_parallel(clist, tda, tra, parallel)
+    else:
+        pending = None
 
-        else:
-            print("PASS")
+    # if we are interrupted, we still have to put sys.stdout back
+    try:
+        for n, x in enumerate(clist):
+
+            # perform the comparison
+            try:
+                if pending is None:
+                    _compare_one(n, x, okfh, tda, tra)
+                else:
+                    _finish_parallel(pending, n, okfh, tda, tra)
+
+            # assertion error means the test fails
+            except AssertionError as e:
+                print("FAIL")
+                if ret_exc is None:
+                    ret_exc = e
+
+            # any other exception means the test errors
+            except Exception as e:
+                print("ERROR %s" % e)
+                _print_compare_exc()
+                if (ret_exc is None) or (isinstance(e, AssertionError)):
+                    ret_exc = e
+
+            else:
+                print("PASS")
+
+        print("")
 
-    print("")
+    finally:
+        if pending is not None:
+            pending.close()
 
     # remember to close the okfile
     if okfh:
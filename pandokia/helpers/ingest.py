@@ -0,0 +1,142 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# client side of the ingest daemon ("pdk ingestd")
+#
+# If PDK_INGEST is set to the name of the unix socket that an ingest
+# daemon is listening on, the pycode reporter sends its records to the
+# daemon instead of appending them to PDK_LOG.  The daemon inserts
+# them into the database as they arrive, so the results show up in the
+# web interface while the test run is still going.
+#
+# What goes over the socket is exactly the pdk log format.  The first
+# thing we send on a new connection is a START/SETDEFAULT block made from
+# the environment that pdkrun gave us, because the daemon does not see the
+# SETDEFAULT blocks that pdkrun writes in to PDK_LOG.
+#
+# If we cannot talk to the daemon (it is not running, it went away, or
+# it is so far behind that a send does not finish within PDK_INGEST_TIMEOUT
+# seconds), we "spill": the record and everything after it is appended
+# to the log file, just like it would have been without the daemon.  The
+# log file can then be imported in the usual way.
+#
+
+import os
+import socket
+
+# seconds to wait for the daemon to accept a record before we give up
+# on it and spill to the log file
+default_timeout = 30
+
+
+def open_log(filename):
+    # Return a file-like object that the reporter can write log records to.
+    #
+    # This is the normal open() unless PDK_INGEST is set.
+    if 'PDK_INGEST' not in os.environ or filename is None:
+        return open(filename, "a")
+    return ingest_file(os.environ['PDK_INGEST'], filename)
+
+
+def default_header():
+    # the START/SETDEFAULT block that pdkrun would write for this file
+    l = ['\n\nSTART\n']
+    for name, var in (
+            ('test_run', 'PDK_TESTRUN'),
+            ('project', 'PDK_PROJECT'),
+            ('host', 'PDK_HOST'),
+            ('context', 'PDK_CONTEXT'),
+            ('test_runner', 'PDK_RUNNER'),
+    ):
+        if var in os.environ:
+            l.append('%s=%s\n' % (name, os.environ[var]))
+    if 'PDK_FILE' in os.environ:
+        d = os.environ.get('PDK_DIRECTORY', os.getcwd())
+        l.append('location=%s/%s\n' % (d, os.environ['PDK_FILE']))
+    l.append('SETDEFAULT\n')
+    return ''.join(l)
+
+
+class ingest_file(object):
+    '''file-like object that sends pdk log records to the ingest daemon
+
+    write() collects text; flush() sends whatever has been collected.
+    The reporter flushes at the end of every record, so every send
+    is one or more complete records.
+
+    socket_name
+        name of the unix socket the daemon listens on
+
+    spill_filename
+        the log file to append to if the daemon is not available
+
+    timeout
+        seconds to wait for one send to finish; if None, use
+        PDK_INGEST_TIMEOUT from the environment, else default_timeout
+    '''
+
+    def __init__(self, socket_name, spill_filename, timeout=None):
+        self.socket_name = socket_name
+        self.spill_filename = spill_filename
+        self.spill_file = None
+        self.sock = None
+        self.buffer = []
+
+        if timeout is None:
+            timeout = float(
+                os.environ.get('PDK_INGEST_TIMEOUT', default_timeout))
+
+        try:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_name)
+            self.sock.sendall(default_header().encode('utf-8'))
+        except (socket.error, socket.timeout):
+            self.spill()
+
+    def write(self, s):
+        self.buffer.append(s)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        s = ''.join(self.buffer)
+        self.buffer = []
+
+        if self.sock is not None:
+            try:
+                self.sock.sendall(s.encode('utf-8'))
+                return
+            except (socket.error, socket.timeout):
+                # The daemon is gone, or it is applying backpressure
+                # longer than we are willing to wait.  If we sent part of
+                # this record, the daemon discards it because it never
+                # sees the END.
+                self.spill()
+
+        self.spill_file.write(s)
+        self.spill_file.flush()
+
+    def spill(self):
+        # stop talking to the daemon; everything from now on goes in
+        # the log file
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+            self.sock = None
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_filename, "a")
+
+    def close(self):
+        self.flush()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
@@ -21,6 +21,7 @@ import platform
 
 # pycode contains an object that writes properly formatted pdk log records
 import pandokia.helpers.pycode
+import pandokia.helpers.rusage
 
 p_StringO = None
 c_StringO = None
@@ -180,6 +181,7 @@ class Pdk(nose.plugins.base.Plugin):
     # nose calls startTest() just before it starts each test.
     def startTest(self, test):
         self.pdk_starttime = time.time()
+        self.pdk_start_rusage = pandokia.helpers.rusage.snapshot()
 
     # nose calls stopTest() just after it finishes each test -- except when it doesn't !
     # DON'T USE THIS!
@@ -207,6 +209,8 @@ class Pdk(nose.plugins.base.Plugin):
 
         # record the end time here, because nose does not always call stopTest()
         self.pdk_endtime = time.time()
+        rusage_tra = pandokia.helpers.rusage.tra(
+            getattr(self, 'pdk_start_rusage', None))
 
 
         # Limits
@@ -358,8 +362,12 @@ class Pdk(nose.plugins.base.Plugin):
         if exc is not None:
             tra['Exception'] = exc
 
+        # the resources the test used, unless the test reported its own
+        rusage_tra.update(tra)
+
         # write the log record - the pycode log object writes the log
-        # entry and flushes the output file in case we crash later
+        # entry (at once if PDK_REPORT_SYNC is set, otherwise a batch of
+        # records at a time)
         #
         # (Someday, it might be nice to use the start()/finish() interface
         # to the pycode reporter.  A crashed test run would leave just a
@@ -384,7 +392,7 @@ class Pdk(nose.plugins.base.Plugin):
                 start_time=pdktimestamp(self.pdk_starttime),
                 end_time=pdktimestamp(self.pdk_endtime),
                 tda=tda,
-                tra=tra,
+                tra=rusage_tra,
                 log=log,
             )
         else:
@@ -1,5 +1,9 @@
 import os
+import time
+import atexit
 import pandokia.lib
+import pandokia.helpers.ingest
+import pandokia.helpers.rusage as rusage
 import datetime
 import traceback
 
@@ -19,6 +23,37 @@ import traceback
 # x.report( ...everything about the test... )
 #
 #
+# Each record is put together in memory and written with the records
+# before it when there are buffer_bytes of them, when buffer_seconds
+# have passed since the last write, and when the program exits.  A
+# suite of many tiny tests spends much less time in write() and
+# flush() that way.
+#
+# If the tests can crash the python interpreter (a C extension that
+# dumps core, say), set PDK_REPORT_SYNC=1 in the environment.  Then
+# every record is written and flushed as soon as it is reported, so a
+# crash loses only the test that was running.
+#
+# PDK_TIMEOUT does the same thing.  When a file runs too long, pdkrun
+# kills it; atexit does not run then, and neither does a SIGTERM
+# handler if the test is stuck in C code, so the records we had not
+# written yet would be lost.
+#
+
+buffer_bytes = 64 * 1024
+buffer_seconds = 5.0
+
+# reporters that may have records to write when we exit.  A reporter
+# stays here until it is closed, even if nobody else has it any more,
+# so that what it has not written yet is not lost.
+open_reporters = set()
+
+
+def flush_all():
+    for x in list(open_reporters):
+        x.flush()
+
+atexit.register(flush_all)
 
 
 class reporter(object):
@@ -77,19 +112,32 @@ class reporter(object):
 
 '''
 
-        # in all cases, we need to open the output file
+        # in all cases, we need to open the output file.  (If there is
+        # an ingest daemon in PDK_INGEST, open_log gives us an object
+        # that sends to the daemon instead.)
         if filename is not None:
             self.filename = filename
-            self.report_file = open(filename, "a")
+            self.report_file = pandokia.helpers.ingest.open_log(filename)
         else:
             if 'PDK_LOG' in os.environ:
                 filename = os.environ['PDK_LOG']
                 self.filename = filename
-                self.report_file = open(filename, "a")
+                self.report_file = pandokia.helpers.ingest.open_log(filename)
             else:
                 self.report_file = sys.stdout
                 self.report_view = True
 
+        # the text we have not written yet; see buffer_bytes above.  The
+        # display on stdout is for a person to watch, so it is not
+        # buffered.
+        self.buffer = []
+        self.buffer_len = 0
+        self.buffer_time = time.time()
+        self.sync = self.report_view or \
+            os.environ.get('PDK_REPORT_SYNC', '') not in ('', '0') or \
+            os.environ.get('PDK_TIMEOUT', '') != ''
+        open_reporters.add(self)
+
         # select the prefix to insert in front of test names.
         if test_prefix is None:
             if 'PDK_TESTPREFIX' in os.environ:
@@ -118,7 +166,7 @@ class reporter(object):
 
             # if we have setdefault set, we are overriding any defaults
             # that may already be in the file.
-            self.report_file.write("\n\nSTART\n")
+            self.write("\n\nSTART\n")
 
             # test_run - required
             #   what the user provided, else PDK_TESTRUN, else 'default'
@@ -173,7 +221,7 @@ class reporter(object):
                 self.write_field('context', context)
 
             # this saves the default values
-            self.report_file.write("SETDEFAULT\n")
+            self.write("SETDEFAULT\n")
 
         # end if setdefault
 
@@ -199,8 +247,7 @@ class reporter(object):
             if status == 'P':
                 if not self.report_view_verbose:
                     return
-            self.report_file.write(self.report_view_sep)
-            self.report_file.write('\n')
+            self.write(self.report_view_sep + '\n')
 
         if test_name is None:
             test_name = self.test_prefix
@@ -237,22 +284,30 @@ class reporter(object):
 
             if log is not None:
                 self.write_field('log', log)
-            self.report_file.write('END\n')
+            self.write('END\n')
         else:
-            self.report_file.write(log)
+            self.write(log)
 
-        # You would think we don't need this, but in practice sometimes
-        # python C extensions will core dump the whole python interpreter.
-        # In that case, this gets as much of our output as possible.
-        self.report_file.flush()
+        # You would think we don't need to flush in sync mode, but in
+        # practice sometimes python C extensions will core dump the whole
+        # python interpreter.  In that case, this gets as much of our
+        # output as possible.
+        if self.sync or self.buffer_len >= buffer_bytes or \
+                time.time() - self.buffer_time >= buffer_seconds:
+            self.flush()
 
     # see ticket #51
     def start(self, test_name, tda={}):
         self.test_name = test_name
         self.tda = tda
         self.start_time = datetime.datetime.now()
+        self.start_rusage = rusage.snapshot()
 
     def finish(self, status, tra={}, log=None):
+        # the resources the test used, unless the test reported its own
+        d = rusage.tra(self.start_rusage)
+        d.update(tra)
+        tra = d
         self.report(
             test_name=self.test_name,
             status=status,
@@ -267,16 +322,32 @@ class reporter(object):
         if '\n' in value:
             if value.endswith('\n'):
                 value = value[:-1]
-            self.report_file.write('%s:\n' % name)
-            for x in value.split('\n'):
-                self.report_file.write('.%s\n' % x)
-            self.report_file.write('\n')
+            # every line of a multi-line value begins with '.'
+            self.write('%s:\n.%s\n\n' % (name, value.replace('\n', '\n.')))
         else:
-            self.report_file.write('%s=%s\n' % (name, value))
+            self.write('%s=%s\n' % (name, value))
+
+    def write(self, text):
+        # collect text for the log file; flush() writes it
+        self.buffer.append(text)
+        self.buffer_len += len(text)
+
+    def flush(self):
+        # write all the complete records we have to the log file
+        if self.report_file is None:
+            return
+        if self.buffer:
+            self.report_file.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffer_len = 0
+        self.report_file.flush()
+        self.buffer_time = time.time()
 
     def close(self):
+        self.flush()
         self.report_file.close()
         self.report_file = None
+        open_reporters.discard(self)
 
 ###
 # capture stdout/stderr for later
@@ -502,8 +573,9 @@ class _pycode_with(object):
             [x for x in runner_minipyt.currently_running_test_name if x]
         )
 
-        # When we started.
+        # When we started, and what resources we had used by then.
         self.start_time = datetime.datetime.now()
+        self.start_rusage = rusage.snapshot()
 
         # capture stdout
         snarf_stdout()
@@ -554,12 +626,16 @@ class _pycode_with(object):
         if runner_minipyt.dots_mode:
             runner_minipyt.show_dot(status, self.full_name, log)
 
+        # the resources the test used, unless the test reported its own
+        tra = rusage.tra(self.start_rusage)
+        tra.update(self.tra)
+
         # write the report.
         self.rpt.report(test_name=self.full_name,
                         status=status,
                         start_time=self.start_time,
                         end_time=datetime.datetime.now(),
-                        tra=self.tra,
+                        tra=tra,
                         tda=self.tda,
                         log=log,
                         location=self.location)
@@ -39,6 +39,7 @@ if tuple(int(i) for i in pytest.__version__.split('.')) < (2, 2, 0):
 
 # pycode contains an object that writes properly formatted pdk log records
 import pandokia.helpers.pycode
+import pandokia.helpers.rusage
 
 # basically a C struct
 
@@ -248,16 +249,8 @@ def trim_filename(name):
     return os.path.join(*l)
 
 
-def pytest_runtest_setup(item):
-    if not enabled:
-        return
-
-    # a pandokia-specific place to store our data
-    item.pandokia = data_item()
-
-    tty.write("runtest_setup\n")
-
-    # compute the name of this test, save it for when we need it:
+def pdk_test_name(item):
+    # the name that pandokia knows a test by
 
     # the name of the test is the name of the file the test is in ...
     filename = item.location[0]
@@ -289,12 +282,42 @@ def pytest_runtest_setup(item):
         else:
             name = '%s%s' % (state['pdktestprefix'], name)
 
-    # remember the name for later
-    item.pandokia.name = name
+    return name
+
+##########
+# after the tests are collected
+#
+# With --collectonly, no test gets to pytest_runtest_setup, so this is
+# where we report the tests.  This is how "pdk run" finds out what tests
+# are in a disabled file.
+
+
+def pytest_collection_modifyitems(session, config, items):
+    if not enabled or not config.getvalue('collectonly'):
+        return
+    for item in items:
+        state['report'].report(test_name=pdk_test_name(item), status='D')
+
+
+##########
+
+
+def pytest_runtest_setup(item):
+    if not enabled:
+        return
+
+    # a pandokia-specific place to store our data
+    item.pandokia = data_item()
+
+    tty.write("runtest_setup\n")
+
+    # compute the name of this test, save it for when we need it
+    item.pandokia.name = pdk_test_name(item)
 
     # grab the stdout/stderr
     pandokia.helpers.pycode.snarf_stdout()
     item.pandokia.start_time = time.time()
+    item.pandokia.start_rusage = pandokia.helpers.rusage.snapshot()
 
     # set up a timeout, if necessary )
     if 'timeout' in item.keywords:
@@ -499,8 +522,11 @@ def pytest_runtest_makereport(__multicall__, item, call):
         else:
             tty.write("NO TIMEOUT TO CLEAR\n")
 
-        # Now we are finally finished; note the time.
+        # Now we are finally finished; note the time and the resources
+        # the test used.
         item.pandokia.end_time = time.time()
+        tra = pandokia.helpers.rusage.tra(item.pandokia.start_rusage)
+        tra.update(item.pandokia.tra)
 
         # pick up the logged stdout
         log = pandokia.helpers.pycode.end_snarf_stdout()
@@ -523,7 +549,7 @@ def pytest_runtest_makereport(__multicall__, item, call):
             start_time=pdktimestamp(item.pandokia.start_time),
             end_time=pdktimestamp(item.pandokia.end_time),
             tda=item.pandokia.tda,
-            tra=item.pandokia.tra,
+            tra=tra,
             log=log,
         )
 
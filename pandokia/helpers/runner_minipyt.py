@@ -10,6 +10,7 @@ import time
 import gc
 import copy
 import collections
+import tempfile
 
 # In python 2.6 and later, this prevents writing the .pyc files on import.
 # I normally don't want the .pyc files cluttering up the test directories.
@@ -51,6 +52,7 @@ dots_file = sys.stdout
 
 # the pycode helper contains an object that writes pandokia report files
 import pandokia.helpers.pycode as pycode
+import pandokia.helpers.rusage as rusage
 
 # there has to be a better way than this to get the type
 # of a function.
@@ -121,7 +123,15 @@ def show_dot(status, name, log):
 # Generate the report record for a single test.
 
 
-def gen_report(rpt, name, status, start_time, end_time, tda, tra, log):
+def gen_report(rpt, name, status, start_time, end_time, tda, tra, log,
+               start_rusage=None):
+
+    # the resources the test used since start_rusage, unless the
+    # test reported its own
+    if start_rusage is not None:
+        d = rusage.tra(start_rusage)
+        d.update(tra)
+        tra = d
 
     # write the report (yes, tra first)
     rpt.report(name, status, start_time, end_time, tra, tda, log)
@@ -163,6 +173,7 @@ def run_test_function(rpt, mod, name, ob):
 
     # run the test
     start_time = time.time()
+    start_rusage = rusage.snapshot()
 
     #
     disable = getattr(ob, '__disable__', False)
@@ -199,7 +210,107 @@ def run_test_function(rpt, mod, name, ob):
     log = pycode.end_snarf_stdout()
 
     # write a report the the pandokia log file
-    gen_report(rpt, name, status, start_time, end_time, mod.tda, mod.tra, log)
+    gen_report(rpt, name, status, start_time, end_time, mod.tda, mod.tra, log,
+               start_rusage)
+
+
+####
+# run test functions in forked processes
+####
+
+# If the module sets minipyt_parallel = n (n > 1), the test functions
+# in it (not the classes) run in up to n child processes at once, one
+# child for each test.  Each child starts as a copy of this process
+# after the module setUp(), so the tests see what setUp() did, but
+# nothing that one test changes is seen by another.
+#
+# A child writes its report in to a temp file instead of the log.  When
+# all of the tests are done, we copy the reports in to our own reporter
+# in the order of the tests, so the log looks the same as if we had run
+# them one at a time.  If a child dies without making a report (say, a
+# C extension dumped core), we report the test as an error.
+
+
+def run_parallel(rpt, mod, tests, n):
+    # anything we have buffered would be written again by each child
+    rpt.flush()
+    dots_file.flush()
+
+    # the temp file for each test, and how each child exited
+    files = [None] * len(tests)
+    exit_status = [None] * len(tests)
+
+    running = {}
+    next_test = 0
+    while next_test < len(tests) or running:
+
+        # start as many tests as we have room for
+        while next_test < len(tests) and len(running) < n:
+            name, ob = tests[next_test]
+            f = tempfile.TemporaryFile('w+')
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    rpt.report_file = f
+                    run_test_function(rpt, mod, name, ob)
+                    pycode.flush_all()
+                    status = 0
+                finally:
+                    # os._exit() does not show the exception or flush
+                    # anything, so an error in minipyt itself would
+                    # just disappear.
+                    if status != 0:
+                        traceback.print_exc(file=sys.__stderr__)
+                        sys.__stderr__.flush()
+                    os._exit(status)
+            files[next_test] = f
+            running[pid] = next_test
+            next_test += 1
+
+        # wait for at least one to finish.  We only wait for our own
+        # children; os.wait() would also reap a process that the test
+        # module started, and then whoever started it could not get
+        # its exit status.
+        while not _reap(running, exit_status):
+            time.sleep(0.05)
+
+    for i, (name, ob) in enumerate(tests):
+        f = files[i]
+        f.seek(0)
+        report = f.read()
+        f.close()
+        if report:
+            rpt.write(report)
+            continue
+        status = exit_status[i]
+        if status is None:
+            why = 'test process exited'
+        elif os.WIFSIGNALED(status):
+            why = 'test process killed by signal %d' % os.WTERMSIG(status)
+        else:
+            why = 'test process exit status %d' % os.WEXITSTATUS(status)
+        currently_running_test_name.append(name)
+        gen_report(rpt, name, 'E', None, None, {}, {'exception': why},
+                   why + ' without reporting a result\n')
+
+    rpt.flush()
+
+
+def _reap(running, exit_status):
+    # collect the exit status of each process in running (pid -> index
+    # in exit_status) that has finished.  Returns True if any had.
+    done = False
+    for pid in list(running):
+        try:
+            p, status = os.waitpid(pid, os.WNOHANG)
+        except OSError:
+            # somebody else reaped it; we do not know how it exited
+            p, status = pid, None
+        if p == pid:
+            exit_status[running.pop(pid)] = status
+            done = True
+    return done
 
 
 ####
@@ -278,6 +389,7 @@ def run_test_method(name, class_ob, f_name, f_ob, rpt):
     pycode.snarf_stdout()
 
     fn_start_time = time.time()
+    fn_start_rusage = rusage.snapshot()
 
     # clear the test attributes
     class_ob.tda = {}
@@ -345,7 +457,8 @@ def run_test_method(name, class_ob, f_name, f_ob, rpt):
         fn_end_time,
         tda,
         tra,
-        fn_log)
+        fn_log,
+        fn_start_rusage)
 
 
 # run the tests in a single instance of a test object
@@ -357,6 +470,7 @@ def run_test_class_single(rpt, mod, name, ob, test_order):
 
     pycode.snarf_stdout()
     class_start_time = time.time()
+    class_start_rusage = rusage.snapshot()
 
     class_status = 'P'
     exception_str = None
@@ -435,7 +549,8 @@ def run_test_class_single(rpt, mod, name, ob, test_order):
         class_end_time,
         tda,
         tra,
-        class_log)
+        class_log,
+        class_start_rusage)
 
 # run tests, fresh object for each test
 
@@ -447,6 +562,7 @@ def run_test_class_multiple(rpt, mod, name, ob, test_order):
 
     pycode.snarf_stdout()
     class_start_time = time.time()
+    class_start_rusage = rusage.snapshot()
 
     print("MULTIPLE")
     class_status = 'P'
@@ -524,7 +640,8 @@ def run_test_class_multiple(rpt, mod, name, ob, test_order):
         class_end_time,
         tda,
         tra,
-        class_log)
+        class_log,
+        class_start_rusage)
 
 
 # There is a test name that corresponds to the whole class.  This gathers any
@@ -615,6 +732,7 @@ def process_file(filename, test_name=None, test_args=None):
 
     #
     file_start_time = time.time()
+    file_start_rusage = rusage.snapshot()
     file_status = 'P'
 
     # make sure we can import from the directory where the file is
@@ -700,6 +818,12 @@ def process_file(filename, test_name=None, test_args=None):
 
         sort_test_list(l, test_order)
 
+        # run the test functions n at a time in child processes?
+        parallel = getattr(module, 'minipyt_parallel', 0)
+        if not hasattr(os, 'fork'):
+            parallel = 0
+        parallel_tests = []
+
         for x in l:
             name, ob = x
 
@@ -714,11 +838,19 @@ def process_file(filename, test_name=None, test_args=None):
             # call the appropriate runner
             if isinstance(ob, function):
                 print('function %s as %s' % (name, rname))
-                run_test_function(rpt, module, rname, ob)
+                if parallel > 1:
+                    parallel_tests.append((rname, ob))
+                else:
+                    run_test_function(rpt, module, rname, ob)
             else:
                 print('class %s as %s' % (name, rname))
                 run_test_class(rpt, module, name, ob, test_order)
 
+        if parallel_tests:
+            print('%d functions in %d processes' %
+                  (len(parallel_tests), parallel))
+            run_parallel(rpt, module, parallel_tests, parallel)
+
         # look for a pycode function - call it if necessary
         #
         # pycode functions are obsolete, but we're keeping this until
@@ -787,7 +919,8 @@ def process_file(filename, test_name=None, test_args=None):
         file_end_time,
         tda,
         tra,
-        log)
+        log,
+        file_start_rusage)
 
     rpt.close()
 
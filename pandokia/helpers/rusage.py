@@ -0,0 +1,128 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# resource accounting for tests
+#
+# The runners take a snapshot() when a test starts and call tra(snap)
+# when it finishes.  tra() returns a dict of the resources the test
+# used, ready to be added to the tra dict of the test result:
+#
+#   rusage_cpu_user     user CPU seconds used by the test
+#   rusage_cpu_sys      system CPU seconds used by the test
+#   rusage_max_rss_kb   peak resident memory of the process, in KB, at
+#                       the end of the test.  The peak never goes down,
+#                       so the test that makes it go up is your memory hog.
+#   rusage_read_bytes   bytes read from storage by the test
+#   rusage_write_bytes  bytes written to storage by the test
+#   rusage_child_cpu    CPU seconds (user+sys) used by child processes
+#                       that the test started and waited for
+#   rusage_child_rss_kb peak resident memory of the largest of those
+#                       child processes, if it is larger than any before
+#
+# All of the names start with rusage_ so that you can pick them out of
+# the tra columns in the summary page.  Values that are zero are not
+# reported, except for the CPU times.
+#
+# The numbers come from getrusage(), which includes everything the
+# process did while the test was running -- if your tests run in
+# threads, they will share the blame.  The I/O counts are blocks from
+# getrusage, so they only count what actually went to the disk, not
+# what was served from the cache.
+#
+# On systems without the resource module (Windows), snapshot() returns
+# None and tra() returns an empty dict.
+#
+
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ru_maxrss is in KB on linux, but in bytes on Mac OS X
+if sys.platform == 'darwin':
+    maxrss_divisor = 1024
+else:
+    maxrss_divisor = 1
+
+# getrusage counts I/O in 512 byte blocks
+block_size = 512
+
+
+def snapshot():
+    '''return the resource usage so far, for passing to tra() later'''
+    if resource is None:
+        return None
+    return (resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN))
+
+
+def tra(start, end=None):
+    '''return a dict of the resources used between two snapshots
+
+    start
+        a value returned by snapshot() when the test started
+
+    end
+        a value returned by snapshot() when the test finished; if None,
+        take a new snapshot now
+    '''
+    if start is None:
+        return {}
+    if end is None:
+        end = snapshot()
+
+    s_self, s_child = start
+    e_self, e_child = end
+
+    d = rusage_tra(e_self, s_self)
+
+    child_cpu = (e_child.ru_utime - s_child.ru_utime) + \
+        (e_child.ru_stime - s_child.ru_stime)
+    if child_cpu > 0:
+        d['rusage_child_cpu'] = '%.3f' % child_cpu
+
+    # getrusage only tells us the largest child ever, so we can only
+    # blame the test that made it larger
+    if e_child.ru_maxrss > s_child.ru_maxrss:
+        d['rusage_child_rss_kb'] = e_child.ru_maxrss // maxrss_divisor
+
+    return d
+
+
+def rusage_tra(ru, before=None):
+    '''return the tra dict for one getrusage() result
+
+    ru
+        a resource.struct_rusage, as returned by getrusage() or os.wait4()
+
+    before
+        if not None, an earlier struct_rusage to subtract from ru
+    '''
+    if before is None:
+        cpu_user = ru.ru_utime
+        cpu_sys = ru.ru_stime
+        read_blocks = ru.ru_inblock
+        write_blocks = ru.ru_oublock
+    else:
+        cpu_user = ru.ru_utime - before.ru_utime
+        cpu_sys = ru.ru_stime - before.ru_stime
+        read_blocks = ru.ru_inblock - before.ru_inblock
+        write_blocks = ru.ru_oublock - before.ru_oublock
+
+    d = {
+        'rusage_cpu_user': '%.3f' % cpu_user,
+        'rusage_cpu_sys': '%.3f' % cpu_sys,
+    }
+    if ru.ru_maxrss > 0:
+        d['rusage_max_rss_kb'] = ru.ru_maxrss // maxrss_divisor
+    if read_blocks > 0:
+        d['rusage_read_bytes'] = read_blocks * block_size
+    if write_blocks > 0:
+        d['rusage_write_bytes'] = write_blocks * block_size
+    return d
+
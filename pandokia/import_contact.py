@@ -25,58 +25,58 @@ debug = 0
 
 
 def run():
-    prev_project = None
 
-    # read all the lines and then sort them.  this ensures that
-    # all lines related to a single project are together.
-    ll = []
+    # Read all the lines and group them by project.  Each project is
+    # replaced in its own transaction, so we only hold the database
+    # for one project at a time.
+    projects = {}
     for line in sys.stdin:
-        ll.append(line)
-
-    ll.sort()
-
-    # iterate over the sorted lines
-
-    for line in ll:
-        line = line.strip().split(",")
+        line = line.strip()
+        if line == '':
+            continue
+        line = line.split(",")
         if debug:
             print("LINE=%s" % line)
         project = line[0]
         prefix = line[1]
         email = line[2]
-
-        if project != prev_project:
-            # commit when we move on to the next project
-            pdk_db.commit()
-            # When we start a project, purge all the entries from the table.
-            # We then construct all the entries for that project.
-            if debug:
-                print("DELETE %s" % project)
-            pdk_db.execute(
-                "DELETE FROM contact WHERE project = :1 ", (project,))
-            prev_project = project
-
+        l = projects.setdefault(project, [])
         if email == '':
-            # if email is blank, there is nothing useful to insert.  We still wanted
-            # to clear the project from the table, though.
+            # if email is blank, there is nothing useful to insert.  We
+            # still want to clear the project from the table, though.
             continue
+        if (prefix, email) not in l:
+            l.append((prefix, email))
 
-        # find all the tests that match the prefix; write a record for each of
-        # them
+    for project in sorted(projects):
+
+        # When we start a project, purge all the entries from the table.
+        # We then construct all the entries for that project.
         if debug:
-            print("QUERY PREFIX %s" % prefix)
-        c = pdk_db.execute(
-            "SELECT DISTINCT test_name FROM expected WHERE project = :1 AND test_name LIKE :2 ",
-            (project,
-             prefix + "%"))
-        for test_name in c:
-            (test_name, ) = test_name
+            print("DELETE %s" % project)
+        pdk_db.start_write_batch()
+        pdk_db.execute(
+            "DELETE FROM contact WHERE project = :1 ", (project,))
+
+        # For each prefix, find all the tests that match and write a
+        # record for each of them, in one statement.  A test that
+        # matches more than one prefix with the same contact only gets
+        # one record.
+        for prefix, email in sorted(projects[project]):
             if debug:
-                print("INSERT %s %s %s" % (project, test_name, email))
+                print("INSERT PREFIX %s %s" % (prefix, email))
             pdk_db.execute(
-                "INSERT INTO contact ( project, test_name, email ) VALUES ( :1, :2, :3 )",
+                """INSERT INTO contact ( project, test_name, email )
+                SELECT :1, test_name, :3
+                FROM ( SELECT DISTINCT test_name FROM expected
+                    WHERE project = :1 AND test_name LIKE :2 ) AS t
+                WHERE NOT EXISTS ( SELECT 1 FROM contact
+                    WHERE contact.project = :1
+                    AND contact.test_name = t.test_name
+                    AND contact.email = :3 )""",
                 (project,
-                 test_name,
+                 prefix + "%",
                  email))
 
-    pdk_db.commit()
+        # commit when we move on to the next project
+        pdk_db.commit()
@@ -7,6 +7,8 @@ import re
 import sys
 import pandokia.common as common
 import pandokia
+import pandokia.test_name_tree as test_name_tree
+import pandokia.test_identity as test_identity
 
 try:
     import io as StringIO
@@ -26,15 +28,34 @@ all_test_run = dict()
 all_test_runs = dict()
 
 
-def read_records(filename):
+def read_records(filename, share_defaults=True):
+    # filename may also be an open file-like object, such as the
+    # makefile() of a socket connection.
+    #
+    # Normally the SETDEFAULT values carry over from one file to the next
+    # (they are kept in the module global default_record).  A caller that
+    # reads several independent streams at the same time (the ingest
+    # daemon) passes share_defaults=False so each stream keeps its own.
+    #
+    # Each call counts its own lines; the ingest daemon runs one of these
+    # in each of several threads.  With share_defaults, we are the one
+    # "pdk import" is reading, so the module global line_count follows
+    # along for the messages about the records.
     global line_count, exit_status, default_record, debug
 
+    lineno = 0
     found_any = 0
-    result = default_record.copy()
+    if share_defaults:
+        defaults = default_record
+    else:
+        defaults = dict()
+    result = defaults.copy()
     parsing_name = ''
     parsing_log = False
 
-    if filename == '-':
+    if hasattr(filename, 'readline'):
+        data_source = filename
+    elif filename == '-':
         data_source = sys.stdin
     else:
         data_source = open(filename, 'r')
@@ -45,12 +66,20 @@ def read_records(filename):
         # We are forced to read the file line-by-line because invalid unicode
         # cannot be try/excepted in a "for thing in enumerate(data)" style for-loop delaration.
         while True:
-            line_count += 1
+            lineno += 1
+            if share_defaults:
+                line_count = lineno
 
             try:
                 line = data.readline()
             except UnicodeDecodeError as e:
-                linear_offset = data.tell()
+                try:
+                    linear_offset = data.tell()
+                except (IOError, OSError, ValueError):
+                    # a socket (the ingest daemon) has no offset
+                    print('Unicode Error: {} near line {:d}'.format(
+                          e.reason, lineno))
+                    continue
                 print('Unicode Error: {} near offset {linear_offset:d} [{linear_offset:x}h]'.format(
                       e.reason, linear_offset=linear_offset))
                 continue
@@ -58,19 +87,19 @@ def read_records(filename):
 
             if parsing_log:
                 if debug:
-                    print('debug: {:d}: ingesting log data: {}'.format(line_count, line.strip()))
+                    print('debug: {:d}: ingesting log data: {}'.format(lineno, line.strip()))
 
                 name = parsing_name
 
                 if line == "\n" or line == "\r\n":
                     if debug:
-                        print('debug: {:d}: End of log data'.format(line_count))
+                        print('debug: {:d}: End of log data'.format(lineno))
                     parsing_log = False
                     continue
 
                 if not line.startswith('.'):
                     print('Invalid input @ {:d}: '
-                            'Missing prefix character in multi-line: {}'.format(line_count, name, line.strip()))
+                            'Missing prefix character in multi-line: {}'.format(lineno, name, line.strip()))
                     exit_status = 1
                     parsing_log = False
                     continue
@@ -84,7 +113,7 @@ def read_records(filename):
 
             if line.startswith('#'):
                 if debug:
-                    print('debug: {:d}: skipping comment'.format(line_count))
+                    print('debug: {:d}: skipping comment'.format(lineno))
                 continue
 
             # When we see data but don't find an END marker
@@ -92,7 +121,7 @@ def read_records(filename):
             if not line:
                 if found_any:
                     print('Invalid input @ {:d}: '
-                          'Missing "END"'.format(line_count))
+                          'Missing "END"'.format(lineno))
                     exit_status = 1
                     found_any = 0
                     yield result
@@ -108,10 +137,10 @@ def read_records(filename):
             # END of record marker?
             if line == 'END':
                 if debug:
-                    print('debug: {:d}: END found'.format(line_count))
+                    print('debug: {:d}: END found'.format(lineno))
                 if found_any:
                     yield result
-                    result = default_record.copy()
+                    result = defaults.copy()
                 continue
 
             # Save new default record
@@ -119,22 +148,26 @@ def read_records(filename):
             # default
             if line == 'SETDEFAULT':
                 if debug:
-                    print('debug: {:d}: SETDEFAULT found'.format(line_count))
+                    print('debug: {:d}: SETDEFAULT found'.format(lineno))
                 if 'test_name' in result:
                     s = 'Invalid input @ {:d}: ' \
-                        'test_name in SETDEFAULT {:s}'.format(line_count, name)
+                        'test_name in SETDEFAULT {:s}'.format(lineno, name)
                     raise Exception(s)
 
-                default_record = result.copy()
+                defaults = result.copy()
+                if share_defaults:
+                    default_record = defaults
                 continue
 
             # Only happens at the start of a run - anything that came
             # earlier should be forgotten
             if line == 'START':
                 if debug:
-                    print('debug: {:d}: START found'.format(line_count))
+                    print('debug: {:d}: START found'.format(lineno))
                 result = dict()
-                default_record = dict()
+                defaults = dict()
+                if share_defaults:
+                    default_record = defaults
                 found_any = 0
                 continue
 
@@ -149,7 +182,7 @@ def read_records(filename):
                     value = ''.join(rec[1:])
 
                 if debug:
-                    print('debug: {:d}: Generated key-pair from "{:s}"'.format(line_count, line))
+                    print('debug: {:d}: Generated key-pair from "{:s}"'.format(lineno, line))
                 result[name] = value
                 found_any = 1
                 continue
@@ -160,7 +193,7 @@ def read_records(filename):
             #   .value
             if not line.startswith('.') and line.endswith(':'):
                 if debug:
-                    print('debug: {:d}: Checking for log data'.format(line_count))
+                    print('debug: {:d}: Checking for log data'.format(lineno))
                 # Split on delimiter, removing empty records
                 rec = [x for x in line.split(':', 1) if x]
                 elements = len(rec)
@@ -168,11 +201,11 @@ def read_records(filename):
 
                 if elements > 1:
                     print('Invalid input @ {:d}: '
-                          'Data after colon in "{:s}"'.format(line_count, line))
+                          'Data after colon in "{:s}"'.format(lineno, line))
                     exit_status = 1
 
                 if debug:
-                    print('debug: {:d}: Parsing log'.format(line_count))
+                    print('debug: {:d}: Parsing log'.format(lineno))
                 found_any += 1
                 result[name] = ''
                 parsing_name = name
@@ -180,7 +213,7 @@ def read_records(filename):
                 continue
 
             # Handle the unlikely event of not finding any valid input.
-            print('Invalid input @ {:d}: Unrecognized line {:s}'.format(line_count, line))
+            print('Invalid input @ {:d}: Unrecognized line {:s}'.format(lineno, line))
             exit_status = 1
 
 
@@ -263,31 +296,32 @@ class test_result(object):
         else:
             okf = 'F'
         if key_id:
-            ss = 'key_id, '
-            ss1 = ', :13'
-            parm = [key_id]
+            cols = [('key_id', key_id)]
         else:
-            parm = []
-            ss = ''
-            ss1 = ''
-        parm += [self.test_run,
-                 self.host,
-                 self.project,
-                 self.test_name,
-                 self.context,
-                 self.status,
-                 self.start_time,
-                 self.end_time,
-                 self.location,
-                 self.attn,
-                 self.test_runner,
-                 okf]
-        return db.execute(
-            "INSERT INTO result_scalar ( %s test_run, host, project, test_name, context, status, start_time, end_time, location, attn, test_runner, has_okfile ) values "
-            " ( :1, :2, :3, :4, :5, :6, :7, :8, :9, :10, :11, :12 %s )" %
-            (ss, ss1), parm)
-
-    def insert(self, db):
+            cols = []
+        cols += [('test_run', self.test_run),
+                 ('host', self.host),
+                 ('project', self.project),
+                 ('test_name', self.test_name),
+                 ('context', self.context),
+                 ('status', self.status),
+                 ('start_time', self.start_time),
+                 ('end_time', self.end_time),
+                 ('location', self.location),
+                 ('attn', self.attn),
+                 ('test_runner', self.test_runner),
+                 ('has_okfile', okf)]
+        return test_identity.insert_result(db, cols)
+
+    def insert(self, db, commit=True):
+        # With commit=False, the caller is batching several records into
+        # one transaction.  We do not commit, and we do not try to recover
+        # from an IntegrityError (that needs a rollback, which would throw
+        # away the rest of the caller's batch); the caller gets the
+        # exception and decides what to do.  The caller is also responsible
+        # for note_test_run() after it commits, for calling check_tables()
+        # before it starts, and for calling forget_uncommitted() if it
+        # rolls back.
 
         global insert_count
 
@@ -313,6 +347,11 @@ class test_result(object):
         # but use the value in the input record if there is one
         self.attn = self._lookup("attn", self.attn)
 
+        # find out what tables we have to maintain; with commit=False,
+        # the caller has to do this before it starts
+        if commit:
+            check_tables(db)
+
         # if this database engine does not have a usable auto-increment
         # field, get a key_id from the sequence in the database
         if db.next:
@@ -327,12 +366,14 @@ class test_result(object):
             insert_count += 1
 
         except db.IntegrityError as e:
+            if not commit:
+                raise
             db.rollback()
             # if it is already there, look it up - if it is status 'M' then we are just now receiving
             # a record for a test marked missing.  delete the one that is 'M'
             # and insert it.
             c = db.execute(
-                "select status from result_scalar where "
+                "select key_id from result_scalar where "
                 "test_run = :1 and host = :2 and context = :3 and project = :4 and test_name = :5 and status = 'M'",
                 (self.test_run,
                  self.host,
@@ -342,18 +383,16 @@ class test_result(object):
             x = c.fetchone()
             if x is not None:
                 db.execute(
-                    "delete from result_scalar where "
-                    "test_run = :1 and host = :2 and context = :3 and project = :4 and test_name = :5 and status = 'M'",
-                    (self.test_run,
-                     self.host,
-                     self.context,
-                     self.project,
-                     self.test_name))
+                    "delete from %s where key_id = :1" %
+                    test_identity.result_table(db), (x[0], ))
                 res = self.try_insert(db, key_id)
                 insert_count += 1
             else:
                 raise e
 
+        # the index of the test name hierarchy for the treewalk
+        test_name_tree.add(db, self.test_run, self.test_name)
+
         for x in self.tda:
             db.execute(
                 "INSERT INTO result_tda ( key_id, name, value ) values ( :1, :2, :3 )",
@@ -381,22 +420,105 @@ class test_result(object):
         db.execute("INSERT INTO result_log ( key_id, log ) values ( :1, :2 )",
                    (key_id, self.log))
 
+        if not commit:
+            return
+
         db.commit()
 
-        if self.test_run not in all_test_runs:
-            # if we don't know about this test run,
+        note_test_run(db, self.test_run)
+
+
+def insert_batch(db, batch):
+    '''insert a list of test_result objects in one transaction
+
+    Returns two lists: the ones that were inserted and the ones that
+    were already in the database.  If anything in the batch is already
+    there, the transaction is rolled back and the records are inserted
+    one at a time, which sorts out duplicates and replaces 'M' records.
+    '''
+    global insert_count
+
+    count = insert_count
+    check_tables(db)
+    try:
+        db.start_write_batch()
+        for rx in batch:
+            rx.insert(db, commit=False)
+        db.commit()
+        inserted = batch
+        skipped = []
+
+    except db.IntegrityError:
+        db.rollback()
+        forget_uncommitted()
+        insert_count = count
+        inserted = []
+        skipped = []
+        for rx in batch:
             try:
-                # add it to the list of known test runs
-                db.execute(
-                    "INSERT INTO distinct_test_run ( test_run, valuable ) VALUES ( :1, 0 )",
-                    (self.test_run,
-                     ))
-                db.commit()
+                rx.insert(db)
+                inserted.append(rx)
             except db.IntegrityError:
                 db.rollback()
-            # remember that we saw it so we don't have to touch the database
-            # again
-            all_test_runs[self.test_run] = 1
+                skipped.append(rx)
+
+    for rx in inserted:
+        note_test_run(db, rx.test_run)
+
+    return inserted, skipped
+
+
+def check_tables(db):
+    # Find out which optional tables the database has.  This may have to
+    # roll back a failed query, so do it when nothing is uncommitted.
+    test_name_tree.have_table(db)
+    test_identity.normalized(db)
+
+
+def forget_uncommitted():
+    # After a rollback, the caches of what is in the database are wrong.
+    test_name_tree.forget()
+    test_identity.forget()
+
+
+def note_test_run(db, test_run):
+    if test_run not in all_test_runs:
+        # if we don't know about this test run,
+        try:
+            # add it to the list of known test runs
+            db.execute(
+                "INSERT INTO distinct_test_run ( test_run, valuable ) VALUES ( :1, 0 )",
+                (test_run,
+                 ))
+            db.commit()
+        except db.IntegrityError:
+            db.rollback()
+        # remember that we saw it so we don't have to touch the database
+        # again
+        all_test_runs[test_run] = 1
+
+
+def fix_record(x):
+    # clean up the odd things that some runners write in a record.
+    # returns false if the record cannot be imported at all.
+
+    # bug: remove this when the old nose plugin is no longer running
+    # around
+    if "name" in x:
+        x["test_name"] = x["name"]
+        del x["name"]
+
+    #
+    if 'test_name' not in x:
+        # should not happen, but don't want to let it kill the import
+        print("warning: no test name on line: %4d" % line_count)
+        print("   %s" % [zz for zz in x])
+        return False
+
+    if x["test_name"].endswith(".xml") or x["test_name"].endswith(".log"):
+        x["test_name"] = x["test_name"][:-4]
+
+    return True
 
 
 def run(argv, hack_callback=None):
@@ -410,6 +532,8 @@ def run(argv, hack_callback=None):
     parser.add_argument('-p', '--project')
     parser.add_argument('--test-runner')
     parser.add_argument('--test-run')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='insert this many records in each transaction')
     parser.add_argument('filename', nargs='*', default=[sys.stdin])
     args = parser.parse_args(argv)
 
@@ -423,6 +547,18 @@ def run(argv, hack_callback=None):
     quiet = args.quiet
     debug = args.debug
 
+    batch = []
+
+    def flush_batch():
+        inserted, skipped = insert_batch(pdk_db, batch)
+        if not quiet:
+            for rx in inserted:
+                print('Imported: {}'.format(rx.test_name))
+            for rx in skipped:
+                print('Skipped: {}'.format(rx.test_name))
+        del batch[:]
+        return len(skipped)
+
     for handle in args.filename:
         if not quiet:
             print("FILE: %s" % handle)
@@ -444,22 +580,9 @@ def run(argv, hack_callback=None):
             if "test_runner" not in x:
                 x["test_runner"] = args.test_runner
 
-            # bug: remove this when the old nose plugin is no longer running
-            # around
-            if "name" in x:
-                x["test_name"] = x["name"]
-                del x["name"]
-
-            #
-            if 'test_name' not in x:
-                # should not happen, but don't want to let it kill the import
-                print("warning: no test name on line: %4d" % line_count)
-                print("   %s" % [zz for zz in x])
+            if not fix_record(x):
                 continue
 
-            if x["test_name"].endswith(".xml") or x["test_name"].endswith(".log"):
-                x["test_name"] = x["test_name"][:-4]
-
             rx = test_result(x)
 
             # the hack_callback allows us to insert something to modify the
@@ -469,6 +592,12 @@ def run(argv, hack_callback=None):
                 if not hack_callback(rx):
                     continue
 
+            if args.batch > 1:
+                batch.append(rx)
+                if len(batch) >= args.batch:
+                    duplicate_count += flush_batch()
+                continue
+
             try:
                 rx.insert(pdk_db)
                 if not quiet:
@@ -482,6 +611,9 @@ def run(argv, hack_callback=None):
 
             pdk_db.commit()
 
+        if batch:
+            duplicate_count += flush_batch()
+
     result_str = '{:d} records inserted'.format(insert_count)
     if duplicate_count:
         result_str += ' ({:d} skipped)'.format(duplicate_count)
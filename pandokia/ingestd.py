@@ -0,0 +1,276 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# pdk ingestd - long-running daemon that receives pdk log records over
+# a unix socket and inserts them into the database as they arrive.
+#
+# The test runners find the daemon through PDK_INGEST (see
+# pandokia/helpers/ingest.py for the client side).  Each connection
+# carries ordinary pdk log text; we parse it with the same code that
+# "pdk import" uses and insert the records with the same test_result
+# object, so a record means the same thing whichever way it arrives.
+#
+# Structure:
+#
+#   - one thread per connection reads records and puts them on a
+#     bounded queue.  When the queue is full, the put() blocks, we stop
+#     reading the socket, and the clients eventually block in send().
+#     That is the backpressure.  A client that waits too long gives up
+#     and spills to its log file.
+#
+#   - one writer thread takes records off the queue and inserts them
+#     in batches, one transaction per batch.  It is the only thread
+#     that touches the database.
+#
+#   - if the database refuses a batch for some reason other than a
+#     duplicate record, the records are appended to the spill file in
+#     pdk log format, so you can "pdk import" them later.
+#
+
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import pandokia
+import pandokia.import_data as import_data
+
+helpstr = '''
+pdk ingestd [ options ]
+
+Listen on a unix socket for pdk log records and insert them into the
+database as they arrive.  Test runners send to the daemon when
+PDK_INGEST contains the name of the socket.
+
+--socket NAME
+    the unix socket to listen on; default is PDK_INGEST
+
+--batch N
+    insert up to N records per transaction; default 200
+
+--interval SECONDS
+    do not hold a partial batch longer than this; default 2
+
+--queue N
+    how many records may be waiting to be inserted before the
+    clients have to wait; default 10000
+
+--spill FILE
+    where to write records that could not be inserted; default
+    is the socket name + ".spill"
+
+-q / --quiet
+    do not report each batch
+'''
+
+# the queue of records waiting for the writer thread
+record_queue = None
+
+# how the writer thread behaves; set by run()
+batch_size = 200
+batch_interval = 2.0
+spill_filename = None
+quiet = False
+
+# counters, for the report at exit
+count_inserted = 0
+count_skipped = 0
+count_spilled = 0
+
+
+class ingest_handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # makefile('r') is a text file, which is what read_records
+        # expects.  The client sends utf-8.  A decode error would lose
+        # everything in the buffer, not just one line, so a bad byte
+        # becomes U+FFFD in its own field instead.
+        try:
+            f = self.request.makefile('r', encoding='utf-8', errors='replace')
+        except TypeError:
+            # python 2 reads bytes, which do not have this problem
+            f = self.request.makefile('r')
+        for x in import_data.read_records(f, share_defaults=False):
+            if not import_data.fix_record(x):
+                continue
+            # same as "pdk import" without --test-runner
+            if 'test_runner' not in x:
+                x['test_runner'] = None
+            record_queue.put(x)
+
+
+class ingest_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def writer():
+    # the only thread that uses the database
+    db = pandokia.cfg.pdk_db
+    import_data.check_tables(db)
+
+    while True:
+        x = record_queue.get()
+        if x is None:
+            return
+        batch = [x]
+
+        # collect more until the batch is full or we have been holding
+        # it long enough
+        deadline = time.time() + batch_interval
+        while len(batch) < batch_size:
+            t = deadline - time.time()
+            if t <= 0:
+                break
+            try:
+                x = record_queue.get(timeout=t)
+            except queue.Empty:
+                break
+            if x is None:
+                insert_batch(db, batch)
+                return
+            batch.append(x)
+
+        insert_batch(db, batch)
+
+
+def insert_batch(db, batch):
+    # The same as "pdk import --batch": import_data.insert_batch sorts
+    # out duplicates and 'M' records.  What only the daemon does is
+    # keep the records when the database will not take them at all.
+    global count_inserted, count_skipped
+
+    try:
+        inserted, skipped = import_data.insert_batch(
+            db, [import_data.test_result(x) for x in batch])
+
+    except db.DatabaseError as e:
+        # If this happened part way through inserting one at a time,
+        # some of the batch may be in the database already; "pdk import"
+        # of the spill file skips those as duplicates.
+        print("ingestd: database error: %s" % e)
+        db.rollback_or_reconnect()
+        import_data.forget_uncommitted()
+        spill(batch)
+        return
+
+    count_inserted += len(inserted)
+    count_skipped += len(skipped)
+    if not quiet:
+        print("ingestd: %d inserted, %d skipped" %
+              (len(inserted), len(skipped)))
+        sys.stdout.flush()
+
+
+def spill(batch):
+    # write the records to the spill file in pdk log format.  Every
+    # record has all of its fields (the defaults were already merged
+    # in when we parsed it), so we do not need a SETDEFAULT block.
+    global count_spilled
+    f = open(spill_filename, "a")
+    for x in batch:
+        for name in x:
+            # None is "not given" (test_runner, for one); if we wrote it,
+            # it would come back as the string "None"
+            if x[name] is None:
+                continue
+            value = str(x[name])
+            if '\n' in value:
+                # read_records keeps a multi-line value as it was in
+                # the log: every line still begins with '.'
+                f.write('%s:\n%s\n' % (name, value))
+            else:
+                f.write('%s=%s\n' % (name, value))
+        f.write('END\n')
+    f.close()
+    count_spilled += len(batch)
+    print("ingestd: %d records spilled to %s" % (len(batch), spill_filename))
+
+
+def terminate(sig, frame):
+    raise KeyboardInterrupt()
+
+
+def run(args):
+    global record_queue, batch_size, batch_interval, spill_filename, quiet
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='pdk ingestd', usage=helpstr)
+    parser.add_argument('--socket', default=os.environ.get('PDK_INGEST'))
+    parser.add_argument('--batch', type=int, default=batch_size)
+    parser.add_argument('--interval', type=float, default=batch_interval)
+    parser.add_argument('--queue', type=int, default=10000)
+    parser.add_argument('--spill')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(args)
+
+    if args.socket is None:
+        sys.stderr.write("pdk ingestd: need --socket or PDK_INGEST\n")
+        return 1
+
+    socket_name = os.path.abspath(args.socket)
+    batch_size = max(args.batch, 1)
+    batch_interval = args.interval
+    spill_filename = args.spill or (socket_name + '.spill')
+    quiet = args.quiet
+    record_queue = queue.Queue(args.queue)
+
+    # a socket left behind by a daemon that crashed; but if a daemon is
+    # listening on it, it is not ours to take
+    if os.path.exists(socket_name):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(socket_name)
+        except socket.error as e:
+            if e.errno != errno.ECONNREFUSED:
+                sys.stderr.write("pdk ingestd: %s: %s\n" % (socket_name, e))
+                return 1
+            os.unlink(socket_name)
+        else:
+            sys.stderr.write("pdk ingestd: another daemon is listening on %s\n"
+                             % socket_name)
+            return 1
+        finally:
+            s.close()
+
+    server = ingest_server(socket_name, ingest_handler)
+
+    w = threading.Thread(target=writer)
+    w.start()
+
+    # treat SIGTERM like ^C so we drain the queue before we exit
+    signal.signal(signal.SIGTERM, terminate)
+
+    print("ingestd: listening on %s" % socket_name)
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    # stop accepting new connections, then let the writer finish
+    # whatever is already queued
+    server.server_close()
+    os.unlink(socket_name)
+    record_queue.put(None)
+    w.join()
+
+    print("ingestd: %d inserted, %d skipped, %d spilled" %
+          (count_inserted, count_skipped, count_spilled))
+    return 0
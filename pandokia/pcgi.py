@@ -20,6 +20,10 @@ import pandokia.common as common
 
 cfg = pandokia.cfg
 
+# the query types that only report on the database; with read replicas,
+# they read from a replica.  (Also every day_report.*)
+replica_queries = ('treewalk', 'summary', 'detail', 'test_history')
+
 
 ##########
 #
@@ -100,6 +104,17 @@ def run():
     else:
         output_format = "html"
 
+    ######
+    #
+    # time the database statements, if the config asks for it.  The
+    # handlers all sys.exit() when they are done, so the footer goes out
+    # when the process exits.
+
+    import pandokia.querylog
+    if pandokia.querylog.enable_from_config() and cfg.debug and output_format == 'html':
+        import atexit
+        atexit.register(querylog_footer)
+
     ######
     #
     # if we don't have a query field, show the top-level menu and we are done.
@@ -136,6 +151,18 @@ def run():
 
     query = form["query"].value
 
+    # The report pages read from a replica, if the config names any.
+    # If one of them writes (e.g. the summary notes when the qid was
+    # used), it uses the primary from then on.
+    if query in replica_queries or query.startswith('day_report.'):
+        qid = None
+        if 'qid' in form:
+            try:
+                qid = int(form['qid'].value)
+            except ValueError:
+                pass
+        common.use_replica(qid)
+
     if query == "treewalk":
         import pandokia.pcgi_treewalk as x
         x.treewalk()
@@ -262,6 +289,12 @@ def run():
 #
 
 
+def querylog_footer():
+    import pandokia.querylog
+    sys.stdout.write(pandokia.querylog.timer.html())
+    sys.stdout.flush()
+
+
 def error_1201():
     sys.stdout.write(
         "content-type: text/html\n\n\n<font color=red><blink>1201</blink></font>\n")
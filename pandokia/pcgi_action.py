@@ -15,6 +15,7 @@ import pandokia
 import pandokia.text_table as text_table
 import pandokia.pcgi
 import pandokia.flagok
+import pandokia.test_identity
 from . import common
 
 pdk_db = pandokia.cfg.pdk_db
@@ -57,9 +58,7 @@ def run():
 
     if 'action_remove' in form:
         qid = copy_qid(qid)
-        for key_id in valid_key_ids(form):
-            pdk_db.execute(
-                'DELETE FROM query WHERE qid = :1 AND key_id = :2 ', (qid, key_id))
+        remove_key_ids(qid, valid_key_ids(form))
         pdk_db.commit()
 
     if ('action_cattn' in form) or ('action_sattn' in form):
@@ -67,19 +66,22 @@ def run():
             value = 'N'
         else:
             value = 'Y'
-        for key_id in valid_key_ids(form):
-            pdk_db.execute(
-                "UPDATE result_scalar SET attn = :1 WHERE key_id = :2 ", (value, key_id))
+        pdk_db.execute_key_ids(
+            "UPDATE " + pandokia.test_identity.result_table(pdk_db) +
+            " SET attn = :1 WHERE key_id IN ( %s )",
+            valid_key_ids(form), (value,))
         pdk_db.commit()
 
     elif 'action_keep' in form:
-        qid = copy_qid(qid)
-        c = pdk_db.execute('SELECT key_id FROM query WHERE qid = :1 ', (qid,))
-        for key_id, in c:
-            if not str(key_id) in form:
-                pdk_db.execute(
-                    'DELETE FROM query WHERE qid = :1 AND key_id = :2 ', (qid, key_id))
+        # Instead of copying the whole qid and deleting everything that
+        # is not selected, the new qid gets only the selected tests that
+        # were in the old one.
+        new_qid = empty_qid()
+        pdk_db.execute_key_ids(
+            "INSERT INTO query ( qid, key_id ) SELECT :1, key_id FROM query WHERE qid = :2 AND key_id IN ( %s )",
+            valid_key_ids(form), (new_qid, qid))
         pdk_db.commit()
+        qid = new_qid
 
     elif ('action_flagok' in form) or ('action_flagok_rem' in form):
         qid = copy_qid(qid)
@@ -111,10 +113,8 @@ def run():
         pandokia.flagok.commit()
 
         if 'action_flagok_rem' in form:
-            # copy of 'remove' above - expedient for the moment
-            for key_id in valid_key_ids(form):
-                pdk_db.execute(
-                    'DELETE FROM query WHERE qid = :1 AND key_id = :2 ', (qid, key_id))
+            # same as 'remove' above
+            remove_key_ids(qid, valid_key_ids(form))
             pdk_db.commit()
 
     elif 'not_expected' in form:
@@ -226,6 +226,11 @@ def run():
         print(form)
 
     if qid is not None:
+        # With read replicas, the summary page reads this qid from the
+        # primary until the change has had time to reach the replicas.
+        common.qid_changed(qid)
+        pdk_db.commit()
+
         if text_present:
             output.write(
                 "<a href='" +
@@ -253,11 +258,14 @@ def run():
         output.write("<br>Hit BACK and RELOAD\n")
 
 
-def copy_qid(old_qid):
-    now = time.time()
-    c = pdk_db.execute("INSERT INTO query_id ( time ) VALUES ( :1 ) ", (now,))
-    new_qid = c.lastrowid
+def empty_qid():
+    new_qid = common.new_qid()
     pdk_db.commit()
+    return new_qid
+
+
+def copy_qid(old_qid):
+    new_qid = empty_qid()
 
     s = "INSERT INTO query ( qid, key_id ) SELECT %d, key_id FROM query WHERE qid = %d" % (
         new_qid, old_qid)
@@ -267,6 +275,13 @@ def copy_qid(old_qid):
     return new_qid
 
 
+def remove_key_ids(qid, key_ids):
+    # remove a list of tests from a qid; does not commit
+    pdk_db.execute_key_ids(
+        "DELETE FROM query WHERE qid = :1 AND key_id IN ( %s )",
+        key_ids, (qid,))
+
+
 def valid_key_ids(form):
     l = []
     for key_id in form:
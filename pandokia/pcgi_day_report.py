@@ -30,6 +30,10 @@ import pandokia.pcgi
 #
 
 
+# the test runs that we can make a day report for
+runs_sql = "SELECT test_run, valuable, record_count, note, min_time, max_time FROM distinct_test_run %s ORDER BY test_run DESC "
+
+
 def rpt1():
 
     form = pandokia.pcgi.form
@@ -48,7 +52,7 @@ def rpt1():
 
     # c = db.execute("SELECT DISTINCT test_run FROM result_scalar WHERE test_run GLOB ? ORDER BY test_run DESC ",( test_run,))
     where_str, where_dict = pdk_db.where_dict([('test_run', test_run)])
-    sql = "SELECT test_run, valuable, record_count, note, min_time, max_time FROM distinct_test_run %s ORDER BY test_run DESC " % where_str
+    sql = runs_sql % where_str
     c = pdk_db.execute(sql, where_dict)
 
     table = text_table.text_table()
@@ -352,6 +356,12 @@ def rpt2():
 #   #   #   #   #   #   #   #   #   #
 
 
+# the project/host/context rows of the day report, and the count of
+# each status in each row
+hosts_sql = "SELECT DISTINCT project, host, context FROM result_scalar %s ORDER BY project, host, context "
+count_sql = "SELECT COUNT(*) FROM result_scalar WHERE  test_run = :1 AND project = :2 AND host = :3 AND status = :4 AND context = :5 %s"
+
+
 def gen_daily_table(
         test_run,
         projects,
@@ -418,8 +428,7 @@ def gen_daily_table(
     hc_where, hc_where_dict = pdk_db.where_dict(
         [('test_run', test_run), ('project', projects), ('context', query_context), ('host', query_host)])
     c = pdk_db.execute(
-        "SELECT DISTINCT project, host, context FROM result_scalar %s ORDER BY project, host, context " %
-        hc_where, hc_where_dict)
+        hosts_sql % hc_where, hc_where_dict)
 
     if chronic:
         chronic_str = "AND ( chronic = '0' or chronic IS NULL )"
@@ -520,8 +529,8 @@ def gen_daily_table(
             # use "or chronic is null" until we update the database for the new
             # schema.
             c1 = pdk_db.execute(
-                "SELECT COUNT(*) FROM result_scalar WHERE  test_run = :1 AND project = :2 AND host = :3 AND status = :4 AND context = :5 %s" %
-                (chronic_str, ), (test_run, project, host, status, context))
+                count_sql % (chronic_str, ),
+                (test_run, project, host, status, context))
             (x,) = c1.fetchone()
             total_results += x
             project_sum[status] += x
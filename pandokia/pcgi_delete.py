@@ -15,6 +15,7 @@ import pandokia.cleaner as cleaner
 
 import pandokia
 import pandokia.common as common
+import pandokia.test_name_tree
 
 pdk_db = pandokia.cfg.pdk_db
 
@@ -118,9 +119,13 @@ def delete_confirmed():
 
         if project == '*' and context == '*' and host == '*':
             print("delete from index")
+            pandokia.test_name_tree.delete(pdk_db, test_run)
             pdk_db.execute(
                 "DELETE FROM distinct_test_run WHERE test_run = :1", (test_run,))
             pdk_db.commit()
+        else:
+            # the treewalk index may list names that are not there any more
+            pandokia.test_name_tree.rebuild(pdk_db, test_run)
 
         print("done.")
 
@@ -148,6 +148,9 @@ def next_prev(d_in, test_run):
     return tmp
 
 
+log_sql = "SELECT log FROM result_log WHERE key_id = :1 "
+
+
 def do_result(key_id):
 
     c = pdk_db.execute(
@@ -300,7 +303,7 @@ def do_result(key_id):
         for y in c1:
             (name, value) = y
             tb.set_value(row, 0, "tra_" + name)
-            tb.set_value(row, 1, value)
+            tb.set_value(row, 1, value, html=tra_html(name, value))
             row += 1
 
         sys.stdout.write(tb.get_html())
@@ -316,8 +319,7 @@ def do_result(key_id):
                 linkback_dict,
                 linkmode='test_history'))
 
-        c1 = pdk_db.execute(
-            "SELECT log FROM result_log WHERE key_id = :1 ", (key_id, ))
+        c1 = pdk_db.execute(log_sql, (key_id, ))
 
         for y in c1:
             (y, ) = y
@@ -346,6 +348,34 @@ def do_result(key_id):
     return result_count
 
 
+# Show memory and I/O sizes from the resource accounting (see
+# pandokia/helpers/rusage.py) in a form people can read.  Other tra
+# values are shown as they are.
+def tra_html(name, value):
+    if name.endswith('_kb'):
+        scale = 1024
+    elif name.startswith('rusage_') and name.endswith('_bytes'):
+        scale = 1
+    else:
+        return None
+    try:
+        n = float(value) * scale
+    except (TypeError, ValueError):
+        return None
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if n < 1024:
+            break
+        n = n / 1024
+    else:
+        unit = 'TB'
+    if unit == 'bytes':
+        return '%s (%d bytes)' % (value, n)
+    return '%s (%.1f %s)' % (value, n, unit)
+
+
+history_sql = "SELECT test_run, status, key_id FROM result_scalar WHERE test_name = :1 AND context = :2 AND host = :3 AND project = :4 ORDER BY test_run DESC"
+
+
 def test_history():
 
     sys.stdout.write(common.cgi_header_html)
@@ -388,8 +418,7 @@ def test_history():
     tb.set_html_table_attributes("border=1")
 
     c = pdk_db.execute(
-        "SELECT test_run, status, key_id FROM result_scalar WHERE "
-        "test_name = :1 AND context = :2 AND host = :3 AND project = :4 ORDER BY test_run DESC",
+        history_sql,
         (test_name,
          context,
          host,
@@ -429,8 +458,7 @@ def magic_html_log():
     key_id = int(form['magic_html_log'].value)
 
     # get it
-    c1 = pdk_db.execute(
-        "SELECT log FROM result_log WHERE key_id = :1 ", (key_id, ))
+    c1 = pdk_db.execute(log_sql, (key_id, ))
 
     # fetch the log
     log, = c1.fetchone()
@@ -20,6 +20,7 @@ pdk_db = pandokia.cfg.pdk_db
 import pandokia.text_table as text_table
 import pandokia.pcgi
 import pandokia.flagok
+import pandokia.helpers.dbaccess as dbaccess
 from . import common
 
 
@@ -48,55 +49,35 @@ def run():
         other_qid = int(form['other'].value)
 
     if 'nameremove' in form:
-        #####
-
-        output.write('nameremove operation<br>')
-        c = pdk_db.execute(
-            "SELECT result_scalar.test_name FROM result_scalar, query WHERE query.qid = %d AND query.key_id = result_scalar.key_id " %
-            other_qid)
-        remove_names = []
-        for x, in c:
-            remove_names.append(x)
-
-        remove_key_ids = []
-
-        c = pdk_db.execute(
-            "SELECT query.key_id, result_scalar.test_name  FROM query, result_scalar WHERE query.qid = %d AND query.key_id = result_scalar.key_id" %
-            qid)
-        for key_id, name in c:
-            if name in remove_names:
-                remove_key_ids.append(key_id)
-
-        for key_id in remove_key_ids:
-            pdk_db.execute(
-                "DELETE FROM query WHERE query.qid = %d AND query.key_id = %d" %
-                (qid, key_id))
+        n = dbaccess.qid_identity_difference(
+            qid, other_qid, fields=('test_name',))
+        output.write('nameremove operation: %d removed<br>' % n)
+        change = 1
 
-        pdk_db.commit()
+    if 'identityremove' in form:
+        n = dbaccess.qid_identity_difference(qid, other_qid)
+        output.write('identityremove operation: %d removed<br>' % n)
         change = 1
 
     if 'add' in form:
-        pdk_db.execute(
-            "INSERT INTO query ( qid, key_id ) SELECT %d, key_id FROM query WHERE qid = %d AND key_id NOT IN ( SELECT key_id FROM query WHERE qid = %d )" %
-            (qid, other_qid, qid))
-        pdk_db.commit()
+        n = dbaccess.qid_union(qid, other_qid)
+        output.write('add operation: %d added<br>' % n)
         change = 1
 
     if 'remove' in form:
-        # mysql doesn't like it if you
-        #       DELETE FROM query WHERE ... IN ( SELECT ... FROM query )
-        pdk_db.execute(
-            "CREATE TEMPORARY TABLE IF NOT EXISTS temporary_xyzzy ( key_id INTEGER )")
-        pdk_db.execute(
-            "INSERT INTO temporary_xyzzy ( key_id ) SELECT key_id FROM query WHERE qid = %d " %
-            other_qid)
-        pdk_db.execute(
-            "DELETE FROM query WHERE ( qid = %d ) AND ( key_id IN ( SELECT key_id FROM temporary_xyzzy ) ) " %
-            (qid, ))
-        pdk_db.execute("DELETE FROM temporary_xyzzy")
-        pdk_db.commit()
+        n = dbaccess.qid_difference(qid, other_qid)
+        output.write('remove operation: %d removed<br>' % n)
+        change = 1
+
+    if 'intersect' in form:
+        n = dbaccess.qid_intersection(qid, other_qid)
+        output.write('intersect operation: %d removed<br>' % n)
         change = 1
 
+    if change:
+        common.qid_changed(qid)
+        pdk_db.commit()
+
     if change or 1:
         c = pdk_db.execute(
             "SELECT COUNT(*) FROM query WHERE query.qid = %d" %
@@ -124,11 +105,15 @@ def run():
     output.write('Enter another qid:<br><input type=text name=other><br><br>')
 
     output.write(
-        '<input type=submit name=nameremove value="Remove tests that have the same test_name as tests in the other QID"> <br><br>\n')
+        '<input type=submit name=nameremove value="Remove tests that have the same test_name as tests in the other QID"> <br>\n')
+    output.write(
+        '<input type=submit name=identityremove value="Remove tests that have the same project/host/context/test_name as tests in the other QID"> <br><br>\n')
     output.write(
         '<input type=submit name=add value="Add tests from the other QID by key"> <br>\n')
     output.write(
         '<input type=submit name=remove value="Remove tests that are also in other QID by key"> <br>\n')
+    output.write(
+        '<input type=submit name=intersect value="Remove tests that are not in other QID by key"> <br>\n')
     output.write('</form>')
 
 
@@ -18,6 +18,7 @@ except ImportError:
     from urllib import quote
 
 import pandokia.pcgi
+import pandokia.helpers.dbaccess as dbaccess
 from . import common
 
 import pandokia
@@ -165,19 +166,32 @@ def run():
     #
     sort_query = {}
     for x in input_query:
-        if x != 'sort' and x != 'query':
+        if x not in ('sort', 'query', 'after', 'after_key'):
             sort_query[x] = input_query[x]
 
     sort_link = common.selflink(sort_query, 'summary') + "&sort="
 
-    # Sorting is a little weak right now.  We only generate links to sort
-    # ascending, and we don't draw little arrows or anything.  We really
-    # need for text_table to offer html text for the column heading
-    # instead of just link text.
+    # Clicking on a column heading sorts ascending on that column;
+    # clicking it again sorts descending.  We don't draw little arrows or
+    # anything.  We really need for text_table to offer html text for
+    # the column heading instead of just link text.
+    global current_sort
+    if 'sort' in input_query:
+        current_sort = input_query["sort"][0]
+    else:
+        current_sort = 'Utest_name'
+
+    # The html page shows a big qid a page at a time; the other formats
+    # get all of it.
+    if pandokia.pcgi.output_format == 'html':
+        page = summary_page(input_query, current_sort)
+    else:
+        page = None
 
     # generate the table - used to be written inline here
-    result_table, all_test_run, all_project, all_host, all_context, rowcount, different = get_table(
-        qid, sort_link, cmp_run, cmptype, show_attr)
+    result_table, all_test_run, all_project, all_host, all_context, rowcount, different, next_page = get_table(
+        qid, sort_link, cmp_run, cmptype, show_attr, page,
+        history=(pandokia.pcgi.output_format == 'html'))
 
     # suppressing columns that the user did not ask for
     if 'S' in input_query:
@@ -321,16 +335,16 @@ def run():
             output.write(same_table.get_html())
             output.write("</ul><br>")
 
-        if 'sort' in input_query:
-            sort_order = input_query["sort"][0]
-        else:
-            sort_order = 'Utest_name'
+        sort_order = current_sort
 
         reverse_val = sort_order.startswith("D")
 
-        result_table.set_sort_key(sort_order[1:], float)
+        # if the database sorted the rows, they are already in order;
+        # otherwise, sort them here
+        if page is None or page['column'] is None:
+            result_table.set_sort_key(sort_order[1:], sort_key)
 
-        result_table.sort([sort_order[1:]], reverse=reverse_val)
+            result_table.sort([sort_order[1:]], reverse=reverse_val)
         rows = len(result_table.rows)
         for i in range(0, rows):
             result_table.set_value(i, "line #", i + 1)
@@ -437,7 +451,10 @@ def run():
             '<input type=submit name="not_expected" value="Not Expected"> in <input type=text name=arg1 value="%" size=10> test runs')
         output.write('</form>')
 
-        output.write("<br>rows: %d <br>" % rowcount)
+        if page is None:
+            output.write("<br>rows: %d <br>" % rowcount)
+        else:
+            page_links(qid, input_query, page, rowcount, next_page)
         if cmp_run != "":
             output.write("different: %d <br>" % different)
 
@@ -480,18 +497,194 @@ def run():
 # code to generate the table
 #
 
+# the sort order of the page we are making, as in the sort= cgi parameter
+current_sort = 'Utest_name'
+
+# The columns that the database can sort on, and the result_scalar
+# column for each.  When the summary is sorted on one of these, each
+# page starts where the last one left off in that order.  For the other
+# columns (contact, duration, tda/tra, ...), the pages are in key_id
+# order and each page is sorted by itself.
+sql_sort_columns = {
+    'attn': 'attn',
+    'test_run': 'test_run',
+    'project': 'project',
+    'host': 'host',
+    'context': 'context',
+    'test_name': 'test_name',
+    'stat': 'status',
+    'runner': 'test_runner',
+}
+
+
+def summary_page(input_query, sort):
+    # Which page of the qid to show:
+    #   page_size   rows per page; 0 for all of them
+    #   after       the sort column value of the last row of the page
+    #               before; not there if that value was NULL
+    #   after_key   the key_id of the last row of the page before
+    # Returns None to show the whole qid.
+    size = getattr(pandokia.cfg, 'summary_page_size', 1000)
+    if 'page_size' in input_query:
+        try:
+            size = int(input_query['page_size'][0])
+        except ValueError:
+            pass
+    if size <= 0:
+        return None
+
+    page = {
+        'size': size,
+        'column': sql_sort_columns.get(sort[1:]),
+        'descending': sort.startswith('D'),
+        'after': None,
+        'after_key': None,
+    }
+    if 'after_key' in input_query:
+        try:
+            page['after_key'] = int(input_query['after_key'][0])
+        except ValueError:
+            # start at the first page
+            return page
+        if 'after' in input_query:
+            page['after'] = input_query['after'][0]
+    return page
+
+
+def page_query(qid, page):
+    # The key_ids for one page of the qid, and one more row if there is
+    # one, so the caller knows whether there is a next page.  This is a
+    # keyset page: we ask for the rows that come after the last row of
+    # the previous page in ( sort column, key_id ) order, so the database
+    # does not have to count its way through the pages before this one.
+    #
+    # We compare the column itself, not some expression of it, so the
+    # database can use its index.  A NULL does not compare with
+    # anything, so the rows where the column is NULL are a separate
+    # part of the order; they come before the others, or after them if
+    # we are sorting in descending order.
+    size = page['size'] + 1
+    if page['column'] is None:
+        if page['after_key'] is None:
+            where = ''
+        else:
+            where = 'AND key_id > :after_key'
+        c = pdk_db.execute(
+            "SELECT key_id, key_id FROM query WHERE qid = :qid %s ORDER BY key_id LIMIT %d" %
+            (where, size),
+            {'qid': qid, 'after_key': page['after_key']})
+        return c.fetchall()
+
+    col = "result_scalar.%s" % page['column']
+    if page['descending']:
+        cmp, order = '<', 'DESC'
+        parts = ['value', 'null']
+    else:
+        cmp, order = '>', 'ASC'
+        parts = ['null', 'value']
+
+    # which part the previous page ended in
+    if page['after_key'] is None:
+        start = None
+    elif page['after'] is None:
+        start = 'null'
+    else:
+        start = 'value'
+    if start is not None:
+        parts = parts[parts.index(start):]
+
+    rows = []
+    for part in parts:
+        if part == 'null':
+            where = '%s IS NULL' % col
+            if part == start:
+                where += ' AND query.key_id %s :after_key' % cmp
+            order_by = 'query.key_id %s' % order
+        else:
+            where = '%s IS NOT NULL' % col
+            if part == start:
+                where += ' AND ( %s %s :after OR ( %s = :after AND query.key_id %s :after_key ) )' % (
+                    col, cmp, col, cmp)
+            order_by = '%s %s, query.key_id %s' % (col, order, order)
+        c = pdk_db.execute(
+            "SELECT query.key_id, %s FROM query, result_scalar WHERE query.qid = :qid AND result_scalar.key_id = query.key_id AND %s ORDER BY %s LIMIT %d" %
+            (col, where, order_by, size - len(rows)),
+            {'qid': qid, 'after': page['after'], 'after_key': page['after_key']})
+        rows.extend(c.fetchall())
+        if len(rows) >= size:
+            break
+    return rows
+
+
+def page_links(qid, input_query, page, rowcount, next_page):
+    # the row counts and the links to the other pages
+    c = pdk_db.execute("SELECT COUNT(*) FROM query WHERE qid = :1", (qid,))
+    total, = c.fetchone()
+    output.write("<br>rows on this page: %d of %d in this qid<br>" %
+                 (rowcount, total))
+
+    qdict = input_query.copy()
+    del qdict['query']
+    for x in ('after', 'after_key'):
+        if x in qdict:
+            del qdict[x]
+
+    l = []
+    if page['after_key'] is not None:
+        l.append("<a href='%s'>first page</a>" %
+                 common.selflink(qdict, linkmode="summary"))
+    if next_page is not None:
+        d = qdict.copy()
+        d.update(next_page)
+        l.append("<a href='%s'>next page</a>" %
+                 common.selflink(d, linkmode="summary"))
+    if page['after_key'] is not None or next_page is not None:
+        d = qdict.copy()
+        d['page_size'] = 0
+        l.append("<a href='%s'>all on one page</a>" %
+                 common.selflink(d, linkmode="summary"))
+    if l:
+        output.write(' - '.join(l) + '<br>')
+
+
+def sort_col_link(sort_link, name):
+    # link for the heading of column name: sort up, or down if we
+    # are already sorted up on that column
+    if current_sort == 'U' + name:
+        return sort_link + 'D' + name
+    return sort_link + 'U' + name
+
+
+def sort_key(text):
+    # Numbers sort as numbers, everything else as text.  Blank cells
+    # (like a tra that only some of the tests have) come before all the
+    # numbers, so sorting down on something like tra_rusage_max_rss_kb
+    # puts the biggest ones at the top.
+    try:
+        return (1, float(text), '')
+    except (TypeError, ValueError):
+        if text is None:
+            text = ''
+        return (0, 0, str(text))
+
+
 def load_in_table(tt, row, cursor, prefix, sort_link):
     for x in cursor:
         (name, value) = x
         name = prefix + name
-        # bug: only sorts up - would like it to be up/down depending on what it
-        # was last.
-        tt.define_column(name, link=sort_link + "U" + name)
+        tt.define_column(name, link=sort_col_link(sort_link, name))
         tt.set_value(row, name, value)
         any_attr[name] = 1
 
 
-def get_table(qid, sort_link, cmp_run, cmptype, show_attr):
+# the status of the same test in the run we compare to, and the
+# attributes of a test
+other_status_sql = "SELECT status, key_id FROM result_scalar WHERE test_run = :1 AND project = :2 AND host = :3 AND test_name = :4 AND context = :5"
+tda_sql = "SELECT name, value FROM result_tda WHERE key_id = :1 ORDER BY name ASC"
+tra_sql = "SELECT name, value FROM result_tra WHERE key_id = :1 ORDER BY name ASC"
+
+
+def get_table(qid, sort_link, cmp_run, cmptype, show_attr, page=None, history=False):
 
     #
     # this query finds all the test results that are an interesting part of this request
@@ -506,7 +699,11 @@ def get_table(qid, sort_link, cmp_run, cmptype, show_attr):
     tra_table = text_table.text_table()
     tra_table.set_html_table_attributes("border=1")
 
-    # note when we last touched this qid
+    # note when we last touched this qid.  This does not change the
+    # tests that we show, so if we are reading from a replica, we can
+    # keep doing so after these writes, and it does not count as a
+    # change for common.use_replica().
+    reading_replica = pdk_db.reading_replica
     now = time.time()
     pdk_db.execute("UPDATE query_id SET time = :1 WHERE qid = :2", (now, qid))
 
@@ -517,27 +714,42 @@ def get_table(qid, sort_link, cmp_run, cmptype, show_attr):
         (expires,
          qid))
     pdk_db.commit()
+    if reading_replica:
+        pdk_db.use_replica()
 
-    #
-    c = pdk_db.execute("SELECT key_id FROM query WHERE qid = :1", (qid,))
+    # all of the qid, or one page of it
+    if page is None:
+        c = pdk_db.execute("SELECT key_id, key_id FROM query WHERE qid = :1", (qid,))
+    else:
+        c = page_query(qid, page)
+    next_page = None
+
+    # page_query gives us one row more than the page, if there is one;
+    # the next page starts after the last row of this one
+    if page is not None and len(c) > page['size']:
+        c = c[:page['size']]
+        key_id, sort_value = c[-1]
+        next_page = {'after_key': key_id}
+        if sort_value is not None:
+            next_page['after'] = sort_value
 
     result_table.define_column("line #", showname='&nbsp;')
     result_table.define_column("runner")
     result_table.define_column("checkbox", showname='&nbsp;')
-    result_table.define_column("attn", link=sort_link + "Uattn")
-    result_table.define_column("test_run", link=sort_link + "Utest_run")
-    result_table.define_column("project", link=sort_link + "Uproject")
-    result_table.define_column("host", link=sort_link + "Uhost")
-    result_table.define_column("context", link=sort_link + "Ucontext")
-    result_table.define_column("test_name", link=sort_link + "Utest_name")
-    result_table.define_column("contact", link=sort_link + "Ucontact")
+    result_table.define_column("attn", link=sort_col_link(sort_link, "attn"))
+    result_table.define_column("test_run", link=sort_col_link(sort_link, "test_run"))
+    result_table.define_column("project", link=sort_col_link(sort_link, "project"))
+    result_table.define_column("host", link=sort_col_link(sort_link, "host"))
+    result_table.define_column("context", link=sort_col_link(sort_link, "context"))
+    result_table.define_column("test_name", link=sort_col_link(sort_link, "test_name"))
+    result_table.define_column("contact", link=sort_col_link(sort_link, "contact"))
     #result_table.define_column("start",     link=sort_link+"Ustart")
-    result_table.define_column("duration", link=sort_link + "Uduration")
+    result_table.define_column("duration", link=sort_col_link(sort_link, "duration"))
     if cmp_run != "":
-        result_table.define_column("diff", link=sort_link + "Udiff")
-        result_table.define_column("other", link=sort_link + "Uother")
+        result_table.define_column("diff", link=sort_col_link(sort_link, "diff"))
+        result_table.define_column("other", link=sort_col_link(sort_link, "other"))
 
-    result_table.define_column("stat", link=sort_link + "Ustat")
+    result_table.define_column("stat", link=sort_col_link(sort_link, "stat"))
 
     # these are used to suppress a column when all the results are the same
     all_test_run = {}
@@ -545,10 +757,13 @@ def get_table(qid, sort_link, cmp_run, cmptype, show_attr):
     all_host = {}
     all_context = {}
 
+    # ( row, test_run, identity ) for the history strip
+    history_rows = []
+
     different = 0
     rowcount = 0
     for x in c:
-        (key_id, ) = x
+        (key_id, sort_value) = x
 
         #
         # find the result of this test
@@ -573,7 +788,7 @@ def get_table(qid, sort_link, cmp_run, cmptype, show_attr):
         # suppress lines that are different - should be optional
         if cmp_run != "":
             c2 = pdk_db.execute(
-                "SELECT status, key_id FROM result_scalar WHERE test_run = :1 AND project = :2 AND host = :3 AND test_name = :4 AND context = :5",
+                other_status_sql,
                 (cmp_run,
                  project,
                  host,
@@ -661,29 +876,71 @@ def get_table(qid, sort_link, cmp_run, cmptype, show_attr):
                 link=this_link)
 
         if show_attr:
-            c3 = pdk_db.execute(
-                "SELECT name, value FROM result_tda WHERE key_id = :1 ORDER BY name ASC",
-                (key_id,
-                 ))
+            c3 = pdk_db.execute(tda_sql, (key_id, ))
             load_in_table(tda_table, rowcount, c3, "tda_", sort_link)
             del c3
 
-            c3 = pdk_db.execute(
-                "SELECT name, value FROM result_tra WHERE key_id = :1 ORDER BY name ASC",
-                (key_id,
-                 ))
+            c3 = pdk_db.execute(tra_sql, (key_id, ))
             load_in_table(tra_table, rowcount, c3, "tra_", sort_link)
             del c3
 
+        history_rows.append(
+            (rowcount, test_run, (project, host, context, test_name)))
+
         rowcount += 1
 
         del c1
 
+    if history:
+        history_strip(result_table, history_rows)
+
     if show_attr:
         result_table.join(tda_table)
         result_table.join(tra_table)
 
-    return result_table, all_test_run, all_project, all_host, all_context, rowcount, different
+    return result_table, all_test_run, all_project, all_host, all_context, rowcount, different, next_page
+
+
+def history_strip(result_table, rows):
+    # The history column: the status of each test in the last few runs
+    # of its recurring test run (daily_..., etc), oldest first and
+    # ending with this one.  '.' means the test was not in that run.
+    # One batch of queries for each test run on the page, instead of
+    # one query for each test in each run.
+    nruns = getattr(pandokia.cfg, 'summary_history_runs', 10)
+    if nruns <= 0:
+        return
+
+    by_run = {}
+    for row, test_run, identity in rows:
+        by_run.setdefault(test_run, []).append((row, identity))
+
+    for test_run in sorted(by_run):
+        prefix = common.recurring_test_run(test_run)
+        if prefix is None:
+            continue
+        runs = dbaccess.recent_test_runs(prefix, nruns, before=test_run)
+        h = dbaccess.status_history([x[1] for x in by_run[test_run]], runs)
+
+        result_table.define_column("history")
+        for row, identity in by_run[test_run]:
+            d = h[identity]
+            text = []
+            html = []
+            for r in runs:
+                if r not in d:
+                    text.append('.')
+                    html.append('.')
+                    continue
+                status, key_id = d[r]
+                text.append(status)
+                if status != 'P':
+                    status = '<font color=red>%s</font>' % status
+                html.append("<a href='%s' title='%s'>%s</a>" % (
+                    common.selflink({'key_id': key_id}, linkmode="detail"),
+                    cgi.escape(r, True), status))
+            result_table.set_value(row, "history", text=''.join(text),
+                                   html='<tt>%s</tt>' % ''.join(html))
 
 
 def suppress_attr_all_same(result_table, column_select_values=set({})):
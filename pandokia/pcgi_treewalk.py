@@ -22,6 +22,7 @@ pdk_db = pandokia.cfg.pdk_db
 
 import pandokia.text_table as text_table
 import pandokia.pcgi
+import pandokia.test_name_tree as test_name_tree
 from . import common
 
 
@@ -467,20 +468,7 @@ def linkout():
 
     # create a new qid - this is the identity of a list of test results
 
-    now = time.time()
-    expire = now + common.cfg.default_qid_expire_days * 86400
-
-    if pdk_db.next:
-        newqid = pdk_db.next('sequence_qid')
-        c = pdk_db.execute(
-            "INSERT INTO query_id ( qid, time, expires ) VALUES ( :1, :2, :3 ) ",
-            (newqid,
-             now,
-             expire))
-    else:
-        c = pdk_db.execute(
-            "INSERT INTO query_id ( time, expires ) VALUES ( :1, :2 ) ", (now, expire))
-        newqid = c.lastrowid
+    newqid = common.new_qid()
 
     print("content-type: text/plain\n")
     print("QID %d" % newqid)
@@ -504,30 +492,24 @@ def linkout():
         ('attn', attn),
     ], more_where=more_where)
 
-    if oldqid is None:
-        c1 = pdk_db.execute(
-            "SELECT key_id FROM result_scalar " +
-            where_text,
-            where_dict)
-    else:
-        c1 = pdk_db.execute(
-            "SELECT result_scalar.key_id FROM result_scalar, query %s" %
-            where_text, where_dict)
-
-    a = []
-    for x in c1:
-        (key_id, ) = x
-        a.append(key_id)
-
     # Enter the test results with the current qid, then redirect to
     # displaying the qid.  That will get the user the list of all tests.
+    #
+    # The database copies the key_ids from result_scalar to query in
+    # one statement; with tens of thousands of tests, fetching them
+    # here and inserting them one at a time takes a very long time.
 
     # (This used to link directly to the detail display if there was only one,
     # but that makes the checkboxes unavailable in that case.)
 
-    for key_id in a:
+    if oldqid is None:
+        pdk_db.execute(
+            "INSERT INTO query ( qid, key_id ) SELECT %d, key_id FROM result_scalar %s" %
+            (newqid, where_text), where_dict)
+    else:
         pdk_db.execute(
-            "INSERT INTO query ( qid, key_id ) VALUES ( :1, :2 ) ", (newqid, key_id))
+            "INSERT INTO query ( qid, key_id ) SELECT %d, result_scalar.key_id FROM result_scalar, query %s" %
+            (newqid, where_text), where_dict)
     pdk_db.commit()
 
     url = pandokia.pcgi.cginame + ('?query=summary&qid=%s' % newqid)
@@ -561,6 +543,9 @@ def query_to_where_tuple(query, fields, more_where=None):
     return pdk_db.where_dict(l, more_where=more_where)
 
 
+prefixes_sql = "SELECT DISTINCT test_name FROM result_scalar %s GROUP BY test_name ORDER BY test_name"
+
+
 def collect_prefixes(query):
     #
     # first, make a list of the unique prefixes.  This is one of the most
@@ -570,6 +555,12 @@ def collect_prefixes(query):
     #
     test_name = query['test_name']
 
+    # If we are only looking at one test run, the test_name_tree index
+    # can probably answer without looking at all those records.
+    l = tree_index_prefixes(query)
+    if l is not None:
+        return l
+
     have_qid = 'qid' in query
     if have_qid:
         qid = int(query['qid'])
@@ -581,9 +572,7 @@ def collect_prefixes(query):
         query, ('test_name', 'test_run', 'project', 'host', 'context', 'status', 'attn'), more_where)
 
     if not have_qid:
-        c = pdk_db.execute(
-            "SELECT DISTINCT test_name FROM result_scalar %s GROUP BY test_name ORDER BY test_name" %
-            where_text, where_dict)
+        c = pdk_db.execute(prefixes_sql % where_text, where_dict)
     else:
         sys.stdout.flush()
         c = pdk_db.execute(
@@ -619,6 +608,38 @@ def collect_prefixes(query):
     return prefixes
 
 
+def tree_index_prefixes(query):
+    # The same list as collect_prefixes(), from the test_name_tree
+    # index.  It only knows the names in each test run, so we can only
+    # use it when the query selects all of one test run below a prefix
+    # of the test name.  Returns None if we cannot use it.
+    if 'qid' in query:
+        return None
+
+    for x in ('project', 'host', 'context', 'status', 'attn'):
+        if query.get(x, '*') not in ('*', '%', None):
+            return None
+
+    test_run = query['test_run']
+    if test_run is None:
+        return None
+    for x in '*%[]':
+        if x in test_run:
+            return None
+
+    # test_name has to be a prefix that ends at a level, followed by *
+    test_name = query['test_name']
+    if not test_name.endswith('*'):
+        return None
+    parent = test_name[:-1]
+    if '*' in parent or '%' in parent:
+        return None
+    if parent != '' and parent[-1] not in '/.':
+        return None
+
+    return test_name_tree.children(pdk_db, test_run, parent)
+
+
 def collect_table(prefixes, query, always_link):
     #
     # make the actual table to display
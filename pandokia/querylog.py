@@ -0,0 +1,359 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# Timing of database statements
+#
+# When the config has query_timing = True, every statement that goes
+# through PandokiaDB.execute() is timed.  Statements are collected by
+# their text with the literal values replaced by '?', so the same query
+# with different parameters (or a different qid pasted into it) counts
+# as one statement.  For each statement, we keep
+#
+#   calls       how many times it was executed
+#   total       seconds spent executing it and fetching the results
+#   max         seconds for the slowest call
+#   rows        number of rows fetched from it
+#
+# This is one set of numbers per process, which in the CGI is one web
+# request.
+#
+# Where the numbers go:
+#
+#   - In the CGI, if debug is on, they are shown in a collapsed section
+#     at the bottom of each html page.
+#
+#   - If the config has query_log set to a file name, one line of JSON
+#     is appended to that file when the process exits.  When the file
+#     gets bigger than query_log_max_bytes, it is renamed to name.1
+#     (replacing any old one) and a new file is started.  "pdk querylog"
+#     adds up the numbers from the files.
+#
+# With query_timing off (the default), the database drivers do not do
+# any of this.
+#
+
+import sys
+import os
+import re
+import time
+import json
+import atexit
+
+import pandokia
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+
+# literals in statement text, so the same query counts as one statement.
+# A number that is part of a name (result_tda) or a parameter (:1) is
+# not a literal.
+re_literal = re.compile(r"'(?:[^']|'')*'|(?<![\w:.])[0-9]+(?:\.[0-9]+)?")
+re_in_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+re_space = re.compile(r"\s+")
+
+
+def normalize(statement):
+    '''the statement text with the values taken out'''
+    s = re_literal.sub('?', statement)
+    s = re_in_list.sub('( ... )', s)
+    return re_space.sub(' ', s).strip()
+
+
+class timed_cursor(object):
+
+    '''
+    a cursor that adds the time spent fetching, and the number of rows
+    fetched, to the numbers for its statement.  Everything else is
+    passed through to the real cursor.
+    '''
+
+    def __init__(self, cursor, stat):
+        self._cursor = cursor
+        self._stat = stat
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _count(self, start, rows):
+        self._stat.add_fetch(time.time() - start, rows)
+
+    def fetchone(self):
+        start = time.time()
+        x = self._cursor.fetchone()
+        self._count(start, x is not None)
+        return x
+
+    def fetchall(self):
+        start = time.time()
+        x = self._cursor.fetchall()
+        self._count(start, len(x))
+        return x
+
+    def fetchmany(self, *args):
+        start = time.time()
+        x = self._cursor.fetchmany(*args)
+        self._count(start, len(x))
+        return x
+
+    def __iter__(self):
+        while True:
+            x = self.fetchone()
+            if x is None:
+                return
+            yield x
+
+
+class statement_stat(object):
+
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        # the time of the call that is still fetching, for max
+        self.last = 0.0
+
+    def add_call(self, t):
+        self.calls += 1
+        self.total += t
+        self.last = t
+        if t > self.max:
+            self.max = t
+
+    def add_fetch(self, t, rows):
+        self.total += t
+        self.rows += rows
+        self.last += t
+        if self.last > self.max:
+            self.max = self.last
+
+    def as_dict(self):
+        return {
+            'sql': self.text,
+            'calls': self.calls,
+            'total_ms': round(self.total * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'rows': self.rows,
+        }
+
+
+class query_timer(object):
+
+    '''
+    collects the numbers for one process.  The database drivers call
+    execute() instead of executing the statement on the cursor
+    themselves.
+    '''
+
+    def __init__(self):
+        self.start = time.time()
+        self.stats = {}
+
+    def execute(self, cursor, statement, parameters, text=None):
+        # text is the statement as the caller wrote it, if the driver
+        # changed the parameter format
+        text = normalize(text or statement)
+        stat = self.stats.get(text)
+        if stat is None:
+            stat = self.stats[text] = statement_stat(text)
+        start = time.time()
+        try:
+            cursor.execute(statement, parameters)
+        finally:
+            stat.add_call(time.time() - start)
+        return timed_cursor(cursor, stat)
+
+    def sorted_stats(self):
+        l = list(self.stats.values())
+        l.sort(key=lambda x: -x.total)
+        return l
+
+    def totals(self):
+        calls = 0
+        total = 0.0
+        for x in self.stats.values():
+            calls += x.calls
+            total += x.total
+        return calls, total
+
+    def html(self):
+        '''the collapsible footer for a CGI page'''
+        calls, total = self.totals()
+        l = []
+        l.append('<details><summary>%d database statements, %.1f ms</summary>\n' %
+                 (calls, total * 1000))
+        l.append('<table border=1>\n')
+        l.append(
+            '<tr><th>calls</th><th>total ms</th><th>max ms</th><th>rows</th><th>statement</th></tr>\n')
+        for x in self.sorted_stats():
+            l.append('<tr><td>%d</td><td>%.2f</td><td>%.2f</td><td>%d</td><td>%s</td></tr>\n' %
+                     (x.calls, x.total * 1000, x.max * 1000, x.rows, escape(x.text)))
+        l.append('</table></details>\n')
+        return ''.join(l)
+
+    def record(self):
+        '''the line of JSON for the query log'''
+        calls, total = self.totals()
+        d = {
+            'time': self.start,
+            'elapsed_ms': round((time.time() - self.start) * 1000, 3),
+            'pid': os.getpid(),
+            'calls': calls,
+            'total_ms': round(total * 1000, 3),
+            'statements': [x.as_dict() for x in self.sorted_stats()],
+        }
+        if 'QUERY_STRING' in os.environ:
+            d['request'] = os.environ['QUERY_STRING']
+        else:
+            d['request'] = ' '.join(sys.argv)
+        return json.dumps(d, sort_keys=True)
+
+
+# the timer for this process, if query timing is on
+timer = None
+
+
+def enable(db=None):
+    '''start timing the statements executed on db (default: the pdk_db)'''
+    global timer
+    if db is None:
+        db = pandokia.cfg.pdk_db
+    if timer is None:
+        timer = query_timer()
+        if getattr(pandokia.cfg, 'query_log', None):
+            atexit.register(write_log)
+    db.query_timer = timer
+    return timer
+
+
+def enable_from_config():
+    if getattr(pandokia.cfg, 'query_timing', False):
+        return enable()
+    return None
+
+
+def write_log(fname=None):
+    if timer is None or not timer.stats:
+        return
+    cfg = pandokia.cfg
+    if fname is None:
+        fname = cfg.query_log
+    max_bytes = getattr(cfg, 'query_log_max_bytes', 10 * 1024 * 1024)
+
+    try:
+        if os.path.getsize(fname) > max_bytes:
+            os.rename(fname, fname + '.1')
+    except OSError:
+        pass
+
+    # one write of one line; appends from concurrent processes do not
+    # get mixed up
+    f = open(fname, 'a')
+    f.write(timer.record() + '\n')
+    f.close()
+
+
+##########
+#
+# pdk querylog
+#
+
+helpstr = '''
+pdk querylog [ --sort total|max|calls|rows|avg ] [ --top n ] [ files ]
+
+Add up the statement times in the query log files (default: the
+query_log file from the config, and the one before it) and show the
+statements that took the most time.
+'''
+
+
+def read_log(fname, stats, counts):
+    # counts is [ records, bad lines ]
+    f = open(fname, 'r')
+    for line in f:
+        try:
+            d = json.loads(line)
+        except ValueError:
+            # a line from a process that was killed while writing
+            counts[1] += 1
+            continue
+        counts[0] += 1
+        for x in d['statements']:
+            s = stats.get(x['sql'])
+            if s is None:
+                s = stats[x['sql']] = {'calls': 0, 'total_ms': 0.0,
+                                       'max_ms': 0.0, 'rows': 0,
+                                       'requests': 0}
+            s['calls'] += x['calls']
+            s['total_ms'] += x['total_ms']
+            s['rows'] += x['rows']
+            s['requests'] += 1
+            if x['max_ms'] > s['max_ms']:
+                s['max_ms'] = x['max_ms']
+    f.close()
+
+
+def run(args):
+    import argparse
+    import pandokia.text_table as text_table
+
+    if '-h' in args or '--help' in args:
+        print(helpstr)
+        return 0
+
+    parser = argparse.ArgumentParser(prog='pdk querylog')
+    parser.add_argument('--sort', default='total',
+                        choices=['total', 'max', 'calls', 'rows', 'avg'])
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args(args)
+
+    files = args.files
+    if not files:
+        fname = getattr(pandokia.cfg, 'query_log', None)
+        if not fname:
+            print("no files named and no query_log in the config")
+            return 1
+        files = [x for x in (fname + '.1', fname) if os.path.exists(x)]
+
+    stats = {}
+    counts = [0, 0]
+    for x in files:
+        read_log(x, stats, counts)
+
+    print("%d requests" % counts[0])
+    if counts[1]:
+        print("%d unreadable lines" % counts[1])
+
+    for s in stats.values():
+        s['avg_ms'] = s['total_ms'] / max(s['calls'], 1)
+
+    sort_key = {
+        'total': 'total_ms',
+        'max': 'max_ms',
+        'calls': 'calls',
+        'rows': 'rows',
+        'avg': 'avg_ms'}[args.sort]
+    l = list(stats.items())
+    l.sort(key=lambda x: -x[1][sort_key])
+
+    t = text_table.text_table()
+    for x in ('calls', 'requests', 'total_ms', 'avg_ms', 'max_ms', 'rows', 'statement'):
+        t.define_column(x)
+    for row, (sql, s) in enumerate(l[:args.top]):
+        t.set_value(row, 'calls', s['calls'])
+        t.set_value(row, 'requests', s['requests'])
+        t.set_value(row, 'total_ms', '%.1f' % s['total_ms'])
+        t.set_value(row, 'avg_ms', '%.2f' % s['avg_ms'])
+        t.set_value(row, 'max_ms', '%.1f' % s['max_ms'])
+        t.set_value(row, 'rows', s['rows'])
+        t.set_value(row, 'statement', sql)
+    sys.stdout.write(t.get_rst(headings=1))
+    return 0
@@ -207,6 +207,9 @@ def run(args):
             print("Summary:")
             common.print_stat_dict(t_stat)
 
+    # remember the parsed pdk_environment files for the next pdkrun
+    envgetter.save_cache()
+
     if initialized_status_file:
         for x in range(0, n_status_records):
             pandokia.run_status.pdkrun_status('', slot=x)
@@ -266,3 +269,38 @@ def export_environment(args):
         envgetter.export(x, format=format, fh=out)
 
     out.flush()
+
+
+def envcheck(args):
+    # pdk envcheck - resolve the environment for every directory in a
+    # tree and report how long it took
+    import time
+    import pandokia.envgetter
+    import pandokia.run_recursive
+
+    context = None
+    opts, args = getopt.getopt(args, "c:", ["context="])
+    for (opt, optarg) in opts:
+        if opt == '-c' or opt == '--context':
+            context = optarg
+
+    if len(args) == 0:
+        args = ['.']
+
+    t0 = time.time()
+    envgetter = pandokia.envgetter.EnvGetter(context=context)
+    n_dirs = 0
+    for x in args:
+        for d in pandokia.run_recursive.generate_directories(os.path.abspath(x)):
+            envgetter.envdir(d)
+            n_dirs += 1
+    t1 = time.time()
+    envgetter.save_cache()
+
+    print("directories:       %d" % n_dirs)
+    print("files parsed:      %d" % pandokia.envgetter.parse_count)
+    print("files from cache:  %d" % pandokia.envgetter.cache_hit_count)
+    print("seconds:           %.3f" % (t1 - t0))
+    if n_dirs:
+        print("ms per directory:  %.3f" % ((t1 - t0) * 1000.0 / n_dirs))
+    return 0
@@ -6,6 +6,8 @@ import time
 import sys
 import traceback
 import errno
+import json
+import hashlib
 
 import pandokia.common as common
 
@@ -24,24 +26,41 @@ def run(dirname, envgetter):
     dirname = os.path.abspath(dirname)
 
     try:
-        dir_list = os.listdir(dirname)
+        listing = dir_listing(dirname)
     except Exception as e:
         print("Cannot search for tests in %s" % dirname)
         print(e)
         print("")
         return 1, {}
 
-    dir_list.sort()
+    # the runner patterns for this directory, compiled once
+    select_runner = pandokia.run_file.get_runner_matcher(dirname)
 
     # As we run each file, we will get a count of status values of each type.
     # t_stat keeps a running sum for the current directory.
     t_stat = {}
 
-    for basename in dir_list:
+    # the disabled files, as (basename, runner)
+    disabled = []
+
+    for entry in listing.entries:
+
+        basename = entry.name
+
+        # Decide which test runner this file wants to use.  If the
+        # answer is None, this file does not contain tests.  (Most
+        # files are not tests, so we ask this before we look at the
+        # file type.)
+        runner = select_runner(basename)
+
+        # if runner comes back None, that means that select_runner is
+        # saying "this is not a test"
+        if runner is None:
+            continue
 
         full_name = os.path.join(dirname, basename)
         try:
-            file_stat = os.stat(full_name)
+            is_file = entry.is_file()
         except OSError as e:
             if e.errno == errno.ENOENT:
                 # not an error for somebody to delete a file between when
@@ -58,19 +77,10 @@ def run(dirname, envgetter):
             was_error = 1
             continue
 
-        if not stat.S_ISREG(file_stat.st_mode):
+        if not is_file:
             # we skip any thing that is not a file
             continue
 
-        # Decide which test runner this file wants to use.  If the
-        # answer is None, this file does not contain tests.
-        runner = pandokia.run_file.select_runner(dirname, basename)
-
-        # if runner comes back None, that means that select_runner is
-        # saying "this is not a test"
-        if runner is None:
-            continue
-
         # Don't print the directory name until it looks like we are
         # actually going to do anything here.  This suppresses all
         # output completely for directories that do not have any tests.
@@ -78,40 +88,11 @@ def run(dirname, envgetter):
             print("directory %s" % dirname)
             printed_dirname = 1
 
-        # If the file is disabled, skip it
-        if file_disabled(dirname, basename):
+        # If the file is disabled, skip it; we report the tests in it
+        # after we have looked at every file in the directory.
+        if file_disabled(dirname, basename, listing):
             print("Disabled : %s/%s" % (dirname, basename))
-            m = pandokia.run_file.get_runner_mod(runner)
-
-            env = {}
-            env.update(envgetter.envdir(dirname))
-            env['PDK_TESTPREFIX'] = pandokia.run_file.get_prefix(
-                envgetter, dirname)
-
-            env['PDK_FILE'] = basename
-
-            # ask the runner what disabled tests are in that file.
-            save_dir = os.getcwd()
-            os.chdir(dirname)
-
-            # flush the output file because m.list() might start a new process.
-            # really, m.list() should do that itself, but I don't trust every
-            # author of every new runner to do it.
-            sys.stdout.flush()
-            sys.stderr.flush()
-            l = m.lst(env)
-
-            os.chdir(save_dir)
-
-            if l is not None:
-                # l is a list of the names of tests that were in that file.
-                # We will write a status=D record for each disabled test.
-                write_disabled_list(env, l, dirname, basename, runner)
-            else:
-                pass
-                # If the function returns None, it means that it does not
-                # know how to report the disabled tests.  That's too bad,
-                # but we can at least go on.
+            disabled.append((basename, runner))
             continue
 
         # not disabled - run it
@@ -128,6 +109,16 @@ def run(dirname, envgetter):
             print('')
             was_error = 1
 
+    if disabled:
+        try:
+            report_disabled(dirname, envgetter, disabled)
+        except Exception as e:
+            xstr = traceback.format_exc()
+            print("Exception listing disabled tests in %s: %s" % (dirname, e))
+            print(xstr)
+            print('')
+            was_error = 1
+
     # print the status summary for the directory.
     print("")
     print("%s:" % dirname)
@@ -136,12 +127,61 @@ def run(dirname, envgetter):
     return (was_error, t_stat)
 
 
+#
+# One read of a directory, shared by everything that needs to know
+# what is in it.  On a large tree, listing the directory again (and
+# stat'ing every file) for each question we ask is most of the time
+# spent before the first test starts.
+#
+# entries
+#   the directory entries, sorted by name.  With os.scandir, the
+#   entries already know their file type on most systems, so
+#   is_file() does not need another stat.
+#
+# names
+#   set of all the names in the directory
+#
+# enable
+#   the names that end in .enable; there are not usually many of these
+#
+
+class _listdir_entry(object):
+    # stand-in for os.DirEntry where os.scandir is not available
+
+    def __init__(self, dirname, name):
+        self.name = name
+        self.path = os.path.join(dirname, name)
+
+    def is_file(self):
+        try:
+            return stat.S_ISREG(os.stat(self.path).st_mode)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+
+
+class dir_listing(object):
+
+    def __init__(self, dirname):
+        if hasattr(os, 'scandir'):
+            entries = list(os.scandir(dirname))
+        else:
+            entries = [_listdir_entry(dirname, x) for x in os.listdir(dirname)]
+        entries.sort(key=lambda x: x.name)
+        self.entries = entries
+        self.names = set([x.name for x in entries])
+        self.enable = [x for x in self.names if x.endswith('.enable')]
+
+
 #
 # check for a disable file, indicating that we should not run tests in a file
 #
-def file_disabled(dirname, basename):
+def file_disabled(dirname, basename, listing=None):
     # dirname = engine/spider/stis/spec/stellar-ext
     # basename = s_stis_spec_stellar-ext_10759.peng
+    #
+    # listing is a dir_listing of dirname, if the caller already has one
 
     n = basename.rfind(".")
     if n >= 0:
@@ -149,13 +189,14 @@ def file_disabled(dirname, basename):
     else:
         disable_name = basename
 
-    dir_contents = os.listdir(dirname)
+    if listing is None:
+        listing = dir_listing(dirname)
 
     # see if there are any .enable files for this test; if so, only run the test
     # if there is an enable file for the current context
     related_enable_files = []
-    for i in dir_contents:
-        if i.startswith(disable_name) and i.endswith('.enable'):
+    for i in listing.enable:
+        if i.startswith(disable_name):
             related_enable_files.append(i)
 
     if len(related_enable_files) > 0:
@@ -167,21 +208,167 @@ def file_disabled(dirname, basename):
         else:
             return True
     else:
-        f = dirname + '/' + disable_name
-        try:
-            os.stat(f + '.disable')
+        if disable_name + '.disable' in listing.names:
             return True
-        except OSError as e:
-            # print e.args
-            pass
-        try:
-            os.stat(f + '.' + os.environ['PDK_CONTEXT'] + '.disable')
+        if disable_name + '.' + os.environ['PDK_CONTEXT'] + '.disable' in listing.names:
             return True
-        except OSError as e:
-            # print e.args
-            pass
         return False
 
+#
+# report the tests in the disabled files of a directory
+#
+# We ask each runner what tests are in its disabled files.  For some
+# runners (nose, pytest), that means starting the test framework to
+# collect the tests, which can take longer than running them.  So:
+#
+# - if the runner has lst_many(env, basenames), we ask it about all of
+#   its disabled files in the directory at once; it can collect them
+#   all in one process.  Otherwise, we call lst(env) for each file.
+#
+# - we keep the answers with the mtime and size of each test file.
+#   Next time, we only ask about the files that changed.  (The answer
+#   also depends on the runner and the test prefix, so those are in
+#   the key too.)  The cache is in the directory lst_cache_name in
+#   PDK_TMP, where "pdk run" keeps its other temp files, not in the
+#   test directory; there is one file for each test directory.  If
+#   PDK_TMP is not set, there is no cache.
+#
+
+lst_cache_name = 'pdk.lst.cache'
+
+
+def lst_cache_file(dirname):
+    tmpdir = os.environ.get('PDK_TMP', None)
+    if not tmpdir:
+        return None
+    h = hashlib.md5(dirname.encode('utf-8')).hexdigest()
+    return os.path.join(tmpdir, lst_cache_name, h)
+
+
+def read_lst_cache(dirname):
+    fname = lst_cache_file(dirname)
+    if fname is None:
+        return {}
+    try:
+        f = open(fname, 'r')
+    except IOError:
+        return {}
+    try:
+        d = json.load(f)
+    except ValueError:
+        # a damaged cache is just an empty cache
+        d = {}
+    f.close()
+    if not isinstance(d, dict):
+        d = {}
+    return d
+
+
+def write_lst_cache(dirname, cache):
+    # Write a private temp file and rename it, so a reader never sees
+    # half a file.  If we cannot write there, we just do without the
+    # cache.
+    fname = lst_cache_file(dirname)
+    if fname is None:
+        return
+    tmp = '%s.%d.tmp' % (fname, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(fname)):
+            try:
+                os.mkdir(os.path.dirname(fname))
+            except OSError as e:
+                # another pdkrun may have made it first
+                if e.errno != errno.EEXIST:
+                    raise
+        f = open(tmp, 'w')
+        json.dump(cache, f)
+        f.close()
+        os.rename(tmp, fname)
+    except (IOError, OSError):
+        pass
+
+
+def lst_cache_key(dirname, basename, runner, prefix):
+    try:
+        st = os.stat(os.path.join(dirname, basename))
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, runner, prefix]
+
+
+def report_disabled(dirname, envgetter, disabled):
+    # disabled is a list of ( basename, runner )
+
+    env = {}
+    env.update(envgetter.envdir(dirname))
+    env['PDK_TESTPREFIX'] = pandokia.run_file.get_prefix(envgetter, dirname)
+    prefix = env['PDK_TESTPREFIX']
+
+    cache = read_lst_cache(dirname)
+    cache_changed = False
+
+    # which files we need to ask about, by runner
+    to_list = {}
+    keys = {}
+    for basename, runner in disabled:
+        key = lst_cache_key(dirname, basename, runner, prefix)
+        keys[basename] = key
+        ent = cache.get(basename)
+        if key is None or ent is None or ent[0] != key:
+            to_list.setdefault(runner, []).append(basename)
+
+    for runner in sorted(to_list):
+        basenames = to_list[runner]
+        m = pandokia.run_file.get_runner_mod(runner)
+
+        # ask the runner what disabled tests are in those files.
+        save_dir = os.getcwd()
+        os.chdir(dirname)
+
+        # flush the output file because m.lst() might start a new process.
+        # really, m.lst() should do that itself, but I don't trust every
+        # author of every new runner to do it.
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        try:
+            if hasattr(m, 'lst_many'):
+                found = m.lst_many(env, basenames)
+            else:
+                found = {}
+                for basename in basenames:
+                    fenv = dict(env)
+                    fenv['PDK_FILE'] = basename
+                    found[basename] = m.lst(fenv)
+        finally:
+            os.chdir(save_dir)
+
+        for basename in basenames:
+            # If the runner returns None for a file, it means that it
+            # does not know how to report the disabled tests.  That's
+            # too bad, but we can at least go on.  We do not cache that.
+            # We do not cache an empty list either; it is more likely
+            # that collecting the tests went wrong than that the file
+            # has none, and we want to try again next time.
+            l = found.get(basename)
+            if l:
+                cache[basename] = [keys[basename], l]
+            else:
+                cache.pop(basename, None)
+            cache_changed = True
+
+    for basename, runner in disabled:
+        ent = cache.get(basename)
+        if ent is None:
+            continue
+        # We will write a status=D record for each disabled test.
+        fenv = dict(env)
+        fenv['PDK_FILE'] = basename
+        write_disabled_list(fenv, ent[1], dirname, basename, runner)
+
+    if cache_changed:
+        write_lst_cache(dirname, cache)
+
 #
 # write a test report for a list of disabled tests.
 #
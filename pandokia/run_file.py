@@ -3,6 +3,7 @@ import os
 import os.path
 import sys
 import fnmatch
+import re
 import datetime
 import signal
 import errno
@@ -21,6 +22,7 @@ import pandokia.common as common
 from pandokia.run_status import pdkrun_status
 
 import pandokia.runners
+import pandokia.helpers.rusage
 
 #
 # find the file name patterns that associate a file name with a test runner
@@ -82,6 +84,9 @@ def read_runner_glob(dirname):
         f = open(dirname + "/pdk_runners", "r")
     except IOError as e:
         if e.errno == errno.ENOENT:
+            # remember this too, or every file in the directory walks
+            # all the way up the tree again
+            runner_glob_cache[dirname] = parent_list
             return parent_list
         raise
 
@@ -108,19 +113,58 @@ def read_runner_glob(dirname):
 
 
 #
-# Choose the actual runner to use for a specific file.
+# The runner glob for a directory, compiled into a single regular
+# expression.  Each pattern becomes a named group r0, r1, ... in one
+# big alternation.  Alternatives are tried in order, so the group
+# that matches is the first pattern in the list that matches - the
+# same answer as trying fnmatch on each pattern in turn, but without
+# a python loop for every file.
 #
-def select_runner(dirname, basename):
+# here is a cache of the compiled matchers, by directory
+runner_matcher_cache = {}
 
-    runner_glob = read_runner_glob(dirname)
 
-    for pat, runner in runner_glob:
-        if fnmatch.fnmatch(basename, pat):
+class runner_matcher(object):
+
+    def __init__(self, glob_list):
+        self.runners = {}
+        alternatives = []
+        for n, (pat, runner) in enumerate(glob_list):
             if runner == 'none':
-                return None
-            return runner
+                runner = None
+            name = 'r%d' % n
+            self.runners[name] = runner
+            alternatives.append('(?P<%s>%s)' % (name, fnmatch.translate(pat)))
+        if alternatives:
+            self.re = re.compile('|'.join(alternatives))
+        else:
+            self.re = None
 
-    return None
+    def __call__(self, basename):
+        if self.re is None:
+            return None
+        m = self.re.match(os.path.normcase(basename))
+        if m is None:
+            return None
+        return self.runners[m.lastgroup]
+
+
+def get_runner_matcher(dirname):
+    dirname = os.path.abspath(dirname)
+    try:
+        return runner_matcher_cache[dirname]
+    except KeyError:
+        pass
+    m = runner_matcher(read_runner_glob(dirname))
+    runner_matcher_cache[dirname] = m
+    return m
+
+
+#
+# Choose the actual runner to use for a specific file.
+#
+def select_runner(dirname, basename):
+    return get_runner_matcher(dirname)(basename)
 
 
 #
@@ -207,6 +251,11 @@ def run(dirname, basename, envgetter, runner):
 
         runner_mod = get_runner_mod(runner)
 
+        # the runner does not need this, but the ingest client (see
+        # helpers/ingest.py) puts it in the same SETDEFAULT block that
+        # we write below
+        env['PDK_RUNNER'] = runner
+
         env['PDK_FILE'] = basename
 
         env['PDK_LOG'] = pdk_log_name(env)
@@ -240,15 +289,29 @@ def run(dirname, basename, envgetter, runner):
         cmd = runner_mod.command(env)
         output_buffer = ''
 
+        # what the command used, as tra values (if we can tell)
+        file_rusage = None
+
         if cmd is not None:
             # run the command -- To understand how we do it, see
             # "Replacing os.system()" in the docs for the subprocess module,
             # then consider the source code for subprocess.call()
             if not isinstance(cmd, list):
                 cmd = [cmd]
+
+            # With PDK_FORK, a python runner that knows how runs in a child
+            # of this process instead of a new interpreter.
+            use_fork = fork_wanted(env, runner_mod) and len(cmd) == 1
+            if use_fork:
+                fork_preload(env, runner_mod)
+
             for thiscmd in cmd:
+                if use_fork:
+                    thiscmd_name = 'fork: ' + thiscmd
+                else:
+                    thiscmd_name = thiscmd
                 print('COMMAND : %s (for file %s) %s' %
-                      (repr(thiscmd), full_filename, datetime.datetime.now()))
+                      (repr(thiscmd_name), full_filename, datetime.datetime.now()))
                 sys.stdout.flush()
                 sys.stderr.flush()
                 if windows:
@@ -277,17 +340,20 @@ def run(dirname, basename, envgetter, runner):
                 else:
                     # on unix, just do it
                     with NamedTemporaryFile(mode='r+b') as f:
-                        p = subprocess.Popen(
-                            thiscmd.split(),
-                            stdout=f,
-                            stderr=f,
-                            shell=False,
-                            env=env,
-                            preexec_fn=unix_preexec)
+                        if use_fork:
+                            p = forked_process(runner_mod, env, f)
+                        else:
+                            p = subprocess.Popen(
+                                thiscmd.split(),
+                                stdout=f,
+                                stderr=f,
+                                shell=False,
+                                env=env,
+                                preexec_fn=unix_preexec)
 
                         if 'PDK_TIMEOUT' in env:
                             proc_timeout_start(env['PDK_TIMEOUT'], p)
-                            status = p.wait()
+                            status, file_rusage = wait_rusage(p)
                             print("return from wait, status=%d" % status)
                             proc_timeout_terminate()
                             if timeout_proc_kills > 0:
@@ -295,7 +361,7 @@ def run(dirname, basename, envgetter, runner):
                                 # report an error even if it managed to exit 0
                                 status = -15
                         else:
-                            status = p.wait()
+                            status, file_rusage = wait_rusage(p)
 
                         f.seek(0)
                         output_buffer = f.read().decode()
@@ -312,6 +378,9 @@ def run(dirname, basename, envgetter, runner):
 
                 print("COMMAND EXIT: %s %s %s" %
                      (cause, return_status, datetime.datetime.now()))
+                if file_rusage is not None:
+                    print("COMMAND RUSAGE: %s" % ' '.join(
+                        ['%s=%s' % x for x in sorted(file_rusage.items())]))
 
         else:
             # BUG: no timeout! - fortunately, this is a minor issue
@@ -348,6 +417,9 @@ def run(dirname, basename, envgetter, runner):
             f.write('\n')
             f.write('test_name=%s\n' % full_filename)
             f.write('status=E\n')
+            if file_rusage is not None:
+                for name in sorted(file_rusage):
+                    f.write('tra_%s=%s\n' % (name, file_rusage[name]))
             if output_buffer:
                 f.write('log:\n')
                 f.write('.[PANDOKIA]\n')
@@ -532,3 +604,156 @@ else:
     def proc_timeout_terminate():
         signal.alarm(0)
         timeout_proc = None
+
+
+##########
+#
+# Wait for the child process and find out what resources it used.
+#
+# This is p.wait() for a subprocess.Popen (or forked_process), except
+# that we use os.wait4() so that we get the rusage of the child, which
+# is reported in the pdkrun output and in the tra of the error record
+# that run() writes when a runner dies.  The tests themselves are
+# accounted for by the runners; see pandokia/helpers/rusage.py.
+#
+# Returns (returncode, tra_dict); tra_dict is None if we cannot tell.
+#
+
+def wait_rusage(p):
+    if not hasattr(os, 'wait4'):
+        return p.wait(), None
+    while p.returncode is None:
+        try:
+            pid, status, ru = os.wait4(p.pid, 0)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        p.returncode = wait_status(status)
+        return p.returncode, pandokia.helpers.rusage.rusage_tra(ru)
+    # somebody already waited for it
+    return p.returncode, None
+
+
+def wait_status(status):
+    # same convention as subprocess: negative for a signal
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+##########
+#
+# Running python tests in a forked child instead of a new interpreter.
+#
+# If PDK_FORK is set (usually in a pdk_environment file), and the runner
+# module has a fork_main(env) function, we fork this process and call
+# fork_main in the child instead of starting the runner's command.  The
+# modules the runner lists in fork_preload (and any in PDK_FORK_PRELOAD,
+# for things like numpy that your tests import) are imported here, in
+# the parent, the first time we need them.  Every child gets them already
+# imported, so a directory of many small python test files does not pay
+# for a python startup and those imports in every file.
+#
+# The child is a separate process, so one test file still cannot break
+# the next: each child starts from the state of the parent, which never
+# imports any test code.  It gets the same environment, current
+# directory, process group, output capture, and PDK_TIMEOUT handling as
+# a command.  It does not run atexit handlers when it finishes.
+#
+
+def fork_wanted(env, runner_mod):
+    if windows or not hasattr(os, 'fork'):
+        return False
+    if env.get('PDK_FORK', '') in ('', '0'):
+        return False
+    return hasattr(runner_mod, 'fork_main')
+
+
+# modules we already tried to preload
+fork_preloaded = {}
+
+
+def fork_preload(env, runner_mod):
+    l = list(getattr(runner_mod, 'fork_preload', []))
+    l = l + env.get('PDK_FORK_PRELOAD', '').replace(',', ' ').split()
+    for name in l:
+        if name in fork_preloaded:
+            continue
+        fork_preloaded[name] = 1
+        try:
+            __import__(name)
+        except Exception as e:
+            # not fatal; the child will try again and report the
+            # problem as part of the test
+            print("PDK_FORK: cannot preload %s: %s" % (name, e))
+
+
+class forked_process(object):
+    # enough of subprocess.Popen for run() and the timeout code
+
+    def __init__(self, runner_mod, env, f):
+        self.returncode = None
+        self.pid = os.fork()
+        if self.pid == 0:
+            forked_child(runner_mod, env, f)
+            # NOTREACHED
+
+    def wait(self):
+        while self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, 0)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            self.returncode = wait_status(status)
+        return self.returncode
+
+
+def forked_child(runner_mod, env, f):
+    # This runs in the child and never returns.
+    status = 1
+    try:
+        # same as unix_preexec, so the timeout can kill the whole group
+        os.setpgrp()
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+        # stdout/stderr go to the capture file, just like a command.  A
+        # new interpreter would write to fd 1 and 2 even if the parent
+        # had replaced sys.stdout or sys.stderr with something else.
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        sys.stdout = os.fdopen(1, 'w')
+        sys.stderr = os.fdopen(2, 'w', 1)
+
+        # the environment the command would have had
+        os.environ.clear()
+        os.environ.update(env)
+
+        status = runner_mod.fork_main(env)
+
+    except SystemExit as e:
+        status = e.code
+
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        status = 1
+
+    # convert to an exit status the way the python interpreter would
+    if status is None:
+        status = 0
+    elif not isinstance(status, int):
+        sys.stderr.write('%s\n' % (status,))
+        status = 1
+
+    try:
+        # os._exit() does not run the atexit functions, so write out
+        # whatever the pycode reporter is still holding
+        if 'pandokia.helpers.pycode' in sys.modules:
+            sys.modules['pandokia.helpers.pycode'].flush_all()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(status & 0xff)
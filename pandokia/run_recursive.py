@@ -27,23 +27,34 @@ def generate_directories(dir):
     yield dir
 
     try:
-        # Now we look at all the subdirectories.
-        dir_list = os.listdir(dir)
+        # Now we look at all the subdirectories.  scandir usually knows
+        # which entries are directories without a stat for each one.
+        if hasattr(os, 'scandir'):
+            dir_list = [(x.name, x) for x in os.scandir(dir)]
+        else:
+            dir_list = [(x, None) for x in os.listdir(dir)]
     except (OSError, IOError) as e:
         # various errors listing the directory mean we skip it
         print(e)
         return
 
-    dir_list.sort()
+    dir_list.sort(key=lambda x: x[0])
 
-    for short_name in dir_list:
+    for short_name, entry in dir_list:
         # Skip directories that we know to be non-useful.
         if short_name in pandokia.cfg.exclude_dirs:
             continue
 
         # Find out if it is a directory.  If not, skip it.
         full_name = os.path.join(dir,short_name)
-        if not os.path.isdir(full_name):
+        if entry is not None:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+        else:
+            is_dir = os.path.isdir(full_name)
+        if not is_dir:
             continue
 
         # It is a directory - recursively search it.
@@ -13,3 +13,51 @@ runner_glob = [
     ('*.c', 'maker'),      # compiled C unit tests (fctx)
     ('*.run', 'run'),      # run a pdk-aware executable
 ]
+
+
+#
+# For a runner's lst_many(): sort the test names out of a pdk log that
+# was written by collecting the tests in several files at once.
+#
+# The nose and pytest plugins name each test with PDK_TESTPREFIX, then
+# the path of the file (without .py), then the names inside the file.
+# sep is the separator they use between the parts ('/' for pytest, '.'
+# for nose).  The first part of the name (after the prefix) that is the
+# name of one of the files tells us which file the test is in.
+#
+# status is the exit status of the process that collected the tests.
+#
+# Returns a dict of basename -> list of test names.  If the collecting
+# failed (it exited non-zero, or did not write a log), every file gets
+# None, which means we do not know what tests it has.
+#
+
+def collected_names(log, prefix, basenames, sep, status=0):
+    import os
+    import pandokia.import_data
+
+    if status != 0 or not os.path.exists(log):
+        return dict([(x, None) for x in basenames])
+
+    result = dict([(x, []) for x in basenames])
+    stems = dict([(os.path.splitext(x)[0], x) for x in basenames])
+
+    if prefix != '' and not prefix.endswith('/'):
+        prefix = prefix + '/'
+
+    for rec in pandokia.import_data.read_records(log, share_defaults=False):
+        name = rec.get('test_name', None)
+        if not name:
+            continue
+        if len(basenames) == 1:
+            result[basenames[0]].append(name)
+            continue
+        rest = name
+        if rest.startswith(prefix):
+            rest = rest[len(prefix):]
+        for part in rest.split(sep):
+            if part in stems:
+                result[stems[part]].append(name)
+                break
+
+    return result
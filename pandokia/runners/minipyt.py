@@ -4,6 +4,7 @@
 
 import os
 import os.path
+import sys
 
 # return command string to run the test
 #
@@ -15,6 +16,22 @@ def command(env):
     name = os.path.basename(env['PDK_FILE'])
     return 'pdk_python_runner minipyt %s' % name
 
+# When PDK_FORK is set, pdkrun runs the file in a child forked from
+# itself instead of starting a new python.  These are imported in pdkrun
+# before the fork so the children do not have to import them.
+fork_preload = ['pandokia.helpers.runner_minipyt']
+
+
+# the same as command(), but in a process forked from pdkrun
+def fork_main(env):
+    import pandokia.helpers.runner_minipyt as runner
+    name = os.path.basename(env['PDK_FILE'])
+    sys.argv = ['pdk_python_runner', 'minipyt', name]
+    # it was imported before pdkrun forked, when sys.stdout was not
+    # the capture file yet
+    runner.dots_file = sys.stdout
+    return runner.main([name])
+
 # Maybe support disabled tests someday...
 
 
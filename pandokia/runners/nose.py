@@ -23,9 +23,28 @@ def command(env):
     return 'pdknose --pdk --with-doctest --doctest-tests %(PDK_FILE)s' % env
 
 
+# When PDK_FORK is set, pdkrun runs the file in a child forked from
+# itself instead of starting pdknose.  nose is imported in pdkrun
+# before the fork so the children do not have to import it.
+fork_preload = ['nose', 'pandokia.helpers.nose_plugin']
+
+
+# the same as command(), but in a process forked from pdkrun
+def fork_main(env):
+    import sys
+    import nose
+    argv = ('pdknose --pdk --with-doctest --doctest-tests %(PDK_FILE)s' % env).split()
+    sys.argv = argv
+    return nose.main(argv=argv)
+
 # return a list of tests that are in the file.  we use this
 # to report disabled tests.
 def lst(env):
+    return lst_many(env, [env['PDK_FILE']])[env['PDK_FILE']]
+
+
+# the same as lst(), for several files in the directory at once
+def lst_many(env, basenames):
     # nose has --collect-only which identifies the tests, but does not run them.
     # We run nose with the same set of parameters as if we were running the
     # test, but we add --collect-only.  The result is a pandokia log file
@@ -33,41 +52,40 @@ def lst(env):
     # find the test names.  (Everything except the name is an uninteresting
     # side-effect.)
     #
+    # One nose collects all of the files, so we only pay for starting
+    # nose once per directory instead of once per file.
+    #
     # Note that the PDK_TESTPREFIX is applied by the nose plugin, not us.
 
-    # If this function is called, it is only once per process.
+    import tempfile
     import pandokia.helpers.process as process
     import pandokia.helpers.filecomp as filecomp
+    import pandokia.runners
 
-    tmpfile = 'pdk.runner.tmp'
-    # Do our best to make sure the file is not there already.
-    try:
-        os.unlink(tmpfile)
-    except OSError:
-        pass
+    # pandokia log goes to tmpfile, and the output to outfile.  Each gets
+    # a name of its own, so we do not step on anything else in the
+    # directory.
+    fd, tmpfile = tempfile.mkstemp(prefix='pdk.runner.', suffix='.tmp',
+                                   dir='.')
+    os.close(fd)
+    # the log is not there if the plugin did not write one
+    filecomp.safe_rm(tmpfile)
+    fd, outfile = tempfile.mkstemp(prefix='pdknose.', suffix='.tmp', dir='.')
+    os.close(fd)
 
-    # run the command to collect the names
-    # pandokia log goes to tmpfile - it is ok to used a fixed name because we
-    # know that only one process can be running tests in a single directory.
-    s = 'pdknose --pdk --with-doctest --doctest-tests --collect-only %(PDK_FILE)s' % env
+    s = 'pdknose --pdk --with-doctest --doctest-tests --collect-only'.split()
 
     env = env.copy()
     env['PDK_LOG'] = tmpfile
-    process.run_process(s.split(), env, output_file='pdknose.tmp')
-
-    # gather the names from pdk.log
-    l = []
-    f = open(tmpfile, "r")
-    for line in f:
-        line = line.strip().split('=')
-        if line[0] == 'test_name':
-            l.append(line[1])
+    status = process.run_process(s + list(basenames), env,
+                                 output_file=outfile)
 
-    f.close()
+    # gather the names from the log
+    l = pandokia.runners.collected_names(
+        tmpfile, env.get('PDK_TESTPREFIX', ''), basenames, '.', status)
 
     # clean up
-    filecomp.safe_rm('pdknose.tmp')
+    filecomp.safe_rm(outfile)
     filecomp.safe_rm(tmpfile)
 
-    # return list
     return l
@@ -25,6 +25,26 @@ def command(env):
             env['PDK_FILE'])
     return 'python -c "import %s as t; t.pycode(1)"' % name
 
+# When PDK_FORK is set, pdkrun runs the file in a child forked from
+# itself instead of starting python.
+fork_preload = ['pandokia.helpers.pycode']
+
+
+# the same as command(), but in a process forked from pdkrun
+def fork_main(env):
+    import sys
+    name = os.path.basename(env['PDK_FILE'])
+    if not name.endswith('.py'):
+        raise AssertionError(
+            'pycode test %s: python file names must end .py' %
+            env['PDK_FILE'])
+    # "python -c" would have the current directory first on sys.path
+    sys.path.insert(0, '')
+    sys.argv = ['-c']
+    t = __import__(name[:-3])
+    t.pycode(1)
+    return 0
+
 # pycode tests runs are procedural, with the test names generated as
 # needed.  Every pycode test author would have to write special code to
 # report disabled tests.  Maybe we come back to this.
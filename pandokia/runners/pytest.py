@@ -24,51 +24,70 @@ def command(env):
     # return 'py.test -p %s --pdk %s' % ( plugin, env['PDK_FILE'] )
     return 'pdkpytest --pdk %s' % (env['PDK_FILE'])
 
+# When PDK_FORK is set, pdkrun runs the file in a child forked from
+# itself instead of starting pdkpytest.  pytest is imported in pdkrun
+# before the fork so the children do not have to import it.
+fork_preload = ['pytest']
+
+
+# the same as command(), but in a process forked from pdkrun
+def fork_main(env):
+    import sys
+    import pytest
+    args = ['--pdk', env['PDK_FILE']]
+    sys.argv = ['pdkpytest'] + args
+    return pytest.main(args)
+
 # return a list of tests that are in the file.  we use this
 # to report disabled tests.
 
 
 def lst(env):
+    return lst_many(env, [env['PDK_FILE']])[env['PDK_FILE']]
+
+
+# the same as lst(), for several files in the directory at once
+def lst_many(env, basenames):
     # pytest has --collectonly which identifies the tests, but does
     # not run them.  We run pytest with the same set of parameters as
     # if we were running the test, but we add --collectonly.  The
-    # result is a pandokia log file that contains abbreviated test
-    # reports.  We read that log file to find the test names.
-    # (Everything except the name is an uninteresting side-effect.)
+    # pandokia plugin writes a record with the name of each test it
+    # collects.  We read that log file to find the test names.
+    #
+    # One pytest collects all of the files, so we only pay for starting
+    # pytest once per directory instead of once per file.
     #
     # Note that the PDK_TESTPREFIX is applied by the pytest plugin, not
     # us.
 
-    # If this function is called, it is only once per process.
-    import pandokia.helpers.filecomp
-
-    tmpfile = 'pdk.runner.tmp'
-    # Do our best to make sure the file is not there already.
-    try:
-        os.unlink(tmpfile)
-    except OSError:
-        pass
-
-    # run the command to collect the names
-    # pandokia log goes to tmpfile - it is ok to used a fixed name because we
-    # know that only one process can be running tests in a single directory.
-    s = 'pdkpytest --pdk --pdklog=' + tmpfile + \
-        ' --collectonly %(PDK_FILE)s' % env
-
-    pandokia.helpers.filecomp.command(s, env)
-
-    # gather the names from pdk.log
-    l = []
-    f = open(tmpfile, "r")
-    for line in f:
-        line = line.strip().split('=')
-        if line[0] == 'test_name':
-            l.append(line[1])
-
-    f.close()
+    import tempfile
+    import pandokia.helpers.process as process
+    import pandokia.helpers.filecomp as filecomp
+    import pandokia.runners
+
+    # pandokia log goes to tmpfile, and the output to outfile.  Each gets
+    # a name of its own, so we do not step on anything else in the
+    # directory.
+    fd, tmpfile = tempfile.mkstemp(prefix='pdk.runner.', suffix='.tmp',
+                                   dir='.')
+    os.close(fd)
+    # the log is not there if the plugin did not write one
+    filecomp.safe_rm(tmpfile)
+    fd, outfile = tempfile.mkstemp(prefix='pdkpytest.', suffix='.tmp', dir='.')
+    os.close(fd)
+
+    env = env.copy()
+    env['PDK_LOG'] = tmpfile
+    s = ['pdkpytest', '--pdk', '--pdklog=' + tmpfile, '--collectonly']
+    status = process.run_process(s + list(basenames), env,
+                                 output_file=outfile)
+
+    # gather the names from the log
+    l = pandokia.runners.collected_names(
+        tmpfile, env.get('PDK_TESTPREFIX', ''), basenames, '/', status)
 
     # clean up
-    os.unlink(tmpfile)
+    filecomp.safe_rm(outfile)
+    filecomp.safe_rm(tmpfile)
 
-    # return list
     return l
@@ -5,6 +5,7 @@
 	drop table if exists  contact ;
 	drop table if exists  expected ;
 	drop table if exists  distinct_test_run ;	
+	drop table if exists  test_name_tree ;
 	drop table if exists  user_prefs ;
 	drop table if exists  user_email_pref ;
 	drop table if exists  query_id ;
@@ -100,6 +100,11 @@ CREATE INDEX result_scalar_test_name
 CREATE INDEX result_scalar_day_report
         ON result_scalar ( context, status, host, project, test_run ) ;
 
+-- the status history of a test: test_history in the CGI, and the
+-- history strip on the summary page
+CREATE INDEX result_scalar_history
+        ON result_scalar ( project, host, context, test_name, test_run, status ) ;
+
 -- result_tda:
 --	one row for each Test Definition Attribute
 --	rows belong to records in result_scalar with matching key_id
@@ -199,6 +204,33 @@ CREATE TABLE distinct_test_run (
 	);
 
 
+-- test_name_tree:
+--	The hierarchy of test names in each test run, one row for each
+--	child of each level.  The treewalk uses it to find the next level
+--	of the tree with one lookup, instead of looking at the name of
+--	every test below the current level.  The importer fills it in.
+--	If you have test runs that were imported before this table
+--	existed, "pdk treeindex" builds it for them.
+
+CREATE TABLE test_name_tree (
+	test_run	VARCHAR,
+	parent		VARCHAR,
+		-- test name prefix through the last '/' or '.'; '' at the top
+	child		VARCHAR,
+		-- the next level below parent, through the next '/' or '.'
+		-- if there is one
+	leaf		CHAR(1)
+		-- boolean, but portable; use 1 or 0
+		-- 1 means that parent+child is a whole test name
+	);
+
+-- one row for each level; the importer relies on this to skip a
+-- level that is already there.  It also serves the treewalk's lookup
+-- by ( test_run, parent ).
+CREATE UNIQUE INDEX test_name_tree_index
+	ON test_name_tree ( test_run, parent, child, leaf ) ;
+
+
 -- user preferences:
 
 CREATE TABLE user_prefs (
@@ -233,6 +265,7 @@ CREATE TABLE query_id (
 	qid 	INTEGER,		-- unique number of query
 	time	VARCHAR,		-- time_t a cgi last touched this query
 	expires	INTEGER,		-- time_t when it is ok to delete this query
+	changed	INTEGER,		-- time_t a page last changed this query
 	username VARCHAR,		-- who claimed this qid
 	notes    VARCHAR
 	);
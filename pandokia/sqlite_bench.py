@@ -0,0 +1,253 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# pdk sqlitebench - how well does sqlite share the database between
+# the CGI and the importer?
+#
+# For each profile, we make a new database, fill it with some test
+# results, and then for a few seconds run one writer (importing more
+# test results, like pdk import or pdk ingestd) and several readers
+# (running the queries that the treewalk, day report and test history
+# make, like the CGI).  We report how fast the writer went and how long
+# the readers had to wait for their answers.
+#
+# The profiles are:
+#
+#   default         the sqlite driver as it always was; commit after
+#                   every record, like pdk import
+#
+#   default_batch   the same, but insert --batch records per transaction
+#
+#   tuned           PandokiaDB(..., tuned=True): WAL, mmap, bigger cache,
+#                   busy timeout, read-only connections for the readers,
+#                   and --batch records per transaction
+#
+# Everything that touches a database happens in a child process, so the
+# caches in import_data do not carry over from one profile to the next.
+#
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import multiprocessing
+
+import pandokia
+import pandokia.db_sqlite as db_sqlite
+import pandokia.text_table as text_table
+
+profiles = [
+    # ( name, tuned, batch )
+    ('default', False, False),
+    ('default_batch', False, True),
+    ('tuned', True, True),
+]
+
+# the queries the readers make; the names are from pandokia.dbstats
+reader_queries = ('treewalk_level', 'day_report_hosts', 'test_history',
+                  'summary_row', 'cleaner_recount')
+
+# the test run that the initial records go into
+base_test_run = 'bench_base'
+
+
+def make_records(test_run, start, count):
+    l = []
+    for n in range(start, start + count):
+        l.append({
+            'test_run': test_run,
+            'project': 'p%d' % (n % 3),
+            'host': 'h%d' % (n % 2),
+            'context': 'c',
+            'test_name': 'd%d/f%d.t%d' % (n % 17, n % 101, n),
+            'status': 'PPPPPPPFE'[n % 9],
+            'test_runner': 'bench',
+            'log': 'log text %d\n' % n * 5,
+            'tda_n': str(n),
+            'tra_n': str(n * 2),
+        })
+    return l
+
+
+def open_db(fname, tuned):
+    if tuned:
+        return db_sqlite.PandokiaDB(fname, tuned=True)
+    return db_sqlite.PandokiaDB(fname)
+
+
+def insert(db, records, batch):
+    import pandokia.import_data as import_data
+    l = [import_data.test_result(x) for x in records]
+    if batch:
+        import_data.insert_batch(db, l)
+    else:
+        for rx in l:
+            rx.insert(db)
+
+
+def create(fname, tuned, count, result):
+    db = open_db(fname, tuned)
+    f = open(os.path.join(os.path.dirname(__file__), 'sql', 'sqlite.sql'))
+    db.sql_commands(f.read())
+    f.close()
+    insert(db, make_records(base_test_run, 0, count), True)
+    db.commit()
+    result.put(('create', count))
+
+
+def writer(fname, tuned, batch, batch_size, seconds, result):
+    db = open_db(fname, tuned)
+    n = 0
+    slowest = 0.0
+    end = time.time() + seconds
+    while time.time() < end:
+        records = make_records('bench_new', n, batch_size)
+        start = time.time()
+        insert(db, records, batch)
+        t = (time.time() - start) / len(records)
+        if t > slowest:
+            slowest = t
+        n += len(records)
+    result.put(('writer', n, slowest))
+
+
+def reader(fname, tuned, seconds, seed, result):
+    import pandokia.dbstats as dbstats
+    db = open_db(fname, tuned)
+    db.open(read_only=tuned)
+    params = dbstats.sample_parameters(db, base_test_run)
+    queries = [(dbstats.bind(sql, params), sql)
+               for name, source, sql, want in dbstats.catalogue
+               if name in reader_queries]
+
+    random.seed(seed)
+    times = []
+    errors = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        p, sql = random.choice(queries)
+        start = time.time()
+        try:
+            db.execute(sql, p).fetchall()
+        except db.OperationalError:
+            # database is locked
+            errors += 1
+        times.append(time.time() - start)
+        # a CGI makes a new connection for every page
+        if len(times) % 20 == 0:
+            db.db.close()
+            db.db = None
+            db.open(read_only=tuned)
+    result.put(('reader', times, errors))
+
+
+def percentile(l, p):
+    if not l:
+        return 0.0
+    return l[min(len(l) - 1, int(len(l) * p))]
+
+
+def run_profile(dir, name, tuned, batch, args):
+    fname = os.path.join(dir, name + '.db')
+    result = multiprocessing.Queue()
+
+    p = multiprocessing.Process(target=create,
+                                args=(fname, tuned, args.records, result))
+    p.start()
+    result.get()
+    p.join()
+
+    procs = [multiprocessing.Process(
+        target=writer,
+        args=(fname, tuned, batch, args.batch, args.seconds, result))]
+    for n in range(args.readers):
+        procs.append(multiprocessing.Process(
+            target=reader, args=(fname, tuned, args.seconds, n, result)))
+    for p in procs:
+        p.start()
+
+    written = 0
+    slowest_write = 0.0
+    times = []
+    errors = 0
+    for p in procs:
+        x = result.get()
+        if x[0] == 'writer':
+            written, slowest_write = x[1], x[2]
+        else:
+            times.extend(x[1])
+            errors += x[2]
+    for p in procs:
+        p.join()
+
+    times.sort()
+    return {
+        'profile': name,
+        'writes/s': '%.0f' % (written / float(args.seconds)),
+        'max ms/write': '%.1f' % (slowest_write * 1000),
+        'reads/s': '%.0f' % (len(times) / float(args.seconds)),
+        'read p50 ms': '%.1f' % (percentile(times, 0.50) * 1000),
+        'read p95 ms': '%.1f' % (percentile(times, 0.95) * 1000),
+        'read max ms': '%.1f' % (percentile(times, 1.0) * 1000),
+        'read errors': errors,
+    }
+
+
+helpstr = '''
+pdk sqlitebench [ --readers n ] [ --seconds n ] [ --records n ]
+                [ --batch n ] [ --dir directory ] [ profile ... ]
+
+Measure one importer and n CGI-like readers sharing a sqlite database,
+for each profile (default, default_batch, tuned).  The databases are
+made in a temporary directory under --dir (default: the current
+directory), which must be on the kind of disk your real database is on.
+'''
+
+
+def run(args):
+    import argparse
+
+    if '-h' in args or '--help' in args:
+        print(helpstr)
+        return 0
+
+    parser = argparse.ArgumentParser(prog='pdk sqlitebench')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--dir', default='.')
+    parser.add_argument('profile', nargs='*')
+    args = parser.parse_args(args)
+
+    dir = tempfile.mkdtemp(prefix='pdk_sqlitebench_', dir=args.dir)
+
+    t = text_table.text_table()
+    columns = ('profile', 'writes/s', 'max ms/write', 'reads/s',
+               'read p50 ms', 'read p95 ms', 'read max ms', 'read errors')
+    for x in columns:
+        t.define_column(x)
+
+    try:
+        row = 0
+        for name, tuned, batch in profiles:
+            if args.profile and name not in args.profile:
+                continue
+            print("%s..." % name)
+            sys.stdout.flush()
+            d = run_profile(dir, name, tuned, batch, args)
+            for x in columns:
+                t.set_value(row, x, d[x])
+            row += 1
+    finally:
+        shutil.rmtree(dir, ignore_errors=True)
+
+    print("%d readers, %s seconds, %d records before, batch %d" %
+          (args.readers, args.seconds, args.records, args.batch))
+    sys.stdout.write(t.get_rst(headings=1))
+    return 0
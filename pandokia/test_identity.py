@@ -0,0 +1,464 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# The normalized ("identity") version of the result table.
+#
+# In the original schema, every row of result_scalar contains the
+# strings test_run, project, host, context and test_name.  With a few
+# million test results, most of the space in result_scalar and its
+# indexes is those same strings over and over.
+#
+# In the normalized schema, those strings are each stored once:
+#
+#   test_run_dim    one row for each test_run, with an integer id
+#   test_identity   one row for each (project, host, context, test_name),
+#                   with an integer id
+#   result_fact     the rest of what was in result_scalar, with
+#                   test_run_id and identity_id instead of the strings
+#
+# and result_scalar is a VIEW that joins them back together, with the
+# same columns as the old table.  Everything that only reads
+# result_scalar works the same on either schema.  Things that write
+# to it have to know which schema they are using:
+#
+#   - insert a result with insert_result()
+#   - UPDATE and DELETE by key_id in the table named by result_table()
+#   - delete by a where_dict query with delete_where()
+#
+# "pdk migrate_identity" converts a database from the original schema.
+# There is no going back, except by exporting and importing the data.
+#
+# A missing test_run/project/host/context/test_name is NULL in the
+# dimension tables, so it is NULL in the view, the same as in the old
+# table.  NULL is not equal to anything, so we look for it with IS NULL.
+#
+
+import sys
+import time
+
+import pandokia
+
+# None = do not know yet; True/False = which schema the database has
+is_normalized = None
+
+# the ids that we have already looked up, so the importer does not
+# have to ask the database for every record
+test_run_ids = {}
+identity_ids = {}
+
+
+def normalized(db):
+    '''true if the database has the normalized result table'''
+    global is_normalized
+    if is_normalized is None:
+        is_normalized = db.has_table('result_fact')
+    return is_normalized
+
+
+def result_table(db):
+    '''the name of the table to UPDATE or DELETE results by key_id'''
+    if normalized(db):
+        return 'result_fact'
+    return 'result_scalar'
+
+
+def forget():
+    # Call this when you roll back a transaction that may have created
+    # new ids; they are not in the database any more.
+    test_run_ids.clear()
+    identity_ids.clear()
+
+
+def new_row(db, table, id_col, cols, values):
+    # insert a row in a dimension table and return the new id
+    if db.next:
+        id = db.next('sequence_' + id_col)
+        cols = (id_col, ) + cols
+        values = (id, ) + values
+    else:
+        id = None
+    parm = ', '.join([':%d' % (n + 1) for n in range(len(values))])
+    c = db.execute(
+        "INSERT INTO %s ( %s ) VALUES ( %s )" %
+        (table, ', '.join(cols), parm), values)
+    if id is None:
+        id = c.lastrowid
+    return id
+
+
+def match(cols, values):
+    # a where clause (without the WHERE) and its parameters for a row
+    # with these values, where None matches NULL
+    where = []
+    params = []
+    for col, value in zip(cols, values):
+        if value is None:
+            where.append('%s IS NULL' % col)
+        else:
+            params.append(value)
+            where.append('%s = :%d' % (col, len(params)))
+    return ' AND '.join(where), params
+
+
+def get_test_run_id(db, test_run):
+    '''the test_run_id for test_run, creating one if necessary'''
+    try:
+        return test_run_ids[test_run]
+    except KeyError:
+        pass
+    where, params = match(('test_run', ), (test_run, ))
+    c = db.execute(
+        "SELECT test_run_id FROM test_run_dim WHERE " + where, params)
+    x = c.fetchone()
+    if x is None:
+        id = new_row(db, 'test_run_dim', 'test_run_id',
+                     ('test_run', ), (test_run, ))
+    else:
+        id = x[0]
+    test_run_ids[test_run] = id
+    return id
+
+
+def get_identity_id(db, project, host, context, test_name):
+    '''the identity_id for a test, creating one if necessary'''
+    cols = ('project', 'host', 'context', 'test_name')
+    k = (project, host, context, test_name)
+    try:
+        return identity_ids[k]
+    except KeyError:
+        pass
+    where, params = match(cols, k)
+    c = db.execute(
+        "SELECT identity_id FROM test_identity WHERE " + where, params)
+    x = c.fetchone()
+    if x is None:
+        id = new_row(db, 'test_identity', 'identity_id', cols, k)
+    else:
+        id = x[0]
+    identity_ids[k] = id
+    return id
+
+
+def insert_result(db, cols):
+    '''insert a test result
+
+    cols is a list of (column_name, value) using the column names of
+    result_scalar.  Returns the cursor from the INSERT, so the caller
+    can use lastrowid.
+    '''
+    if normalized(db):
+        d = dict(cols)
+        cols = [x for x in cols if x[0] not in
+                ('test_run', 'project', 'host', 'context', 'test_name')]
+        cols = [('test_run_id', get_test_run_id(db, d.get('test_run'))),
+                ('identity_id', get_identity_id(db,
+                                                d.get('project'),
+                                                d.get('host'),
+                                                d.get('context'),
+                                                d.get('test_name')))
+                ] + cols
+        table = 'result_fact'
+    else:
+        table = 'result_scalar'
+
+    parm = ', '.join([':%d' % (n + 1) for n in range(len(cols))])
+    return db.execute(
+        "INSERT INTO %s ( %s ) VALUES ( %s )" %
+        (table, ', '.join([x[0] for x in cols]), parm),
+        [x[1] for x in cols])
+
+
+def delete_where(db, where_str, where_dict):
+    '''DELETE FROM result_scalar where_str, on either schema'''
+    if not normalized(db):
+        db.execute("DELETE FROM result_scalar %s" % where_str, where_dict)
+        return
+
+    # You cannot delete from a view, and some databases will not delete
+    # from a table with a subquery on the same table, so find the key_ids
+    # first.
+    c = db.execute("SELECT key_id FROM result_scalar %s" % where_str,
+                   where_dict)
+    keys = [x for x, in c]
+    while keys:
+        chunk = keys[:200]
+        keys = keys[200:]
+        parm = ', '.join([':%d' % (n + 1) for n in range(len(chunk))])
+        db.execute("DELETE FROM result_fact WHERE key_id IN ( %s )" % parm,
+                   chunk)
+
+
+##########
+#
+# pdk migrate_identity
+#
+
+# The statements to create the normalized tables.  %(name)s values
+# come from column_types for each database engine.
+
+create_tables = [
+    '''CREATE TABLE test_run_dim (
+        test_run_id %(id)s,
+        test_run %(test_run)s
+    )''',
+    '''CREATE UNIQUE INDEX test_run_dim_test_run
+        ON test_run_dim ( test_run )''',
+
+    '''CREATE TABLE test_identity (
+        identity_id %(id)s,
+        project %(project)s,
+        host %(host)s,
+        context %(context)s,
+        test_name %(test_name)s
+    )''',
+    '''CREATE UNIQUE INDEX test_identity_unique
+        ON test_identity ( project, host, test_name, context )''',
+    '''CREATE INDEX test_identity_test_name
+        ON test_identity ( test_name )''',
+
+    '''CREATE TABLE result_fact (
+        key_id %(key_id)s,
+        test_run_id INTEGER,
+        identity_id INTEGER,
+        status CHAR(1),
+        test_runner %(test_runner)s,
+        start_time %(time)s,
+        end_time %(time)s,
+        location %(location)s,
+        attn CHAR(1),
+        has_okfile CHAR(1),
+        chronic CHAR(1)
+    )''',
+    '''CREATE UNIQUE INDEX result_fact_test_identity
+        ON result_fact ( test_run_id, identity_id )''',
+    # the status history of one test is in this index, without looking
+    # at the table
+    '''CREATE INDEX result_fact_history
+        ON result_fact ( identity_id, test_run_id, status, key_id )''',
+    '''CREATE INDEX result_fact_status
+        ON result_fact ( test_run_id, status )''',
+]
+
+# the view that looks like the old result_scalar
+create_view = '''CREATE VIEW result_scalar AS SELECT
+        result_fact.key_id AS key_id,
+        test_run_dim.test_run AS test_run,
+        test_identity.project AS project,
+        test_identity.context AS context,
+        test_identity.test_name AS test_name,
+        test_identity.host AS host,
+        result_fact.status AS status,
+        result_fact.test_runner AS test_runner,
+        result_fact.start_time AS start_time,
+        result_fact.end_time AS end_time,
+        result_fact.location AS location,
+        result_fact.attn AS attn,
+        result_fact.has_okfile AS has_okfile,
+        result_fact.chronic AS chronic
+    FROM result_fact, test_run_dim, test_identity
+    WHERE test_run_dim.test_run_id = result_fact.test_run_id
+        AND test_identity.identity_id = result_fact.identity_id'''
+
+column_types = {
+    'sqlite': {
+        'id': 'INTEGER PRIMARY KEY',
+        'key_id': 'INTEGER PRIMARY KEY',
+        'test_run': 'VARCHAR',
+        'project': 'VARCHAR',
+        'host': 'VARCHAR',
+        'context': 'VARCHAR',
+        'test_name': 'VARCHAR',
+        'test_runner': 'VARCHAR',
+        'time': 'VARCHAR',
+        'location': 'VARCHAR',
+    },
+    'mysqldb': {
+        'id': 'INTEGER AUTO_INCREMENT PRIMARY KEY',
+        'key_id': 'INTEGER AUTO_INCREMENT PRIMARY KEY',
+        'test_run': 'VARCHAR(200)',
+        'project': 'VARCHAR(200)',
+        'host': 'VARCHAR(64)',
+        'context': 'VARCHAR(200)',
+        'test_name': 'VARCHAR(500)',
+        'test_runner': 'VARCHAR(25)',
+        'time': 'VARCHAR(26)',
+        'location': 'VARCHAR(1024)',
+    },
+    'psycopg2': {
+        'id': 'INTEGER PRIMARY KEY',
+        'key_id': 'INTEGER PRIMARY KEY',
+        'test_run': 'VARCHAR',
+        'project': 'VARCHAR',
+        'host': 'VARCHAR',
+        'context': 'VARCHAR',
+        'test_name': 'VARCHAR',
+        'test_runner': 'VARCHAR',
+        'time': 'VARCHAR',
+        'location': 'VARCHAR',
+    },
+}
+
+# postgres gets ids from sequences (see db.next)
+create_sequences = {
+    'psycopg2': [
+        'CREATE SEQUENCE sequence_test_run_id',
+        'CREATE SEQUENCE sequence_identity_id',
+    ],
+}
+
+# copy the data from the old table.  %(name)s values come from
+# id_columns for each database engine.
+#
+# DISTINCT keeps one NULL, so a NULL gets a row in the dimension
+# tables like any other value.  "=" never matches NULL, so the rows
+# that have a NULL in them are copied separately; there are few of
+# them, and the slow comparison is only for them.
+copy_fact = '''INSERT INTO result_fact ( key_id, test_run_id, identity_id, status,
+            test_runner, start_time, end_time, location, attn, has_okfile,
+            chronic )
+        SELECT r.key_id, d.test_run_id, i.identity_id, r.status,
+            r.test_runner, r.start_time, r.end_time, r.location, r.attn,
+            r.has_okfile, r.chronic
+        FROM result_scalar_old r, test_run_dim d, test_identity i
+        WHERE '''
+
+copy_data = [
+    '''INSERT INTO test_run_dim ( %(test_run_id)s test_run )
+        SELECT %(next_test_run_id)s t.test_run FROM
+            ( SELECT DISTINCT test_run FROM result_scalar_old ) t''',
+    '''INSERT INTO test_identity ( %(identity_id)s project, host, context, test_name )
+        SELECT %(next_identity_id)s t.project, t.host, t.context, t.test_name FROM
+            ( SELECT DISTINCT project, host, context, test_name
+                FROM result_scalar_old ) t''',
+    copy_fact + '''d.test_run = r.test_run
+            AND i.project = r.project
+            AND i.host = r.host
+            AND i.context = r.context
+            AND i.test_name = r.test_name''',
+    copy_fact + '''( r.test_run IS NULL OR r.project IS NULL OR r.host IS NULL
+                OR r.context IS NULL OR r.test_name IS NULL )
+            AND ( d.test_run = r.test_run
+                OR ( d.test_run IS NULL AND r.test_run IS NULL ) )
+            AND ( i.project = r.project
+                OR ( i.project IS NULL AND r.project IS NULL ) )
+            AND ( i.host = r.host
+                OR ( i.host IS NULL AND r.host IS NULL ) )
+            AND ( i.context = r.context
+                OR ( i.context IS NULL AND r.context IS NULL ) )
+            AND ( i.test_name = r.test_name
+                OR ( i.test_name IS NULL AND r.test_name IS NULL ) )''',
+]
+
+# Databases with auto-increment columns assign the ids themselves;
+# postgres gets them from sequences (see db.next)
+no_id_columns = {
+    'test_run_id': '',
+    'next_test_run_id': '',
+    'identity_id': '',
+    'next_identity_id': '',
+}
+
+id_columns = {
+    'sqlite': no_id_columns,
+    'mysqldb': no_id_columns,
+    'psycopg2': {
+        'test_run_id': 'test_run_id, ',
+        'next_test_run_id': "nextval('sequence_test_run_id'), ",
+        'identity_id': 'identity_id, ',
+        'next_identity_id': "nextval('sequence_identity_id'), ",
+    },
+}
+
+helpstr = '''
+pdk migrate_identity [ --drop ]
+
+Convert the database to the normalized result table: test_run and
+the test identity (project, host, context, test_name) are stored once
+in the tables test_run_dim and test_identity, and result_scalar
+becomes a view.  See pandokia/test_identity.py.
+
+The old table is renamed to result_scalar_old.  Use --drop to drop it
+when the conversion is complete.
+
+Stop importing and stop the web server while this runs.  Works with
+sqlite, MySQL and PostgreSQL.
+'''
+
+
+def migrate(db, drop=False, verbose=True):
+    driver = db.pandokia_driver_name
+    if driver not in column_types:
+        raise Exception("pdk migrate_identity does not know how to convert a %s database" % driver)
+
+    if db.has_table('result_fact'):
+        raise Exception("database already has the normalized result table")
+
+    def do(s):
+        if verbose:
+            print(s.split('\n')[0])
+            sys.stdout.flush()
+        start = time.time()
+        db.execute(s)
+        if verbose:
+            print("    %.1f seconds" % (time.time() - start))
+
+    if driver == 'mysqldb':
+        do('RENAME TABLE result_scalar TO result_scalar_old')
+    else:
+        do('ALTER TABLE result_scalar RENAME TO result_scalar_old')
+
+    for s in create_sequences.get(driver, []):
+        do(s)
+    for s in create_tables:
+        do(s % column_types[driver])
+    for s in copy_data:
+        do(s % id_columns[driver])
+
+    # The indexes of the old table are not used any more; they only take
+    # up space, and their names.  (The primary key goes with the table.)
+    import pandokia.dbstats
+    for name, cols in pandokia.dbstats.table_indexes(db, 'result_scalar_old'):
+        if name in ('primary key', 'PRIMARY') or name.endswith('_pkey') or \
+                name.startswith('sqlite_autoindex_'):
+            continue
+        if driver == 'mysqldb':
+            do('DROP INDEX %s ON result_scalar_old' % name)
+        else:
+            do('DROP INDEX %s' % name)
+
+    do(create_view)
+
+    if drop:
+        do('DROP TABLE result_scalar_old')
+
+    db.commit()
+
+    global is_normalized
+    is_normalized = True
+    forget()
+
+
+def run(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog='pdk migrate_identity',
+                                     usage=helpstr)
+    parser.add_argument('--drop', action='store_true')
+    args = parser.parse_args(args)
+
+    pdk_db = pandokia.cfg.pdk_db
+    try:
+        migrate(pdk_db, drop=args.drop)
+    except Exception as e:
+        print("pdk migrate_identity: %s" % e)
+        pdk_db.rollback()
+        return 1
+
+    c = pdk_db.execute("SELECT COUNT(*) FROM result_scalar")
+    print("%d test results" % c.fetchone()[0])
+    for t in ('test_run_dim', 'test_identity'):
+        c = pdk_db.execute("SELECT COUNT(*) FROM %s" % t)
+        print("%d rows in %s" % (c.fetchone()[0], t))
+    return 0
@@ -0,0 +1,205 @@
+#
+# pandokia - a test reporting and execution system
+# Copyright 2009, Association of Universities for Research in Astronomy (AURA)
+#
+
+#
+# The test_name_tree table: an index of the hierarchy of test names in
+# each test run.
+#
+# The treewalk shows one level of the test name hierarchy at a time.
+# Without this index, it has to look at the name of every test below
+# the current level to find the names at the next level, which takes
+# a very long time for a test run with a few hundred thousand tests.
+#
+# For each test name, there is one row for each level of the name.
+# For the test name "a/b.c" in test run "daily", the rows are:
+#
+#   test_run    parent      child   leaf
+#   daily       ''          'a/'    '0'
+#   daily       'a/'        'b.'    '0'
+#   daily       'a/b.'      'c'     '1'
+#
+# The importer adds the rows as it inserts test results; "pdk treeindex"
+# builds them for test runs that were imported before the table existed.
+#
+# The rows are the same names that pcgi_treewalk.collect_prefixes()
+# finds when it scans the test names, so if a test run does not have
+# any rows, the treewalk just does it the slow way.  If your database
+# does not have the table at all, nothing here touches it.
+#
+
+import re
+
+import pandokia
+
+# a test name level ends at the next / or .
+level_sep = re.compile('[/.]')
+
+# None = do not know yet, True/False = does the database have the table
+table_exists = None
+
+# the (test_run, parent, child, leaf) rows that we know are in the
+# database, so we do not have to look again
+known = set()
+
+
+def name_levels(test_name):
+    '''yield (parent, child, leaf) for each level of test_name
+
+    This is the same division into levels that the treewalk uses: a
+    level ends at the next '/' or '.', but a level is at least one
+    character long.
+    '''
+    parent = ''
+    while True:
+        l = len(parent)
+        y = level_sep.search(test_name, l + 1)
+        if not y:
+            yield (parent, test_name[l:], '1')
+            return
+        child = test_name[l:y.start() + 1]
+        yield (parent, child, '0')
+        parent = parent + child
+
+
+def have_table(db):
+    '''true if the database has a test_name_tree table
+
+    Call this at a time when you do not have anything uncommitted: if
+    the table is not there, we have to roll back the failed query.
+    '''
+    global table_exists
+    if table_exists is None:
+        try:
+            c = db.execute("SELECT leaf FROM test_name_tree WHERE 1 = 0")
+            c.fetchall()
+            table_exists = True
+        except db.DatabaseError:
+            db.rollback()
+            table_exists = False
+    return table_exists
+
+
+def add(db, test_run, test_name):
+    '''add the levels of test_name to the index for test_run
+
+    Does not commit; this is part of inserting the test result.
+    '''
+    if not table_exists:
+        return
+    # The unique index on the table rejects a level that an earlier
+    # import already added, so we do not look for it first.  An error
+    # in PostgreSQL spoils the whole transaction unless we roll back to
+    # a savepoint; the others just fail the one statement.
+    savepoint = db.pandokia_driver_name == 'psycopg2'
+    for parent, child, leaf in name_levels(test_name):
+        k = (test_run, parent, child, leaf)
+        if k in known:
+            continue
+        if savepoint:
+            db.execute("SAVEPOINT test_name_tree")
+        try:
+            db.execute(
+                "INSERT INTO test_name_tree ( test_run, parent, child, leaf ) VALUES ( :1, :2, :3, :4 )",
+                k)
+        except db.IntegrityError:
+            if savepoint:
+                db.execute("ROLLBACK TO SAVEPOINT test_name_tree")
+        else:
+            if savepoint:
+                db.execute("RELEASE SAVEPOINT test_name_tree")
+        known.add(k)
+
+
+def forget():
+    # Call this when you roll back a transaction that may have included
+    # add().  Some of what we know is not in the database any more.
+    known.clear()
+
+
+def children(db, test_run, parent):
+    '''the next level of test names below parent in test_run
+
+    Returns a sorted list of names, in the form that the treewalk uses:
+    a name that has more levels below it ends with '*'.  Returns None
+    if the index cannot answer -- no table, or nothing indexed for
+    this test run -- so the caller should look at the test names.
+    '''
+    if not have_table(db):
+        return None
+    c = db.execute(
+        "SELECT DISTINCT child, leaf FROM test_name_tree WHERE test_run = :1 AND parent = :2",
+        (test_run, parent))
+    l = []
+    for child, leaf in c:
+        if int(leaf):
+            l.append(parent + child)
+        else:
+            l.append(parent + child + '*')
+    if len(l) == 0:
+        return None
+    # The same order the test names would sort in; "a/*" sorts with
+    # the names that start "a/", not after them.
+    l.sort(key=lambda x: x.rstrip('*'))
+    return l
+
+
+def delete(db, test_run):
+    '''remove test_run from the index; does not commit'''
+    if not have_table(db):
+        return
+    db.execute("DELETE FROM test_name_tree WHERE test_run = :1", (test_run,))
+    forget()
+
+
+def rebuild(db, test_run):
+    '''make the index for test_run from the test results in the database'''
+    if not have_table(db):
+        return 0
+    delete(db, test_run)
+    c = db.execute(
+        "SELECT DISTINCT test_name FROM result_scalar WHERE test_run = :1",
+        (test_run,))
+    # collect first; some databases only allow one active cursor
+    names = [x for x, in c]
+    for test_name in names:
+        add(db, test_run, test_name)
+    db.commit()
+    return len(names)
+
+
+helpstr = '''
+pdk treeindex [ test_run ... ]
+
+Build the index that the treewalk uses to find the levels of the test
+name hierarchy, for test runs that were imported before the database
+had a test_name_tree table.  Test runs that are imported now are
+indexed by the importer.
+
+The test_run names may contain wild cards.
+'''
+
+
+def run(args):
+    import pandokia.common as common
+    pdk_db = pandokia.cfg.pdk_db
+
+    if len(args) == 0 or args[0] in ('-h', '--help'):
+        print(helpstr)
+        return 1
+
+    if not have_table(pdk_db):
+        print("no test_name_tree table in the database - see pandokia/sql/")
+        return 1
+
+    for test_run in args:
+        test_run = common.find_test_run(test_run)
+        where_text, where_dict = pdk_db.where_dict([('test_run', test_run)])
+        c = pdk_db.execute(
+            "SELECT test_run FROM distinct_test_run %s" % where_text,
+            where_dict)
+        for x, in [x for x in c]:
+            n = rebuild(pdk_db, x)
+            print("%s: %d test names" % (x, n))
+    return 0
@@ -21,6 +21,10 @@ from . import datespec  # for ascii comparisons
 import tempfile  # }
 
 import sys
+try:
+    from itertools import zip_longest
+except ImportError:
+    from itertools import izip_longest as zip_longest
 
 from pyraf import iraf  # }
 from iraf import images  # } for the iraf.imdelete task
@@ -252,29 +256,32 @@ class AsciiComparison(ComparisonClass):
             print((sys.exc_info[1]))
             raise
 
-        test = th.readlines()
-        ref = rh.readlines()
+        # Read both files a line at a time instead of all at once; the
+        # outputs we compare can be bigger than memory.  Only lines that
+        # are different need to go through the ignore patterns.
+        n = 0
+        tline = rline = ''
+        for tline, rline in zip_longest(th, rh):
+            if tline is None or rline is None:
+                break
+            n += 1
+            if tline == rline:
+                continue
+            if self.ignorep is not None:
+                tline = self.ignorep.sub(' IGNORE ', tline)
+                rline = self.ignorep.sub(' IGNORE ', rline)
+            if tline != rline:
+                self.diffs.append((tline, rline, n))
+
+        if tline is None or rline is None:
+            # Files of different sizes cannot be identical
+            ntest = n + (tline is not None) + sum(1 for x in th)
+            nref = n + (rline is not None) + sum(1 for x in rh)
+            self.diffs = [('%d lines' % ntest, '%d lines' % nref)]
 
         th.close()
         rh.close()
 
-        if len(test) != len(ref):
-            # Files of different sizes cannot be identical
-            self.diffs = [('%d lines' % len(test), '%d lines' % len(ref))]
-            self.failed = True
-
-        else:
-            for i in range(len(ref)):
-                # This may be slow, but it's clean
-                if self.ignorep is not None:
-                    tline = self.ignorep.sub(' IGNORE ', test[i])
-                    rline = self.ignorep.sub(' IGNORE ', ref[i])
-                else:
-                    tline = test[i]
-                    rline = ref[i]
-                if tline != rline:
-                    self.diffs.append((tline, rline, i + 1))
-
         if len(self.diffs) != 0:
             self.failed = True
         else:
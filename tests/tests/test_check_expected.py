@@ -0,0 +1,78 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import pandokia.db_sqlite as db_sqlite
+import pandokia.check_expected as check_expected
+import pandokia.pcgi_treewalk as pcgi_treewalk
+import pandokia.test_name_tree as test_name_tree
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+
+class CheckExpected(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved = (check_expected.pdk_db, pcgi_treewalk.pdk_db,
+                      test_name_tree.table_exists)
+        check_expected.pdk_db = self.db
+        pcgi_treewalk.pdk_db = self.db
+        test_name_tree.table_exists = None
+        test_name_tree.forget()
+
+    def tearDown(self):
+        (check_expected.pdk_db, pcgi_treewalk.pdk_db,
+         test_name_tree.table_exists) = self.saved
+        test_name_tree.forget()
+        if self.db.db is not None:
+            self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def prefixes(self, test_name):
+        # the treewalk from the index, and from looking at the test names
+        q = {'test_name': test_name + '*', 'test_run': 'r1', 'project': '*',
+             'host': '*', 'context': '*', 'status': '*', 'attn': '*'}
+        index = pcgi_treewalk.tree_index_prefixes(q)
+        saved = pcgi_treewalk.tree_index_prefixes
+        pcgi_treewalk.tree_index_prefixes = lambda q: None
+        try:
+            scan = pcgi_treewalk.collect_prefixes(q)
+        finally:
+            pcgi_treewalk.tree_index_prefixes = saved
+        return index, scan
+
+    def testmissing(self):
+        db = self.db
+        self.assertTrue(test_name_tree.have_table(db))
+        for name in ('a/b.c', 'a/d', 'zz/y.x'):
+            db.execute(
+                "INSERT INTO expected ( test_run_type, project, host, context, test_name ) VALUES ( 'daily', 'p', 'h', 'c', :1 )",
+                (name,))
+        db.execute(
+            "INSERT INTO result_scalar ( test_run, project, host, context, test_name, status, attn ) VALUES ( 'r1', 'p', 'h', 'c', 'a/b.c', 'P', 'N' )")
+        test_name_tree.add(db, 'r1', 'a/b.c')
+        db.commit()
+
+        # as if it were a new process
+        test_name_tree.table_exists = None
+        test_name_tree.forget()
+        check_expected.run(['daily', 'r1'])
+
+        for name in ('', 'a/', 'zz/'):
+            index, scan = self.prefixes(name)
+            self.assertEqual(index, scan)
+        self.assertEqual(self.prefixes('')[0], ['a/*', 'zz/*'])
+
+
+if __name__ == '__main__':
+    unittest.main()
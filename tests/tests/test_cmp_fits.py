@@ -0,0 +1,116 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandokia.helpers.filecomp as filecomp
+
+try:
+    import numpy
+    import astropy.io.fits as fits
+except ImportError:
+    fits = None
+
+
+@unittest.skipIf(fits is None, 'needs numpy and astropy')
+class CmpFits(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, *hdus):
+        name = os.path.join(self.dir, name)
+        fits.HDUList(list(hdus)).writeto(name)
+        return name
+
+    def cmp(self, a, b, **kwargs):
+        tra = {}
+        r = filecomp.cmp_fits(a, b, quiet=True, tra=tra, **kwargs)
+        return r, tra
+
+    def testscaled(self):
+        # an unsigned 16 bit image is stored with BZERO = 32768
+        d = numpy.arange(100, dtype=numpy.uint16) * 600
+        a = self.write('a.fits', fits.PrimaryHDU(d))
+        self.assertEqual(self.cmp(a, a), (True, {
+            'max_rel_diff': 0.0, 'mean_rel_diff': 0.0, 'n_diff': 0}))
+
+        d = d.copy()
+        d[99] += 1
+        b = self.write('b.fits', fits.PrimaryHDU(d))
+        r, tra = self.cmp(b, a)
+        self.assertFalse(r)
+        self.assertEqual(tra['n_diff'], 1)
+        self.assertAlmostEqual(tra['max_rel_diff'], 1.0 / (99 * 600))
+
+        # the same tolerance on the physical values as fitsdiff -r
+        self.assertTrue(self.cmp(b, a, maxdiff=1e-4)[0])
+
+    def testbscale(self):
+        d = numpy.arange(10, dtype=numpy.int16)
+        h1 = fits.PrimaryHDU(d)
+        h1.header['BSCALE'] = 2.0
+        h1.header['BLANK'] = 9
+        h2 = fits.PrimaryHDU(d)
+        h2.header['BSCALE'] = 2.0
+        h2.header['BLANK'] = 9
+        a = self.write('a.fits', h1)
+        b = self.write('b.fits', h2)
+        self.assertTrue(self.cmp(a, b)[0])
+
+        # the scale keywords are in the header comparison
+        h2.header['BSCALE'] = 3.0
+        c = self.write('c.fits', h2)
+        self.assertFalse(self.cmp(a, c)[0])
+
+    def testtable(self):
+        def table(x):
+            return fits.BinTableHDU.from_columns([
+                fits.Column(name='n', format='J', array=numpy.arange(5)),
+                fits.Column(name='x', format='D', array=x),
+                fits.Column(name='s', format='3A',
+                            array=['a', 'b', 'c', 'd', 'e'])])
+        x = numpy.linspace(1.0, 2.0, 5)
+        a = self.write('a.fits', fits.PrimaryHDU(), table(x))
+        self.assertTrue(self.cmp(a, a)[0])
+
+        y = x.copy()
+        y[2] *= 1.001
+        b = self.write('b.fits', fits.PrimaryHDU(), table(y))
+        r, tra = self.cmp(b, a)
+        self.assertFalse(r)
+        self.assertEqual(tra['n_diff'], 1)
+        self.assertTrue(self.cmp(b, a, maxdiff=0.01)[0])
+
+    def testnan(self):
+        x = numpy.array([1.0, numpy.nan, numpy.inf, -numpy.inf, 0.0])
+        a = self.write('a.fits', fits.PrimaryHDU(x))
+        self.assertTrue(self.cmp(a, a)[0])
+        self.assertTrue(self.cmp(a, a, maxdiff=0.1)[0])
+
+        # NaN is not the same as a number, and inf is not -inf
+        for i, v in ((1, 1.0), (0, numpy.nan), (2, -numpy.inf)):
+            y = x.copy()
+            y[i] = v
+            b = self.write('b%d.fits' % i, fits.PrimaryHDU(y))
+            r, tra = self.cmp(b, a, maxdiff=0.1)
+            self.assertFalse(r)
+            self.assertEqual(tra['n_diff'], 1)
+
+    def testtolerance(self):
+        x = numpy.array([1.0, 2.0, 4.0], dtype=numpy.float32)
+        y = x * numpy.float32(1.00001)
+        a = self.write('a.fits', fits.PrimaryHDU(x))
+        b = self.write('b.fits', fits.PrimaryHDU(y))
+        r, tra = self.cmp(b, a)
+        self.assertFalse(r)
+        self.assertEqual(tra['n_diff'], 3)
+        self.assertTrue(tra['max_rel_diff'] < 2e-5)
+        self.assertTrue(self.cmp(b, a, maxdiff=1e-4)[0])
+        self.assertFalse(self.cmp(b, a, maxdiff=1e-6)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
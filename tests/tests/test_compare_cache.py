@@ -0,0 +1,128 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandokia.helpers.compare_cache as compare_cache
+import pandokia.helpers.filecomp as filecomp
+
+
+class CompareCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved_env = dict(os.environ)
+        os.environ['PDK_TOP'] = self.dir
+        os.environ['PDK_COMPARECACHE'] = 'cache.db'
+        self.calls = []
+        filecomp.file_comparators['counting'] = self.counting
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        del filecomp.file_comparators['counting']
+        shutil.rmtree(self.dir)
+
+    def counting(self, the_file, reference_file, answer=True,
+                 attr_prefix=None, tra=None, **kwargs):
+        self.calls.append(the_file)
+        if tra is not None:
+            tra[(attr_prefix or '') + 'n_diff'] = len(self.calls)
+        return answer
+
+    def write(self, name, text):
+        name = os.path.join(self.dir, name)
+        with open(name, 'w') as f:
+            f.write(text)
+        return name
+
+    def check(self, out, ref, **kwargs):
+        return filecomp.check_file(out, 'counting', ref=ref, quiet=True,
+                                   **kwargs)
+
+    def testnocache(self):
+        del os.environ['PDK_COMPARECACHE']
+        self.assertEqual(compare_cache.open_cache(), None)
+        out = self.write('out', 'a\n')
+        self.check(out, out)
+        self.assertEqual(len(self.calls), 1)
+
+    def testidentical(self):
+        out = self.write('out', 'a\n')
+        ref = self.write('ref', 'a\n')
+        self.assertTrue(self.check(out, ref))
+        self.assertEqual(self.calls, [])
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'cache.db')))
+
+    def testverdict(self):
+        out = self.write('out', 'a\n')
+        ref = self.write('ref', 'b\n')
+        self.check(out, ref)
+        self.check(out, ref)
+        self.assertEqual(len(self.calls), 1)
+
+        # different args are a different comparison
+        self.check(out, ref, ignore='x')
+        self.check(out, ref, ignore='x')
+        self.assertEqual(len(self.calls), 2)
+
+        # different content is a different comparison
+        self.write('ref', 'cc\n')
+        self.check(out, ref)
+        self.assertEqual(len(self.calls), 3)
+
+    def testtra(self):
+        # a pass from the cache sets the same tra as the comparator did
+        out = self.write('out', 'a\n')
+        ref = self.write('ref', 'b\n')
+        tra = {}
+        self.check(out, ref, attr_prefix='cmp_0_', tra=tra)
+        self.assertEqual(tra, {'cmp_0_n_diff': 1})
+        tra = {'other': 'x'}
+        self.check(out, ref, attr_prefix='cmp_3_', tra=tra)
+        self.assertEqual(tra, {'other': 'x', 'cmp_3_n_diff': 1})
+        self.assertEqual(len(self.calls), 1)
+
+        # identical files do not need the comparator unless we want
+        # its tra, and then only the first time
+        ref = self.write('ref', 'a\n')
+        self.check(out, ref)
+        self.assertEqual(len(self.calls), 1)
+        for x in range(2):
+            tra = {}
+            self.check(out, ref, tra=tra)
+            self.assertEqual(tra, {'n_diff': 2})
+        self.assertEqual(len(self.calls), 2)
+
+    def testfailure(self):
+        # failures are not remembered
+        out = self.write('out', 'a\n')
+        ref = self.write('ref', 'b\n')
+        for x in range(2):
+            self.assertRaises(AssertionError, self.check, out, ref,
+                              answer=False)
+        self.assertEqual(len(self.calls), 2)
+
+    def testmissing(self):
+        # the comparator gets to report a missing file
+        out = os.path.join(self.dir, 'out')
+        ref = self.write('ref', 'b\n')
+        self.check(out, ref)
+        self.assertEqual(self.calls, [out])
+
+    def testevict(self):
+        saved = compare_cache.max_entries, compare_cache.evict_every
+        compare_cache.max_entries = 2
+        compare_cache.evict_every = 1
+        try:
+            c = compare_cache.open_cache()
+            for x in range(5):
+                c.remember('key%d' % x)
+            l = c.db.execute('SELECT key FROM verdict').fetchall()
+            c.close()
+        finally:
+            compare_cache.max_entries, compare_cache.evict_every = saved
+        self.assertEqual(sorted(x[0] for x in l), ['key3', 'key4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
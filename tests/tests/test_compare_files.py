@@ -0,0 +1,308 @@
+import unittest
+import os
+import re
+import sys
+import shutil
+import tempfile
+import pandokia.helpers.filecomp as filecomp
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+def sizes(the_file, reference_file, attr_prefix=None, tra=None, **kwargs):
+    # a comparator that puts something in the tra
+    n = os.path.getsize(the_file)
+    tra[attr_prefix + 'size'] = n
+    print('size %d' % n)
+    return n == os.path.getsize(reference_file)
+
+
+class CompareFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.saved_env = dict(os.environ)
+        for x in ('PDK_REFS', 'PDK_COMPARECACHE'):
+            os.environ.pop(x, None)
+        for x in ('out', 'ref'):
+            os.mkdir(x)
+        for name, out, ref in (
+                ('same.txt', 'a\nb\n', 'a\nb\n'),
+                ('diff.txt', 'a\nb\n', 'a\nc\n'),
+                ('same.bin', 'xyz', 'xyz'),
+                ('diff.bin', 'xyz', 'xya'),
+                ('noref.txt', 'a\n', None),
+                ('blank.txt', 'a  b\n\n', 'a b\n')):
+            with open('out/' + name, 'w') as f:
+                f.write(out)
+            if ref is not None:
+                with open('ref/' + name, 'w') as f:
+                    f.write(ref)
+
+        filecomp.file_comparators['sizes'] = sizes
+
+    def tearDown(self):
+        del filecomp.file_comparators['sizes']
+        os.chdir(self.saved_cwd)
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.dir)
+
+    def compare(self, parallel):
+        clist = [
+            ('same.txt', 'text'),
+            ('diff.txt', 'text'),
+            ('noref.txt', 'text'),
+            ('same.bin', 'binary'),
+            ('diff.bin', 'binary'),
+            ('blank.txt', 'text', {'ignore_regexp': 'b'}),
+            ('same.txt', 'sizes'),
+            ('diff.txt', 'sizes'),
+            ('blank.txt', 'text'),
+        ]
+        tda = {}
+        tra = {}
+        saved = sys.stdout, sys.stderr
+        sys.stdout = out = StringIO()
+        sys.stderr = err = StringIO()
+        try:
+            filecomp.compare_files(clist, okroot='t', tda=tda, tra=tra,
+                                   cleanup=False, parallel=parallel)
+            exc = None
+        except Exception as e:
+            exc = e
+        finally:
+            sys.stdout, sys.stderr = saved
+        with open('t.okfile') as f:
+            okfile = f.read()
+        return (out.getvalue(), err.getvalue(), okfile, tda, tra,
+                type(exc), str(exc))
+
+    def testsame(self):
+        sequential = self.compare(None)
+        self.assertEqual(sequential[5], AssertionError)
+        self.assertTrue('noref.txt' in sequential[2])
+        self.assertTrue('Traceback' in sequential[1])
+        self.assertEqual(sequential[4], {'cmp_6_size': 4, 'cmp_7_size': 4})
+        for n in (2, 4):
+            self.assertEqual(self.compare(n), sequential)
+
+    def testinterrupt(self):
+        # stdout is put back even if we do not get to the end
+        def interrupt(*args):
+            raise KeyboardInterrupt()
+        saved = filecomp._finish_parallel
+        saved_stdout = sys.stdout
+        filecomp._finish_parallel = interrupt
+        try:
+            self.assertRaises(KeyboardInterrupt, filecomp.compare_files,
+                              [('same.txt', 'text'), ('same.bin', 'binary')],
+                              cleanup=False, parallel=2)
+        finally:
+            filecomp._finish_parallel = saved
+        self.assertTrue(sys.stdout is saved_stdout)
+
+
+
+def old_cmp_text(the_file, reference_file, **kwargs):
+    # cmp_text the way it was before it read the files a line at a time,
+    # to check that the report is the same
+    ignore = []
+    ignore_raw = {}
+    for val in kwargs.get('ignore_regexp', []):
+        ignore_raw['regexp'] = val
+        ignore.append(val)
+    if kwargs.get('ignore_date', False):
+        ignore_raw['date'] = True
+        if filecomp.cmp_text_timestamp is None:
+            filecomp.cmp_text_assemble_timestamp()
+        ignore.append(filecomp.cmp_text_timestamp)
+    ignorep = None
+    if ignore:
+        ignorep = re.compile('|'.join(ignore))
+
+    with open(the_file) as f:
+        test = f.readlines()
+    with open(reference_file) as f:
+        ref = f.readlines()
+
+    diffs = []
+    if len(test) != len(ref):
+        diffs = [('%d lines' % len(test), '%d lines' % len(ref))]
+    else:
+        for tline, rline in zip(test, ref):
+            if ignorep is not None:
+                tline = ignorep.sub(' IGNORE ', tline)
+                rline = ignorep.sub(' IGNORE ', rline)
+            if tline != rline:
+                diffs.append((tline, rline))
+    if not diffs:
+        return True
+
+    fh = sys.stdout
+    fh.write("\nText Comparison\n")
+    fh.write("Test file:      %s\n" % the_file)
+    fh.write("Reference file: %s\n" % reference_file)
+    fh.write("\n")
+    if len(ignore_raw) > 0:
+        fh.write("Patterns to ignore: \n")
+        for k in ignore_raw:
+            fh.write('  %s: %s\n' % (k, ignore_raw[k]))
+    fh.write('\n')
+    fwidth = max(len(the_file), len(reference_file))
+    for tline, rline in diffs:
+        fh.write("%-*s: %s\n" % (fwidth, the_file, tline.rstrip()))
+        fh.write("%-*s: %s\n" % (fwidth, reference_file, rline.rstrip()))
+        fh.write("\n")
+    return False
+
+
+class Stream(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.saved_max_diffs = filecomp.cmp_text_max_diffs
+
+    def tearDown(self):
+        filecomp.cmp_text_max_diffs = self.saved_max_diffs
+        os.chdir(self.saved_cwd)
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text, mode='w'):
+        with open(name, mode) as f:
+            f.write(text)
+
+    def run_cmp(self, fn, *args, **kwargs):
+        saved = sys.stdout
+        sys.stdout = out = StringIO()
+        try:
+            r = fn(*args, **kwargs)
+        finally:
+            sys.stdout = saved
+        return r, out.getvalue()
+
+    def same_as_old(self, test, ref, **kwargs):
+        self.write('t.txt', test)
+        self.write('r.txt', ref)
+        new = self.run_cmp(filecomp.cmp_text, 't.txt', 'r.txt', **kwargs)
+        old = self.run_cmp(old_cmp_text, 't.txt', 'r.txt', **kwargs)
+        self.assertEqual(new, old)
+        # quiet gives the same answer, and says nothing
+        self.assertEqual(
+            self.run_cmp(filecomp.cmp_text, 't.txt', 'r.txt', quiet=True,
+                         **kwargs), (new[0], ''))
+        return new
+
+    def testlength(self):
+        lines = ''.join(['line %d\n' % n for n in range(10)])
+        for test, ref in (
+                (lines, lines + 'more\n'),
+                (lines + 'more\nand more\n', lines),
+                ('', lines),
+                # different before the end of the shorter file: only the
+                # line counts are reported
+                ('x\n' + lines, lines)):
+            r, out = self.same_as_old(test, ref)
+            self.assertFalse(r)
+            self.assertTrue(
+                '%d lines' % test.count('\n') in out and
+                '%d lines' % ref.count('\n') in out)
+
+        # no newline at the end is still a line
+        r, out = self.same_as_old(lines + 'x', lines)
+        self.assertTrue('11 lines' in out)
+        self.assertEqual(self.same_as_old('', ''), (True, ''))
+
+    def testmaxdiffs(self):
+        test = ''.join(['test %d\n' % n for n in range(10)])
+        ref = ''.join(['ref %d\n' % n for n in range(10)])
+        self.write('t.txt', test)
+        self.write('r.txt', ref)
+
+        # under the cap, it is the same report as before
+        r, out = self.same_as_old(test, ref)
+        self.assertEqual(out.count('t.txt: test'), 10)
+
+        filecomp.cmp_text_max_diffs = 3
+        r, out = self.run_cmp(filecomp.cmp_text, 't.txt', 'r.txt')
+        self.assertFalse(r)
+        self.assertEqual(out.count('t.txt: test'), 3)
+        self.assertEqual(out.count('r.txt: ref'), 3)
+        self.assertTrue('t.txt: test 2\n' in out)
+        self.assertFalse('test 3' in out)
+        self.assertTrue(
+            out.endswith('... and 7 more lines that are different\n'))
+
+    def testignore(self):
+        dates = [
+            'Mon Jan 02 12:30:45 EST 2017',
+            'Tue 12:30:45 03 Feb 2018',
+            'Mar 04 12:30',
+        ]
+        other = [
+            'Wed Jun 07 01:02:03 EDT 2019',
+            'Sun 23:59:59 31 Dec 2001',
+            'Jul 31 00:00',
+        ]
+        test = ''.join(['written %s by a\n' % x for x in dates])
+        ref = ''.join(['written %s by a\n' % x for x in other])
+
+        self.assertEqual(self.same_as_old(test, ref, ignore_date=True),
+                         (True, ''))
+        r, out = self.same_as_old(test, ref)
+        self.assertFalse(r)
+
+        # a line that is different apart from the date
+        r, out = self.same_as_old(test + 'one\n', ref + 'two\n',
+                                  ignore_date=True)
+        self.assertFalse(r)
+        self.assertTrue('Patterns to ignore' in out)
+        self.assertTrue('t.txt: one' in out)
+        self.assertFalse('written' in out)
+
+        r, out = self.same_as_old(test + 'one\n', ref + 'two\n',
+                                  ignore_date=True, ignore_regexp=['one|two'])
+        self.assertTrue(r)
+
+    def testbinary(self):
+        data = os.urandom(3 * filecomp.cmp_binary_blksize + 1000)
+        self.write('r.bin', data, 'wb')
+        self.write('t.bin', data, 'wb')
+        self.assertEqual(
+            self.run_cmp(filecomp.cmp_binary, 't.bin', 'r.bin'), (True, ''))
+
+        for offset in (0, 5000, filecomp.cmp_binary_blksize,
+                       2 * filecomp.cmp_binary_blksize + 777, len(data) - 1):
+            c = data[offset:offset + 1]
+            changed = data[:offset] + (b'\0' if c != b'\0' else b'\1') + \
+                data[offset + 1:]
+            self.write('t.bin', changed, 'wb')
+            r, out = self.run_cmp(filecomp.cmp_binary, 't.bin', 'r.bin')
+            self.assertFalse(r)
+            self.assertTrue(
+                out.endswith('first difference at byte offset %d\n' % offset))
+            self.assertEqual(
+                self.run_cmp(filecomp.cmp_binary, 't.bin', 'r.bin',
+                             quiet=True), (False, ''))
+
+        # a file that is the same as the start of the other one is
+        # different where the shorter one ends
+        self.write('t.bin', data[:10000], 'wb')
+        r, out = self.run_cmp(filecomp.cmp_binary, 't.bin', 'r.bin')
+        self.assertFalse(r)
+        self.assertTrue('files are different size' in out)
+        self.assertTrue(out.endswith('byte offset 10000\n'))
+        self.assertEqual(
+            self.run_cmp(filecomp.cmp_binary, 't.bin', 'r.bin', quiet=True),
+            (False, ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
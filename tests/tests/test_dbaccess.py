@@ -0,0 +1,151 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import pandokia.db_sqlite as db_sqlite
+import pandokia.helpers.dbaccess as dbaccess
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+
+class DbaccessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved = dbaccess.pdk_db
+        dbaccess.pdk_db = self.db
+
+    def tearDown(self):
+        dbaccess.pdk_db = self.saved
+        if self.db.db is not None:
+            self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def add_result(self, key_id, test_run, project, host, context, test_name,
+                   status='P'):
+        self.db.execute(
+            "INSERT INTO result_scalar ( key_id, test_run, project, host, context, test_name, status ) VALUES ( :1, :2, :3, :4, :5, :6, :7 )",
+            (key_id, test_run, project, host, context, test_name, status))
+
+
+class StatusHistory(DbaccessTest):
+
+    def testhistory(self):
+        self.add_result(1, 'r1', 'p', 'h', 'c', 'a', 'P')
+        self.add_result(2, 'r2', 'p', 'h', 'c', 'a', 'F')
+        self.add_result(3, 'r1', 'p', None, 'c', 'b', 'E')
+        self.add_result(4, 'r2', 'p', None, 'c', 'b', 'P')
+        self.add_result(5, 'r2', 'p', 'h', None, 'b', 'P')
+        self.add_result(6, 'r3', 'p', 'h', 'c', 'a', 'P')
+        self.db.commit()
+
+        identities = [('p', 'h', 'c', 'a'), ('p', None, 'c', 'b'),
+                      ('p', 'h', None, 'b'), ('p', 'h', 'c', 'nothere')]
+        self.assertEqual(
+            dbaccess.status_history(identities, ['r1', 'r2']), {
+                ('p', 'h', 'c', 'a'): {'r1': ('P', 1), 'r2': ('F', 2)},
+                ('p', None, 'c', 'b'): {'r1': ('E', 3), 'r2': ('P', 4)},
+                ('p', 'h', None, 'b'): {'r2': ('P', 5)},
+                ('p', 'h', 'c', 'nothere'): {},
+            })
+
+        # the same answer a chunk at a time
+        self.assertEqual(
+            dbaccess.status_history(identities, ['r1', 'r2'], chunk_size=1),
+            dbaccess.status_history(identities, ['r1', 'r2']))
+
+
+class QidAlgebra(DbaccessTest):
+
+    def setUp(self):
+        DbaccessTest.setUp(self)
+        self.add_result(1, 'r1', 'p', 'h', 'c', 'a')
+        self.add_result(2, 'r1', 'p', 'h', 'c', 'b')
+        self.add_result(3, 'r1', 'p', 'h', None, 'c')
+        self.add_result(4, 'r2', 'p', 'h', 'c', 'a')
+        self.add_result(5, 'r2', 'p', 'h2', 'c', 'b')
+        self.add_result(6, 'r2', 'p', 'h', None, 'c')
+        self.add_result(7, 'r2', 'p', 'h', 'c', 'd')
+        self.db.commit()
+
+    def qid(self, qid, key_ids):
+        for key_id in key_ids:
+            self.db.execute(
+                "INSERT INTO query ( qid, key_id ) VALUES ( :1, :2 )",
+                (qid, key_id))
+        self.db.commit()
+
+    def check(self, op, a, b, expect, n, **kw):
+        # qid 1 is a, qid 2 is b; after op, qid 1 is expect and b is the
+        # same as before
+        self.db.execute("DELETE FROM query")
+        self.qid(1, a)
+        self.qid(2, b)
+        self.assertEqual(op(1, 2, **kw), n)
+        self.assertEqual(dbaccess.qid_key_ids(1), set(expect))
+        self.assertEqual(dbaccess.qid_key_ids(2), set(b))
+        c = self.db.execute("SELECT count(*) FROM query WHERE qid = 1")
+        self.assertEqual(c.fetchone()[0], len(expect))
+
+    def testunion(self):
+        self.check(dbaccess.qid_union, [1, 2, 3], [3, 4], [1, 2, 3, 4], 1)
+        self.check(dbaccess.qid_union, [1, 2], [3, 4], [1, 2, 3, 4], 2)
+        self.check(dbaccess.qid_union, [1, 2], [1, 2], [1, 2], 0)
+        self.check(dbaccess.qid_union, [], [3, 4], [3, 4], 2)
+        self.check(dbaccess.qid_union, [1, 2], [], [1, 2], 0)
+        self.check(dbaccess.qid_union, [], [], [], 0)
+        # a key_id that is in other_qid twice is added once
+        self.check(dbaccess.qid_union, [1], [2, 2], [1, 2], 1)
+
+    def testintersection(self):
+        self.check(dbaccess.qid_intersection, [1, 2, 3], [3, 4], [3], 2)
+        self.check(dbaccess.qid_intersection, [1, 2], [3, 4], [], 2)
+        self.check(dbaccess.qid_intersection, [1, 2], [1, 2], [1, 2], 0)
+        self.check(dbaccess.qid_intersection, [], [3, 4], [], 0)
+        self.check(dbaccess.qid_intersection, [1, 2], [], [], 2)
+
+    def testdifference(self):
+        self.check(dbaccess.qid_difference, [1, 2, 3], [3, 4], [1, 2], 1)
+        self.check(dbaccess.qid_difference, [1, 2], [3, 4], [1, 2], 0)
+        self.check(dbaccess.qid_difference, [1, 2], [1, 2], [], 2)
+        self.check(dbaccess.qid_difference, [], [3, 4], [], 0)
+        self.check(dbaccess.qid_difference, [1, 2], [], [1, 2], 0)
+
+    def testidentitydifference(self):
+        op = dbaccess.qid_identity_difference
+        # r2 has a (same identity), b on another host, c (the same
+        # identity, with no context), and d
+        self.check(op, [4, 5, 6, 7], [1, 2, 3], [5, 7], 2)
+        self.check(op, [4, 5, 6, 7], [1, 2, 3], [7], 3,
+                   fields=('test_name',))
+        self.check(op, [4, 5, 6, 7], [1, 2, 3], [5, 7], 2,
+                   fields=('host', 'test_name'))
+        self.check(op, [4, 5, 6, 7], [4, 5, 6, 7], [], 4)
+        self.check(op, [], [1, 2, 3], [], 0)
+        self.check(op, [4, 5], [], [4, 5], 0)
+        self.assertRaises(ValueError, op, 1, 2, fields=('location',))
+
+    def testremove(self):
+        self.qid(1, [1, 2, 3])
+        self.qid(2, [1, 2])
+        self.assertEqual(dbaccess.qid_remove_key_ids(1, [2, 3, 5]), 3)
+        self.assertEqual(dbaccess.qid_key_ids(1), set([1]))
+        self.assertEqual(dbaccess.qid_key_ids(2), set([1, 2]))
+        self.assertEqual(dbaccess.qid_remove_key_ids(1, []), 0)
+        self.assertEqual(dbaccess.qid_key_ids(1), set([1]))
+        # more than one chunk
+        self.assertEqual(dbaccess.qid_remove_key_ids(2, range(1, 2000)), 1999)
+        self.assertEqual(dbaccess.qid_key_ids(2), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
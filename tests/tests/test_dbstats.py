@@ -0,0 +1,97 @@
+import unittest
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import pandokia
+import pandokia.db_sqlite as db_sqlite
+import pandokia.dbstats as dbstats
+import pandokia.test_identity as test_identity
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+
+class Dbstats(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        c.execute(
+            "INSERT INTO result_scalar ( key_id, test_run, project, host, context, test_name, status ) VALUES ( 1, 'daily_1', 'p', 'h', 'c', 'a/b', 'P' )")
+        c.execute(
+            "INSERT INTO distinct_test_run ( test_run ) VALUES ( 'daily_1' )")
+        c.execute("INSERT INTO query ( qid, key_id ) VALUES ( 1, 1 )")
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved_db = pandokia.cfg.pdk_db
+        pandokia.cfg.pdk_db = self.db
+        test_identity.is_normalized = None
+
+    def tearDown(self):
+        pandokia.cfg.pdk_db = self.saved_db
+        test_identity.is_normalized = None
+        self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def dbstats(self, *args):
+        saved = sys.stdout
+        sys.stdout = out = StringIO()
+        try:
+            self.assertEqual(dbstats.run(['--repeat', '1'] + list(args)), 0)
+        finally:
+            sys.stdout = saved
+        return out.getvalue()
+
+    def testcatalogue(self):
+        # every statement is really in its module, and runs
+        for name, module, attr, where, parameters, want in dbstats.catalogue:
+            sql, params = dbstats.statement(
+                self.db, module, attr, where, parameters,
+                dbstats.sample_parameters(self.db))
+            self.db.execute(sql, params).fetchall()
+
+        # the schema has the indexes, except for the cleaner's
+        out = self.dbstats()
+        self.assertEqual(out.count('MISSING'), 1)
+        self.assertTrue(out.endswith('recommended indexes:\n'
+                                     '    CREATE INDEX query_id_expires ON query_id ( expires ) ;\n'))
+
+    def testnames(self):
+        # result_scalar_history is the name of something else now
+        self.db.execute("DROP INDEX result_scalar_history")
+        self.db.execute(
+            "CREATE INDEX result_scalar_history ON query ( key_id )")
+        # and there is no expected table
+        self.db.execute("DROP TABLE expected")
+        self.db.commit()
+
+        out = self.dbstats('--create')
+        self.assertTrue('(no table)' in out)
+        self.assertTrue('CREATE INDEX query_id_expires ON query_id ( expires )' in out)
+        self.assertTrue(
+            'CREATE INDEX result_scalar_history_2 ON result_scalar ( project, host, context, test_name, test_run )' in out)
+        self.assertEqual(
+            dbstats.table_indexes(self.db, 'query'),
+            [('result_scalar_history', ['key_id']), ('query_index', ['qid'])])
+        self.assertTrue(
+            ('result_scalar_history_2',
+             ['project', 'host', 'context', 'test_name', 'test_run'])
+            in dbstats.table_indexes(self.db, 'result_scalar'))
+
+        # and now it is not missing
+        self.assertTrue('no missing indexes' in self.dbstats())
+
+
+if __name__ == '__main__':
+    unittest.main()
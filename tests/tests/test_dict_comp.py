@@ -0,0 +1,93 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandokia.helpers.dict_comp as dict_comp
+
+# a little of everything: ints, floats, ints with float references,
+# zeros, an int too big for a float, strings, bools, and a field that
+# is not in the reference
+data = {
+    'i': 3, 'i_same': 7, 'i_zero': 0, 'i_refzero': 2, 'i_big': 10 ** 400,
+    'f': 1.5, 'f_same': 2.25, 'f_zero': 0.0, 'f_refzero': 1e-3,
+    'f_close': 1.0 + 1e-9, 'f_nan': float('nan'),
+    'mixed': 2, 'mixed_zero': 0, 'mixed_rev': 4.0,
+    's': 'abc', 'b': True,
+    'no_ref': 1.0,
+    'list': [1, 2.5, 0],
+}
+
+ref = {
+    'i': 4, 'i_same': 7, 'i_zero': 0, 'i_refzero': 0, 'i_big': 10 ** 400 + 1,
+    'f': 1.0, 'f_same': 2.25, 'f_zero': 0.0, 'f_refzero': 0.0,
+    'f_close': 1.0, 'f_nan': 1.0,
+    'mixed': 2.5, 'mixed_zero': 0.0, 'mixed_rev': 4,
+    's': 'abd', 'b': False,
+    'list.0': 1, 'list.1': 2.0, 'list.2': 0.0,
+}
+
+
+class DictComp(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        for x in ('output', 'ref'):
+            os.mkdir(x)
+        with open('ref/mixed', 'w') as f:
+            f.write(repr(ref))
+
+    def tearDown(self):
+        os.chdir(self.saved_cwd)
+        shutil.rmtree(self.dir)
+
+    def comp(self, **kwargs):
+        tda = {}
+        tra = {}
+        try:
+            dict_comp.dictionary_comp(data, 'mixed', tda=tda, tra=tra,
+                                      **kwargs)
+            fail = False
+        except AssertionError:
+            fail = True
+        # repr keeps 0 and 0.0 apart, and makes nan equal to nan
+        return (fail, sorted(tda.items()),
+                sorted((k, type(v), repr(v)) for k, v in tra.items()))
+
+    def slow_comp(self, **kwargs):
+        # with no fast types, every field goes through the loop that
+        # dictionary_comp always had
+        saved = dict_comp._fast_types
+        dict_comp._fast_types = ()
+        try:
+            return self.comp(**kwargs)
+        finally:
+            dict_comp._fast_types = saved
+
+    def without_numeric_max(self, result):
+        fail, tda, tra = result
+        tra = [x for x in tra if not x[0].startswith('numeric_max_discrep')]
+        return fail, tda, tra
+
+    def testsame(self):
+        for kwargs in ({}, {'fail_only': True},
+                       {'tolerance_dict': {'f_close': 1e-10, 'f': 0.6}},
+                       {'fp_tolerance': 0.3}):
+            fast = self.comp(**kwargs)
+            self.assertTrue(fast[0])
+            self.assertEqual(self.without_numeric_max(fast),
+                             self.slow_comp(**kwargs))
+
+    def testints(self):
+        fail, tda, tra = self.comp()
+        tra = dict((k, t) for k, t, v in tra)
+        self.assertEqual(tra['discrep_i_zero'], int)
+        self.assertEqual(tra['discrep_i_refzero'], int)
+        self.assertEqual(tra['discrep_f_zero'], int)
+        self.assertEqual(tra['discrep_i_big'], float)
+        self.assertEqual(tra['numeric_max_discrep_var'], str)
+
+
+if __name__ == '__main__':
+    unittest.main()
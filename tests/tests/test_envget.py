@@ -1,6 +1,7 @@
 import unittest
 import os
 import shutil
+import tempfile
 import pprint
 import pandokia.envgetter as envgetter
 import sys
@@ -292,6 +293,105 @@ class TestUnsub(unittest.TestCase):
             pass
 
 
+#----------------------------------------------------
+
+
+class TestEnvCache(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_env = dict(os.environ)
+        os.environ.pop('PDK_ENVCACHE', None)
+        envgetter.file_cache.clear()
+        self.dir = tempfile.mkdtemp()
+        self.top = os.path.join(self.dir, 'top')
+        self.sub = os.path.join(self.top, 'sub')
+        os.makedirs(self.sub)
+        open(os.path.join(self.top, 'pandokia_top'), 'w').close()
+        self.write(self.top, 'color=$sky\nfruit=apple\n')
+        self.write(self.sub, 'grass=$color/green\n')
+        # values from the default dict (normally os.environ) are
+        # substituted too
+        self.base = dict(sky='blue', where='$sky/up', nothing='$notset')
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        envgetter.file_cache.clear()
+        shutil.rmtree(self.dir)
+
+    def write(self, dirname, text):
+        f = open(os.path.join(dirname, 'pdk_environment'), 'w')
+        f.write('[default]\n' + text)
+        f.close()
+
+    def envdir(self):
+        x = envgetter.EnvGetter(defdict=self.base)
+        try:
+            return x.envdir(self.sub)
+        except KeyError:
+            # notset is missing
+            return x.nodes[self.sub].final
+
+    def testsubstitute(self):
+        tst = self.envdir()
+        self.assertEqual(tst['color'], 'blue')
+        self.assertEqual(tst['grass'], 'blue/green')
+        self.assertEqual(tst['where'], 'blue/up')
+        self.assertEqual(tst['nothing'], '$notset')
+
+    def testhit(self):
+        ref = self.envdir()
+        parsed = envgetter.parse_count
+        hits = envgetter.cache_hit_count
+        self.assertEqual(self.envdir(), ref)
+        self.assertEqual(envgetter.parse_count, parsed)
+        self.assertTrue(envgetter.cache_hit_count > hits)
+
+    def testmtime(self):
+        self.envdir()
+        # same size, different time
+        self.write(self.sub, 'grass=$color/brown\n')
+        fname = os.path.join(self.sub, 'pdk_environment')
+        st = os.stat(fname)
+        os.utime(fname, (st.st_atime, st.st_mtime + 10))
+        parsed = envgetter.parse_count
+        self.assertEqual(self.envdir()['grass'], 'blue/brown')
+        self.assertEqual(envgetter.parse_count, parsed + 1)
+
+    def testsize(self):
+        self.envdir()
+        # same time, different size
+        fname = os.path.join(self.sub, 'pdk_environment')
+        st = os.stat(fname)
+        self.write(self.sub, 'grass=$color/greener\n')
+        os.utime(fname, (st.st_atime, st.st_mtime))
+        parsed = envgetter.parse_count
+        self.assertEqual(self.envdir()['grass'], 'blue/greener')
+        self.assertEqual(envgetter.parse_count, parsed + 1)
+
+    def testenvcache(self):
+        ref = self.envdir()
+        envgetter.file_cache.clear()
+
+        os.environ['PDK_ENVCACHE'] = os.path.join(self.dir, 'envcache')
+        x = envgetter.EnvGetter(defdict=self.base)
+        x.populate(self.sub)
+        x.save_cache()
+        self.assertEqual(x.nodes[self.sub].final, ref)
+
+        # another process loads the cache and does not parse anything
+        envgetter.file_cache.clear()
+        parsed = envgetter.parse_count
+        self.assertEqual(self.envdir(), ref)
+        self.assertEqual(envgetter.parse_count, parsed)
+
+        # but it sees a file that changed since the cache was saved
+        envgetter.file_cache.clear()
+        self.write(self.top, 'color=$sky\nfruit=banana\n')
+        self.assertEqual(self.envdir()['fruit'], 'banana')
+        self.assertEqual(envgetter.parse_count, parsed + 1)
+
+
 def dict_compare(ref, tst, title='', full=False):
     '''
     dict_compare( reference_dictionary, test_dictionary,
@@ -0,0 +1,141 @@
+import unittest
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import pandokia.db_sqlite as db_sqlite
+import pandokia.gen_expected as gen_expected
+import pandokia.import_contact as import_contact
+
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+results = [
+    ('r1', 'p', 'h', 'c', 'a/one'),
+    ('r1', 'p', 'h', 'c', 'a/two'),
+    ('r1', 'p', None, 'c', 'a/one'),
+    ('r1', 'p', 'h', None, 'b/one'),
+    ('r1', 'p', None, None, 'b/two'),
+    ('r1', None, 'h', 'c', 'a/one'),
+    ('r1', 'q', 'h', 'c', 'a/one'),
+    ('r1', 'p', 'h', 'c', 'x/nose.failure.Failure.runTest'),
+    ('r2', 'p', 'h', 'c', 'a/three'),
+]
+
+expected_rows = "SELECT test_run_type, project, host, context, test_name FROM expected ORDER BY project, host, context, test_name"
+
+contact_rows = "SELECT project, test_name, email FROM contact ORDER BY project, test_name, email"
+
+
+def key(row):
+    # sort the way the database does, with NULL first
+    return [(x is not None, x) for x in row]
+
+
+class GenExpected(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        for x in results:
+            c.execute(
+                "INSERT INTO result_scalar ( test_run, project, host, context, test_name, status ) VALUES ( ?, ?, ?, ?, ?, 'P' )",
+                x)
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved = gen_expected.pdk_db, import_contact.pdk_db
+        gen_expected.pdk_db = self.db
+        import_contact.pdk_db = self.db
+
+    def tearDown(self):
+        gen_expected.pdk_db, import_contact.pdk_db = self.saved
+        if self.db.db is not None:
+            self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def gen_expected(self, *args):
+        saved = sys.stdout
+        sys.stdout = out = StringIO()
+        try:
+            gen_expected.run(list(args))
+        finally:
+            sys.stdout = saved
+        return out.getvalue()
+
+    def import_contact(self, text):
+        saved = sys.stdin, sys.stdout
+        sys.stdin = StringIO(text)
+        sys.stdout = StringIO()
+        try:
+            import_contact.run()
+        finally:
+            sys.stdin, sys.stdout = saved
+
+    def testexpected(self):
+        expect = sorted([('daily',) + x[1:] for x in results
+                         if x[0] == 'r1' and 'nose' not in x[4]], key=key)
+
+        out = self.gen_expected('daily', 'r1')
+        self.assertTrue('7 tests added' in out)
+        self.assertEqual(list(self.db.execute(expected_rows)), expect)
+
+        # the tests with a NULL are already there the second time
+        out = self.gen_expected('daily', 'r1')
+        self.assertTrue('0 tests added' in out)
+        self.assertEqual(list(self.db.execute(expected_rows)), expect)
+
+        # only what is new, and only for the host asked for
+        out = self.gen_expected('daily', 'r*', '-h', 'h')
+        self.assertTrue('1 tests added' in out)
+        expect = sorted(expect + [('daily', 'p', 'h', 'c', 'a/three')],
+                        key=key)
+        self.assertEqual(list(self.db.execute(expected_rows)), expect)
+
+        # another test_run_type is separate
+        out = self.gen_expected('weekly', 'r2')
+        self.assertTrue('1 tests added' in out)
+
+    def testcontact(self):
+        self.gen_expected('daily', 'r1')
+        self.gen_expected('weekly', 'r1')
+        self.db.execute(
+            "INSERT INTO contact ( project, test_name, email ) VALUES ( 'q', 'old', 'old@x' )")
+        self.db.execute(
+            "INSERT INTO contact ( project, test_name, email ) VALUES ( 'z', 'old', 'old@x' )")
+        self.db.commit()
+
+        text = ('p,a/,alice\n'
+                'p,a/o,alice\n'
+                'p,,bob\n'
+                'p,b/,carol\n'
+                '\n'
+                'q,,\n')
+        expect = [
+            ('p', 'a/one', 'alice'),
+            ('p', 'a/one', 'bob'),
+            ('p', 'a/two', 'alice'),
+            ('p', 'a/two', 'bob'),
+            ('p', 'b/one', 'bob'),
+            ('p', 'b/one', 'carol'),
+            ('p', 'b/two', 'bob'),
+            ('p', 'b/two', 'carol'),
+            # q was cleared; z was not in the file
+            ('z', 'old', 'old@x'),
+        ]
+        for n in range(2):
+            self.import_contact(text)
+            self.assertEqual(list(self.db.execute(contact_rows)), expect)
+
+
+if __name__ == '__main__':
+    unittest.main()
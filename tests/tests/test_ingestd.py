@@ -0,0 +1,265 @@
+import unittest
+import os
+import sys
+import time
+import signal
+import socket
+import shutil
+import sqlite3
+import tempfile
+import pandokia
+import pandokia.db_sqlite as db_sqlite
+import pandokia.import_data as import_data
+import pandokia.ingestd as ingestd
+import pandokia.test_identity as test_identity
+import pandokia.test_name_tree as test_name_tree
+import pandokia.helpers.pycode as pycode
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+# what pdkrun gives the runner
+environment = {
+    'PDK_TESTRUN': 'run1',
+    'PDK_PROJECT': 'proj',
+    'PDK_HOST': 'host1',
+    'PDK_CONTEXT': 'ctx',
+    'PDK_RUNNER': 'minipyt',
+    'PDK_FILE': 'test_x.py',
+    'PDK_TESTPREFIX': 'dir/',
+}
+
+# the SETDEFAULT block that pdkrun writes in the log for test_x.py
+pdkrun_header = '''
+
+START
+test_run=run1
+project=proj
+host=host1
+location=%s/test_x.py
+test_runner=minipyt
+context=ctx
+SETDEFAULT
+'''
+
+queries = [
+    "SELECT test_run, project, host, context, test_name, status, test_runner, start_time, end_time, location, attn FROM result_scalar ORDER BY test_name",
+    "SELECT s.test_name, t.name, t.value FROM result_scalar s, result_tda t WHERE s.key_id = t.key_id ORDER BY 1, 2",
+    "SELECT s.test_name, t.name, t.value FROM result_scalar s, result_tra t WHERE s.key_id = t.key_id ORDER BY 1, 2",
+    "SELECT s.test_name, l.log FROM result_scalar s, result_log l WHERE s.key_id = l.key_id ORDER BY 1",
+    "SELECT test_run FROM distinct_test_run ORDER BY 1",
+]
+
+
+def forget_caches():
+    # as if each database were used by a new process
+    import_data.default_record = {}
+    import_data.all_test_runs.clear()
+    test_name_tree.table_exists = None
+    test_name_tree.forget()
+    test_identity.is_normalized = None
+    test_identity.forget()
+
+
+class Ingestd(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.saved_env = dict(os.environ)
+        self.saved_db = pandokia.cfg.pdk_db
+        self.saved_ingestd = (ingestd.spill_filename, ingestd.quiet,
+                              ingestd.count_inserted, ingestd.count_skipped,
+                              ingestd.count_spilled)
+        self.socket_name = os.path.join(self.dir, 'ingest.sock')
+        os.environ.update(environment)
+        os.environ['PDK_DIRECTORY'] = self.dir
+        forget_caches()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        pandokia.cfg.pdk_db = self.saved_db
+        (ingestd.spill_filename, ingestd.quiet, ingestd.count_inserted,
+         ingestd.count_skipped, ingestd.count_spilled) = self.saved_ingestd
+        forget_caches()
+        shutil.rmtree(self.dir)
+
+    def new_db(self, name):
+        fname = os.path.join(self.dir, name)
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        c.commit()
+        c.close()
+        return fname
+
+    def rows(self, fname):
+        c = sqlite3.connect(fname)
+        l = [c.execute(q).fetchall() for q in queries]
+        c.close()
+        return l
+
+    def report(self, log_filename):
+        # the same results, to the log or (with PDK_INGEST) to the daemon
+        rpt = pycode.reporter(None, filename=log_filename)
+        rpt.report('a', 'P', 1000.0, 1001.5, {'x': 1.5}, {'y': 'z'}, 'ok\n')
+        rpt.report('b', 'F', 1002.0, 1003.0, {}, {},
+                   'line 1\nline 2 é\n\nafter a blank line\n')
+        rpt.report('c.d', 'E', None, None, {'exception': 'oops'}, {}, None)
+        rpt.close()
+
+    def pdk_import(self, db_name, log_name):
+        pandokia.cfg.pdk_db = db_sqlite.PandokiaDB(db_name)
+        try:
+            import_data.run(['-q', log_name])
+        except SystemExit:
+            pass
+        pandokia.cfg.pdk_db.db.close()
+        forget_caches()
+
+    def start_daemon(self, db_name):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                sys.stdout = open(os.devnull, 'w')
+                pandokia.cfg.pdk_db = db_sqlite.PandokiaDB(db_name)
+                status = ingestd.run(['--socket', self.socket_name,
+                                      '--interval', '0.1'])
+            finally:
+                os._exit(status)
+        # wait until it is listening
+        for x in range(100):
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.connect(self.socket_name)
+                break
+            except socket.error:
+                time.sleep(0.1)
+            finally:
+                s.close()
+        return pid
+
+    def wait_for_rows(self, db_name, n):
+        for x in range(100):
+            c = sqlite3.connect(db_name)
+            count = c.execute("SELECT count(*) FROM result_scalar").fetchone()
+            c.close()
+            if count[0] >= n:
+                return
+            time.sleep(0.1)
+
+    def stop_daemon(self, pid):
+        os.kill(pid, signal.SIGTERM)
+        p, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+    def testroundtrip(self):
+        # what "pdk import" makes of the log
+        log = os.path.join(self.dir, 'pdk.log')
+        with open(log, 'w') as f:
+            f.write(pdkrun_header % self.dir)
+        self.report(log)
+        imported = self.new_db('import.db')
+        self.pdk_import(imported, log)
+
+        # a socket left behind by a daemon that died is taken over
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(self.socket_name)
+        s.close()
+
+        # the same results through the daemon
+        daemon = self.new_db('daemon.db')
+        pid = self.start_daemon(daemon)
+        os.environ['PDK_INGEST'] = self.socket_name
+        spill_log = os.path.join(self.dir, 'spill.log')
+        self.report(spill_log)
+        self.wait_for_rows(daemon, 3)
+        self.stop_daemon(pid)
+
+        self.assertFalse(os.path.exists(spill_log))
+        self.assertEqual(len(self.rows(imported)[0]), 3)
+        self.assertEqual(self.rows(daemon), self.rows(imported))
+
+    def testanotherdaemon(self):
+        # a second daemon does not take the socket from the first
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(self.socket_name)
+        s.listen(1)
+        try:
+            self.assertEqual(ingestd.run(['--socket', self.socket_name]), 1)
+            self.assertTrue(os.path.exists(self.socket_name))
+        finally:
+            s.close()
+
+    def testclientspill(self):
+        # with no daemon, the results go in the log
+        os.environ['PDK_INGEST'] = self.socket_name
+        log = os.path.join(self.dir, 'pdk.log')
+        self.report(log)
+        names = [x['test_name'] for x in import_data.read_records(log)]
+        self.assertEqual(names, ['dir/a', 'dir/b', 'dir/c.d'])
+
+    def testdaemonspill(self):
+        # what the daemon does with records that the database refuses
+        log = os.path.join(self.dir, 'pdk.log')
+        with open(log, 'w') as f:
+            f.write(pdkrun_header % self.dir)
+        self.report(log)
+        records = list(import_data.read_records(log, share_defaults=False))
+        forget_caches()
+
+        broken = self.new_db('broken.db')
+        c = sqlite3.connect(broken)
+        c.execute("DROP TABLE result_tda")
+        c.commit()
+        c.close()
+
+        ingestd.spill_filename = os.path.join(self.dir, 'ingest.spill')
+        ingestd.quiet = True
+        ingestd.count_spilled = 0
+        db = db_sqlite.PandokiaDB(broken)
+        saved_stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            ingestd.insert_batch(db, records)
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved_stdout
+        db.db.close()
+        forget_caches()
+
+        # nothing went in, not even the test run
+        self.assertEqual(ingestd.count_spilled, 3)
+        c = sqlite3.connect(broken)
+        self.assertEqual(
+            c.execute("SELECT count(*) FROM result_scalar").fetchone()[0], 0)
+        self.assertEqual(
+            c.execute("SELECT count(*) FROM distinct_test_run").fetchone()[0],
+            0)
+        c.close()
+
+        # and importing the spill file is the same as importing the log
+        from_spill = self.new_db('spill.db')
+        self.pdk_import(from_spill, ingestd.spill_filename)
+        from_log = self.new_db('log.db')
+        self.pdk_import(from_log, log)
+        self.assertEqual(self.rows(from_spill), self.rows(from_log))
+
+    def testbadunicode(self):
+        # a decode error in a socket stream is reported, not a crash
+        a, b = socket.socketpair()
+        b.sendall(b'test_name=x\nbad=\xff\xfe\nEND\n')
+        b.close()
+        saved_stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            list(import_data.read_records(a.makefile('r'),
+                                          share_defaults=False))
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved_stdout
+            a.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
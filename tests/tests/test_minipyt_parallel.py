@@ -0,0 +1,83 @@
+import unittest
+import os
+import signal
+import shutil
+import tempfile
+import types
+import pandokia.import_data
+import pandokia.helpers.pycode as pycode
+import pandokia.helpers.runner_minipyt as runner_minipyt
+
+
+def t_pass():
+    print('passing')
+
+
+def t_fail():
+    assert False
+
+
+def t_error():
+    raise ValueError('oops')
+
+
+def t_killed():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def t_exit():
+    os._exit(3)
+
+
+@unittest.skipIf(not hasattr(os, 'fork'), 'needs fork')
+class MinipytParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, 'pdk.log')
+        self.saved_dots = runner_minipyt.dots_mode
+        runner_minipyt.dots_mode = None
+
+    def tearDown(self):
+        runner_minipyt.dots_mode = self.saved_dots
+        shutil.rmtree(self.dir)
+
+    def run_tests(self, tests, n):
+        rpt = pycode.reporter(None, filename=self.log, test_prefix='')
+        runner_minipyt.run_parallel(rpt, types.ModuleType('m'), tests, n)
+        rpt.close()
+        return [(x['test_name'], x['status'], x.get('tra_exception'))
+                for x in pandokia.import_data.read_records(
+                    self.log, share_defaults=False)]
+
+    def teststatus(self):
+        tests = [('pass', t_pass), ('fail', t_fail), ('error', t_error),
+                 ('killed', t_killed), ('exit', t_exit), ('pass2', t_pass)]
+        for n in (2, 6):
+            if os.path.exists(self.log):
+                os.unlink(self.log)
+            self.assertEqual(self.run_tests(tests, n), [
+                ('pass', 'P', None),
+                ('fail', 'F', None),
+                ('error', 'E', None),
+                ('killed', 'E', 'test process killed by signal %d'
+                 % signal.SIGKILL),
+                ('exit', 'E', 'test process exit status 3'),
+                ('pass2', 'P', None),
+            ])
+
+    def testotherchild(self):
+        # a process that is not one of the tests is not reaped
+        pid = os.fork()
+        if pid == 0:
+            os._exit(7)
+        try:
+            self.run_tests([('pass', t_pass)] * 3, 2)
+        finally:
+            p, status = os.waitpid(pid, 0)
+        self.assertEqual(p, pid)
+        self.assertEqual(os.WEXITSTATUS(status), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
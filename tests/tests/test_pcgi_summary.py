@@ -0,0 +1,125 @@
+import unittest
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import pandokia.db_sqlite as db_sqlite
+import pandokia.pcgi_summary as pcgi_summary
+
+try:
+    from io import StringIO
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from StringIO import StringIO
+    from urlparse import parse_qs, urlparse
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+# hosts with ties, and NULLs in the middle of the key_ids
+hosts = ['b', None, 'a', 'c', 'a', None, 'b', 'a', None, 'c', 'b', 'a']
+
+
+class Pages(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        for n, host in enumerate(hosts):
+            key_id = n + 1
+            c.execute(
+                "INSERT INTO result_scalar ( key_id, test_run, project, host, context, test_name, status ) VALUES ( ?, 'r1', 'p', ?, 'c', ?, 'P' )",
+                (key_id, host, 't%02d' % (len(hosts) - n)))
+            c.execute(
+                "INSERT INTO query ( qid, key_id ) VALUES ( 1, ? )", (key_id,))
+        # another qid that must not show up
+        c.execute("INSERT INTO query ( qid, key_id ) VALUES ( 2, 1 )")
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved = pcgi_summary.pdk_db, pcgi_summary.output
+        pcgi_summary.pdk_db = self.db
+
+    def tearDown(self):
+        pcgi_summary.pdk_db, pcgi_summary.output = self.saved
+        if self.db.db is not None:
+            self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def pages(self, sort, size):
+        # follow the next page links from the first page to the end, the
+        # way a user would; return the key_ids of each page
+        input_query = {'query': ['summary'], 'qid': ['1'],
+                       'page_size': [str(size)]}
+        l = []
+        while True:
+            page = pcgi_summary.summary_page(input_query, sort)
+            rows = pcgi_summary.page_query(1, page)
+            next_page = None
+            # the same as get_table
+            if len(rows) > page['size']:
+                rows = rows[:page['size']]
+                key_id, sort_value = rows[-1]
+                next_page = {'after_key': key_id}
+                if sort_value is not None:
+                    next_page['after'] = sort_value
+            l.append([x[0] for x in rows])
+
+            pcgi_summary.output = out = StringIO()
+            pcgi_summary.page_links(1, input_query, page, len(rows), next_page)
+            links = out.getvalue()
+            self.assertTrue('rows on this page: %d of %d in this qid' %
+                            (len(rows), len(hosts)) in links)
+            if next_page is None:
+                self.assertFalse('next page' in links)
+                return l
+            href = re.findall("<a href='([^']*)'>next page</a>", links)
+            self.assertEqual(len(href), 1)
+            input_query = parse_qs(urlparse(href[0]).query)
+            self.assertEqual(input_query['query'], ['summary'])
+
+    def expect(self, sort):
+        # the order the whole qid should be in
+        keys = list(range(1, len(hosts) + 1))
+        if sort[1:] == 'host':
+            nulls = [x for x in keys if hosts[x - 1] is None]
+            values = sorted([x for x in keys if hosts[x - 1] is not None],
+                            key=lambda x: (hosts[x - 1], x))
+            keys = nulls + values
+        elif sort[1:] == 'test_name':
+            keys.reverse()
+        if sort.startswith('D'):
+            keys.reverse()
+        return keys
+
+    def testpages(self):
+        for sort in ('Uhost', 'Dhost', 'Utest_name', 'Dtest_name',
+                     'Ucontact'):
+            for size in range(1, len(hosts) + 2):
+                l = self.pages(sort, size)
+                keys = [x for page in l for x in page]
+                # every row exactly once, in order
+                self.assertEqual(keys, self.expect(sort), (sort, size))
+                # every page is full except maybe the last, which is
+                # not empty
+                for page in l[:-1]:
+                    self.assertEqual(len(page), size)
+                self.assertTrue(0 < len(l[-1]) <= size, (sort, size))
+                self.assertEqual(len(l), (len(hosts) + size - 1) // size)
+
+    def testall(self):
+        self.assertEqual(
+            pcgi_summary.summary_page({'page_size': ['0']}, 'Uhost'), None)
+        page = pcgi_summary.summary_page({'page_size': ['x']}, 'Uhost')
+        self.assertEqual(page['after_key'], None)
+        page = pcgi_summary.summary_page(
+            {'after_key': ['x'], 'after': ['a']}, 'Uhost')
+        self.assertEqual((page['after_key'], page['after']), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
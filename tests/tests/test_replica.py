@@ -0,0 +1,154 @@
+import unittest
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import pandokia
+import pandokia.db
+import pandokia.db_sqlite as db_sqlite
+import pandokia.common as common
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+
+class replica_db(db_sqlite.PandokiaDB):
+    # sqlite does not have replicas; this one reads from a copy of the
+    # database the way the MySQL and PostgreSQL drivers read from theirs
+
+    def _replica_connect(self, access_arg):
+        if not os.path.exists(access_arg):
+            raise self.DatabaseError('no replica %s' % access_arg)
+        return sqlite3.connect(access_arg)
+
+    def execute(self, statement, parameters=[]):
+        db = self.replica(statement)
+        if db is None:
+            return db_sqlite.PandokiaDB.execute(self, statement, parameters)
+        return db.execute(statement, parameters)
+
+
+class Keyword(unittest.TestCase):
+
+    def testkeyword(self):
+        for statement, word in (
+                ('SELECT 1', 'SELECT'),
+                ('  select 1', 'SELECT'),
+                ('\n\tUpdate query_id SET x = 1', 'UPDATE'),
+                ('SET autocommit=0', 'SET'),
+                ('START TRANSACTION', 'START'),
+                ('', ''),
+                ('WITH x AS ( SELECT 1 ) SELECT * FROM x', 'SELECT'),
+                ('with recursive x ( n ) as ( select 1 union all select n + 1 from x ) select n from x', 'SELECT'),
+                ('WITH x AS ( SELECT key_id FROM query ) DELETE FROM query WHERE key_id IN ( SELECT key_id FROM x )', 'DELETE'),
+                ('WITH x AS ( SELECT 1 ), y AS ( SELECT 2 ) INSERT INTO t SELECT * FROM x', 'INSERT'),
+                ('WITH x AS MATERIALIZED ( SELECT 1 ) UPDATE t SET a = 1', 'UPDATE'),
+                # names and strings that look like keywords
+                ('WITH "select" AS ( SELECT \'(\' ) DELETE FROM t', 'DELETE'),
+                ('WITH update_2 AS ( SELECT 1 ) SELECT 2', 'SELECT'),
+                ('WITH x AS ( SELECT 1', 'WITH')):
+            self.assertEqual(pandokia.db.statement_keyword(statement), word,
+                             statement)
+
+
+class Replica(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        now = int(time.time())
+        for qid, changed in ((1, None), (2, now), (3, now - 1000)):
+            c.execute(
+                "INSERT INTO query_id ( qid, time, expires, changed ) VALUES ( ?, 0, 0, ? )",
+                (qid, changed))
+        c.commit()
+        c.close()
+
+        # the replica is behind: it does not have qid 4
+        self.replica = os.path.join(self.dir, 'replica.db')
+        shutil.copy(fname, self.replica)
+
+        self.db = replica_db(fname)
+        self.db.replica_access_args = (self.replica,)
+        self.saved_db = pandokia.cfg.pdk_db
+        pandokia.cfg.pdk_db = self.db
+
+        self.assertEqual(common.new_qid(), 4)
+        self.db.commit()
+
+    def tearDown(self):
+        pandokia.cfg.pdk_db = self.saved_db
+        if self.db.replica_db is not None:
+            self.db.replica_db.close()
+        if self.db.db is not None:
+            self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def has_4(self):
+        c = self.db.execute("SELECT qid FROM query_id WHERE qid = 4")
+        return c.fetchone() is not None
+
+    def teststicky(self):
+        db = self.db
+        common.use_replica()
+        self.assertTrue(db.reading_replica)
+        self.assertFalse(self.has_4())
+
+        # reading, and things that are neither, stay on the replica
+        c = db.execute(
+            "WITH x AS ( SELECT qid FROM query_id ) SELECT count(*) FROM x")
+        self.assertEqual(c.fetchone()[0], 3)
+        self.assertTrue(db.execute("PRAGMA case_sensitive_like = true") is not None)
+        self.assertTrue(db.reading_replica)
+
+        # the first write goes to the primary, and so does everything
+        # after it, so we see what we wrote
+        db.execute(
+            "WITH x AS ( SELECT 4 AS qid ) UPDATE query_id SET notes = 'n' WHERE qid IN ( SELECT qid FROM x )")
+        self.assertFalse(db.reading_replica)
+        c = db.execute("SELECT notes FROM query_id WHERE qid = 4")
+        self.assertEqual(c.fetchone()[0], 'n')
+        self.assertTrue(self.has_4())
+
+    def testqid(self):
+        # new and recently changed qids, and ones we do not know, read
+        # the primary
+        for qid in (2, 4, 99):
+            common.use_replica(qid)
+            self.assertFalse(self.db.reading_replica, qid)
+
+        for qid in (1, 3):
+            common.use_replica(qid)
+            self.assertTrue(self.db.reading_replica, qid)
+            self.db.use_primary()
+
+        # a page that changes the qid marks it, on the primary
+        common.use_replica(3)
+        common.qid_changed(3)
+        self.assertFalse(self.db.reading_replica)
+        self.db.commit()
+        common.use_replica(3)
+        self.assertFalse(self.db.reading_replica)
+
+    def testnoreplica(self):
+        # without replicas, nothing changes
+        self.db.replica_access_args = ()
+        common.use_replica(1)
+        self.assertFalse(self.db.reading_replica)
+        common.qid_changed(1)
+        c = self.db.execute("SELECT changed FROM query_id WHERE qid = 1")
+        self.assertEqual(c.fetchone()[0], None)
+
+        # or if the replica cannot be reached
+        self.db.replica_access_args = (os.path.join(self.dir, 'none.db'),)
+        common.use_replica(1)
+        self.assertTrue(self.db.reading_replica)
+        self.assertTrue(self.has_4())
+        self.assertFalse(self.db.reading_replica)
+
+
+if __name__ == '__main__':
+    unittest.main()
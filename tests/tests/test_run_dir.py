@@ -0,0 +1,215 @@
+import unittest
+import os
+import sys
+import types
+import shutil
+import tempfile
+import subprocess
+import pandokia.envgetter as envgetter
+import pandokia.import_data as import_data
+import pandokia.run_dir as run_dir
+import pandokia.run_file as run_file
+import pandokia.runners.pytest as pytest_runner
+
+try:
+    import pandokia.helpers.pytest_plugin
+    have_plugin = True
+except Exception:
+    have_plugin = False
+
+
+def which(name):
+    for d in os.environ.get('PATH', '').split(os.pathsep):
+        f = os.path.join(d, name)
+        if os.path.isfile(f) and os.access(f, os.X_OK):
+            return f
+    return None
+
+
+# what the pandokia plugin writes with --collectonly, for a pdkpytest
+# that does not need pytest
+fake_pdkpytest = '''#!%s
+import sys
+log = [x[9:] for x in sys.argv if x.startswith('--pdklog=')][0]
+f = open(log, 'a')
+for x in sys.argv[1:]:
+    if not x.startswith('-'):
+        f.write('test_name=sub/%%s/test_one\\nstatus=D\\nEND\\n' %% x[:-3])
+        f.write('test_name=sub/%%s/test_two\\nstatus=D\\nEND\\n' %% x[:-3])
+f.close()
+''' % sys.executable
+
+
+class ReportDisabled(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_env = dict(os.environ)
+        self.dir = tempfile.mkdtemp()
+        self.top = os.path.join(self.dir, 'top')
+        self.sub = os.path.join(self.top, 'sub')
+        self.tmp = os.path.join(self.dir, 'tmp')
+        os.makedirs(self.sub)
+        os.mkdir(self.tmp)
+        open(os.path.join(self.top, 'pandokia_top'), 'w').close()
+        with open(os.path.join(self.sub, 'pdk_runners'), 'w') as f:
+            f.write('*.py\tfakelst\n')
+        for x in ('a.py', 'a.disable', 'b.py', 'b.disable'):
+            with open(os.path.join(self.sub, x), 'w') as f:
+                f.write('# %s\n' % x)
+        self.files = sorted(os.listdir(self.sub))
+
+        self.log = os.path.join(self.dir, 'pdk.log')
+        os.environ.pop('PDK_TESTPREFIX', None)
+        os.environ.pop('PDK_PROCESS_SLOT', None)
+        os.environ.update(PDK_LOG=self.log, PDK_TESTRUN='run1',
+                          PDK_CONTEXT='default', PDK_PROJECT='proj',
+                          PDK_HOST='host1', PDK_TMP=self.tmp)
+
+        # a runner that says what it was asked
+        self.calls = []
+        self.answers = {'a.py': ['sub/a/x', 'sub/a/y'], 'b.py': ['sub/b/z']}
+        m = types.ModuleType('fakelst')
+
+        def lst_many(env, basenames):
+            self.calls.append(list(basenames))
+            return dict([(x, self.answers[x]) for x in basenames])
+        m.lst_many = lst_many
+        run_file.runner_modules['fakelst'] = m
+
+    def tearDown(self):
+        del run_file.runner_modules['fakelst']
+        run_file.runner_matcher_cache.pop(self.sub, None)
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.dir)
+
+    def run_dir(self):
+        saved = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            err, t_stat = run_dir.run(
+                self.sub, envgetter.EnvGetter(defdict=dict(os.environ)))
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved
+        self.assertEqual(err, 0)
+
+    def reported(self):
+        # the status=D records in the log, and start over
+        l = [(x['name'], x['status'], x['location'])
+             for x in import_data.read_records(self.log, share_defaults=False)]
+        os.unlink(self.log)
+        return sorted(l)
+
+    def testcache(self):
+        expect = [
+            ('sub/a/x', 'D', self.sub + '/a.py'),
+            ('sub/a/y', 'D', self.sub + '/a.py'),
+            ('sub/b/z', 'D', self.sub + '/b.py'),
+        ]
+        self.run_dir()
+        self.assertEqual(self.calls, [['a.py', 'b.py']])
+        self.assertEqual(self.reported(), expect)
+
+        # the cache is in PDK_TMP, not with the tests
+        self.assertEqual(sorted(os.listdir(self.sub)), self.files)
+        self.assertEqual(os.listdir(self.tmp), [run_dir.lst_cache_name])
+
+        # the next run uses the cache
+        self.run_dir()
+        self.assertEqual(self.calls, [['a.py', 'b.py']])
+        self.assertEqual(self.reported(), expect)
+
+        # until a file changes
+        with open(os.path.join(self.sub, 'a.py'), 'a') as f:
+            f.write('# more\n')
+        self.answers['a.py'] = ['sub/a/x']
+        self.run_dir()
+        self.assertEqual(self.calls, [['a.py', 'b.py'], ['a.py']])
+        self.assertEqual(self.reported(), expect[:1] + expect[2:])
+
+    def testnotcached(self):
+        # a file that the runner does not know about is asked again
+        self.answers['b.py'] = []
+        self.run_dir()
+        self.run_dir()
+        self.assertEqual(self.calls, [['a.py', 'b.py'], ['b.py']])
+
+    def testnotmp(self):
+        # without PDK_TMP, there is no cache
+        del os.environ['PDK_TMP']
+        self.run_dir()
+        self.run_dir()
+        self.assertEqual(self.calls, [['a.py', 'b.py'], ['a.py', 'b.py']])
+        self.assertEqual(sorted(os.listdir(self.sub)), self.files)
+        self.assertEqual(os.listdir(self.tmp), [])
+
+
+class PytestLst(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_env = dict(os.environ)
+        self.saved_cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        self.sub = os.path.join(self.dir, 'sub')
+        os.mkdir(self.sub)
+        with open(os.path.join(self.sub, 't1.py'), 'w') as f:
+            f.write('def test_one():\n    pass\n\n'
+                    'def test_two():\n    pass\n')
+        with open(os.path.join(self.sub, 't2.py'), 'w') as f:
+            f.write('def test_one():\n    pass\n\n'
+                    'def test_two():\n    pass\n')
+        # a file with the name that lst_many used to use for its log
+        with open(os.path.join(self.sub, 'pdk.runner.tmp'), 'w') as f:
+            f.write('not yours\n')
+        self.files = sorted(os.listdir(self.sub))
+        os.chdir(self.sub)
+        self.env = dict(os.environ, PDK_TESTPREFIX='sub/')
+
+    def tearDown(self):
+        os.chdir(self.saved_cwd)
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.dir)
+
+    def check(self):
+        self.assertEqual(
+            pytest_runner.lst_many(self.env, ['t1.py', 't2.py']),
+            {'t1.py': ['sub/t1/test_one', 'sub/t1/test_two'],
+             't2.py': ['sub/t2/test_one', 'sub/t2/test_two']})
+        # its temp files are gone, and it did not touch anything else
+        self.assertEqual(sorted(os.listdir(self.sub)), self.files)
+        with open('pdk.runner.tmp') as f:
+            self.assertEqual(f.read(), 'not yours\n')
+
+    def testfake(self):
+        bindir = os.path.join(self.dir, 'bin')
+        os.mkdir(bindir)
+        fname = os.path.join(bindir, 'pdkpytest')
+        with open(fname, 'w') as f:
+            f.write(fake_pdkpytest)
+        os.chmod(fname, 0o755)
+        self.env['PATH'] = bindir + os.pathsep + self.env.get('PATH', '')
+        self.check()
+
+    @unittest.skipIf(not have_plugin or which('pdkpytest') is None,
+                     'needs pdkpytest and the pandokia pytest plugin')
+    def testcollectonly(self):
+        self.check()
+
+        # every test that the plugin reports under --collectonly is
+        # status D
+        p = subprocess.Popen(
+            ['pdkpytest', '--pdk', '--pdklog=collect.log', '--collectonly',
+             't1.py'], env=self.env, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        p.communicate()
+        l = [(x['test_name'], x['status']) for x in
+             import_data.read_records('collect.log', share_defaults=False)]
+        os.unlink('collect.log')
+        self.assertEqual(sorted(l), [('sub/t1/test_one', 'D'),
+                                     ('sub/t1/test_two', 'D')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import pandokia.envgetter as envgetter
+import pandokia.import_data as import_data
+import pandokia.run_dir as run_dir
+import pandokia.run_file as run_file
+
+
+def which(name):
+    for d in os.environ.get('PATH', '').split(os.pathsep):
+        f = os.path.join(d, name)
+        if os.path.isfile(f) and os.access(f, os.X_OK):
+            return f
+    return None
+
+
+test_files = {
+    't_one.py': '''
+def test_pass():
+    tda['x'] = 1
+    tra['y'] = 2
+
+def test_fail():
+    assert False
+
+def test_error():
+    raise ValueError('oops')
+''',
+    # the child crashes before it reports anything
+    't_crash.py': '''
+import os
+import signal
+os.kill(os.getpid(), signal.SIGKILL)
+
+def test_never():
+    pass
+''',
+    't_exit.py': '''
+import sys
+
+def test_before():
+    pass
+
+sys.exit(3)
+''',
+}
+
+
+class Fork(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_env = dict(os.environ)
+        self.saved_cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        self.top = os.path.join(self.dir, 'top')
+        self.sub = os.path.join(self.top, 'sub')
+        os.makedirs(self.sub)
+        open(os.path.join(self.top, 'pandokia_top'), 'w').close()
+        with open(os.path.join(self.sub, 'pdk_runners'), 'w') as f:
+            f.write('*.py\tminipyt\n')
+        for name in test_files:
+            with open(os.path.join(self.sub, name), 'w') as f:
+                f.write(test_files[name])
+
+        self.log = os.path.join(self.dir, 'pdk.log')
+        for x in ('PDK_TESTPREFIX', 'PDK_PROCESS_SLOT', 'PDK_FORK',
+                  'PDK_TIMEOUT', 'PDK_TMP'):
+            os.environ.pop(x, None)
+        os.environ.update(PDK_LOG=self.log, PDK_TESTRUN='run1',
+                          PDK_CONTEXT='default', PDK_PROJECT='proj',
+                          PDK_HOST='host1')
+
+    def tearDown(self):
+        run_file.runner_matcher_cache.pop(self.sub, None)
+        os.chdir(self.saved_cwd)
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.dir)
+
+    def run_dir(self, fork):
+        env = dict(os.environ)
+        if fork:
+            env['PDK_FORK'] = '1'
+        saved = sys.stdout
+        sys.stdout = out = open(os.path.join(self.dir, 'out'), 'w')
+        try:
+            err, t_stat = run_dir.run(
+                self.sub, envgetter.EnvGetter(defdict=env))
+        finally:
+            sys.stdout = saved
+            out.close()
+        with open(os.path.join(self.dir, 'out')) as f:
+            out = f.read()
+        self.assertEqual(('fork: ' in out), fork)
+
+        # the test results, without the times and resource usage
+        l = []
+        for x in import_data.read_records(self.log, share_defaults=False):
+            d = dict([(k, v) for k, v in x.items()
+                      if (k.startswith('tda_') or k.startswith('tra_')) and
+                      not k.startswith('tra_rusage_')])
+            l.append((x['test_name'], x['status'], d))
+        os.unlink(self.log)
+        return sorted(l), t_stat
+
+    def check(self, fork):
+        l, t_stat = self.run_dir(fork)
+        # a crash is an error for the file as a whole
+        self.assertEqual([x[:2] for x in l], [
+            ('%s/t_crash.py' % self.sub, 'E'),
+            ('sub/t_exit', 'E'),
+            ('sub/t_one', 'E'),
+            ('sub/t_one.test_error', 'E'),
+            ('sub/t_one.test_fail', 'F'),
+            ('sub/t_one.test_pass', 'P'),
+        ])
+        self.assertEqual(l[-1][2], {'tda_x': '1', 'tra_y': '2'})
+        self.assertEqual((t_stat['P'], t_stat['F'], t_stat['E']), (1, 1, 4))
+        return l, t_stat
+
+    @unittest.skipIf(not hasattr(os, 'fork'), 'needs fork')
+    def testfork(self):
+        self.check(True)
+
+    @unittest.skipIf(not hasattr(os, 'fork') or
+                     which('pdk_python_runner') is None,
+                     'needs fork and pdk_python_runner')
+    def testsame(self):
+        self.assertEqual(self.check(True), self.check(False))
+
+
+if __name__ == '__main__':
+    unittest.main()
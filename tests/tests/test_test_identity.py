@@ -0,0 +1,158 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import pandokia.db_sqlite as db_sqlite
+import pandokia.test_identity as test_identity
+import pandokia.cleaner as cleaner
+import pandokia.dbstats as dbstats
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+all_columns = "SELECT key_id, test_run, project, host, context, test_name, status, test_runner, start_time, end_time, location, attn, has_okfile, chronic FROM result_scalar ORDER BY key_id"
+
+results = [
+    (1, 'r1', 'p', 'h', 'c', 'a', 'P', 'pytest', '1.0', '2.0', '/x', 'N', 'T', 'N'),
+    (2, 'r1', 'p', 'h', 'c', 'b', 'F', None, None, None, None, None, None, None),
+    (3, 'r2', 'p', 'h', 'c', 'a', 'E', 'pytest', '3.0', '4.0', '/x', 'Y', 'F', 'Y'),
+    (4, 'r1', 'p', None, 'c', 'a', 'P', None, None, None, None, 'N', None, None),
+    (5, 'r1', 'p', 'h', None, 'a', 'P', None, None, None, None, 'N', None, None),
+    (6, None, 'p', 'h', 'c', 'a', 'P', None, None, None, None, 'N', None, None),
+    (7, 'r1', '', '', '', 'a', 'P', None, None, None, None, 'N', None, None),
+    (8, 'r2', 'p', None, None, 'a', 'F', None, None, None, None, 'N', None, None),
+    # the record that cleaner.block_last_record leaves at the end
+    (9, None, None, None, None, None, None, None, None, None, None, None, None, None),
+]
+
+
+class Migrate(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        for x in results:
+            c.execute(
+                "INSERT INTO result_scalar ( key_id, test_run, project, host, context, test_name, status, test_runner, start_time, end_time, location, attn, has_okfile, chronic ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )",
+                x)
+        c.execute(
+            "INSERT INTO result_tda ( key_id, name, value ) VALUES ( 1, 'x', '1' )")
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved_cleaner_db = cleaner.pdk_db
+        cleaner.pdk_db = self.db
+        test_identity.is_normalized = None
+        test_identity.forget()
+
+    def tearDown(self):
+        cleaner.pdk_db = self.saved_cleaner_db
+        test_identity.is_normalized = None
+        test_identity.forget()
+        self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def rows(self):
+        return list(self.db.execute(all_columns))
+
+    def migrate(self, drop=False):
+        test_identity.migrate(self.db, drop=drop, verbose=False)
+        test_identity.is_normalized = None
+        self.assertTrue(test_identity.normalized(self.db))
+
+    def testsame(self):
+        before = self.rows()
+        self.assertEqual(len(before), len(results))
+        self.migrate()
+        self.assertEqual(self.rows(), before)
+
+        # NULL is still NULL, and '' is still ''
+        c = self.db.execute(
+            "SELECT key_id FROM result_scalar WHERE host IS NULL ORDER BY key_id")
+        self.assertEqual([x for x, in c], [4, 8, 9])
+        c = self.db.execute(
+            "SELECT key_id FROM result_scalar WHERE host = '' ORDER BY key_id")
+        self.assertEqual([x for x, in c], [7])
+
+        # the other tables still join
+        c = self.db.execute(
+            "SELECT s.test_name, t.value FROM result_scalar s, result_tda t WHERE s.key_id = t.key_id")
+        self.assertEqual(list(c), [('a', '1')])
+
+    def testindexes(self):
+        self.assertTrue(
+            len(dbstats.table_indexes(self.db, 'result_scalar')) > 1)
+        self.migrate()
+        # only the primary key is left on the old table
+        self.assertEqual(
+            dbstats.table_indexes(self.db, 'result_scalar_old'),
+            [('primary key', ['key_id'])])
+        # and the names are free to use again
+        self.db.execute(
+            "CREATE INDEX result_scalar_history ON result_fact ( identity_id )")
+
+    def testdrop(self):
+        before = self.rows()
+        self.migrate(drop=True)
+        self.assertFalse(self.db.has_table('result_scalar_old'))
+        self.assertEqual(self.rows(), before)
+
+    def testinsert(self):
+        self.migrate()
+        expect = self.rows()
+        for key_id, cols in (
+                (10, [('test_run', 'r3'), ('project', 'p'), ('host', None),
+                      ('context', 'c'), ('test_name', 'a')]),
+                # the same identity again
+                (11, [('test_run', 'r4'), ('project', 'p'), ('host', None),
+                      ('context', 'c'), ('test_name', 'a')]),
+                (12, [('test_run', None), ('project', ''), ('host', ''),
+                      ('context', ''), ('test_name', 'a')])):
+            test_identity.insert_result(
+                self.db, [('key_id', key_id)] + cols + [('status', 'P')])
+            d = dict(cols)
+            expect.append((key_id, d['test_run'], d['project'], d['host'],
+                           d['context'], d['test_name'], 'P',
+                           None, None, None, None, None, None, None))
+        self.db.commit()
+        self.assertEqual(self.rows(), expect)
+
+        # an identity that has a NULL is found, not made again
+        c = self.db.execute(
+            "SELECT count(*) FROM test_identity WHERE project = 'p' AND host IS NULL AND context = 'c' AND test_name = 'a'")
+        self.assertEqual(c.fetchone()[0], 1)
+
+        # and a new process finds the ones already in the database
+        test_identity.forget()
+        test_identity.insert_result(
+            self.db, [('key_id', 13), ('test_run', 'r4'), ('project', ''),
+                      ('host', ''), ('context', ''), ('test_name', 'a')])
+        c = self.db.execute("SELECT count(*) FROM test_run_dim")
+        self.assertEqual(c.fetchone()[0], 5)
+        c = self.db.execute(
+            "SELECT count(*) FROM test_identity WHERE project = '' AND test_name = 'a'")
+        self.assertEqual(c.fetchone()[0], 1)
+
+    def testblock(self):
+        self.migrate()
+        before = self.rows()
+        cleaner.block_last_record()
+        self.db.commit()
+
+        # the old block record is replaced with a new one at the end
+        after = self.rows()
+        self.assertEqual(after[:-1], before[:-1])
+        self.assertEqual(after[-1][1:], before[-1][1:])
+
+        # and it is in result_fact like any other record
+        c = self.db.execute(
+            "SELECT count(*) FROM result_fact WHERE test_run_id IS NULL OR identity_id IS NULL")
+        self.assertEqual(c.fetchone()[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import pandokia
+import pandokia.db_sqlite as db_sqlite
+import pandokia.import_data as import_data
+import pandokia.test_identity as test_identity
+import pandokia.test_name_tree as test_name_tree
+
+schema = os.path.join(os.path.dirname(db_sqlite.__file__), 'sql', 'sqlite.sql')
+
+sample_log = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'import', 'sample_pdk_log')
+
+tree_rows = "SELECT test_run, parent, child, leaf FROM test_name_tree ORDER BY test_run, parent, child, leaf"
+
+
+class Rebuild(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'pdk.db')
+        c = sqlite3.connect(fname)
+        with open(schema) as f:
+            c.executescript(f.read())
+        c.commit()
+        c.close()
+
+        self.db = db_sqlite.PandokiaDB(fname)
+        self.saved_db = pandokia.cfg.pdk_db
+        pandokia.cfg.pdk_db = self.db
+        self.new_process()
+
+    def tearDown(self):
+        pandokia.cfg.pdk_db = self.saved_db
+        self.new_process()
+        self.db.db.close()
+        shutil.rmtree(self.dir)
+
+    def new_process(self):
+        test_name_tree.table_exists = None
+        test_name_tree.forget()
+        test_identity.is_normalized = None
+        test_identity.forget()
+        import_data.default_record = {}
+        import_data.all_test_runs.clear()
+
+    def import_log(self, fname, *args):
+        saved = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            import_data.run(['-q'] + list(args) + [fname])
+        except SystemExit:
+            pass
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved
+        self.new_process()
+
+    def rows(self):
+        return list(self.db.execute(tree_rows))
+
+    def testrebuild(self):
+        self.import_log(sample_log)
+        imported = self.rows()
+        self.assertTrue(len(imported) > 0)
+        self.assertTrue(('sample', '', 'minipyt/', '0') in imported)
+        self.assertTrue(
+            ('sample', 'minipyt/', 'assert_on_import_f', '1') in imported)
+
+        # the same test names from another host, in batches: every
+        # level is already there
+        with open(sample_log) as f:
+            log = f.read()
+        other = os.path.join(self.dir, 'other_log')
+        with open(other, 'w') as f:
+            f.write(log.replace('host=banana', 'host=apple'))
+        self.import_log(other, '--batch', '5')
+        c = self.db.execute(
+            "SELECT host, count(*) FROM result_scalar WHERE test_run = 'sample' GROUP BY host ORDER BY host")
+        (apple, n), (banana, m) = list(c)
+        self.assertEqual(n, m)
+        self.assertEqual(self.rows(), imported)
+
+        # and rebuilding from the test names makes the same tree
+        test_name_tree.have_table(self.db)
+        self.assertTrue(test_name_tree.rebuild(self.db, 'sample') > 0)
+        self.assertEqual(self.rows(), imported)
+
+    def testunique(self):
+        test_name_tree.have_table(self.db)
+        test_name_tree.add(self.db, 'r1', 'a/b.c')
+        self.db.commit()
+        before = self.rows()
+        self.assertEqual(len(before), 3)
+
+        # a process that does not know the rows are there
+        test_name_tree.forget()
+        test_name_tree.add(self.db, 'r1', 'a/b.c')
+        test_name_tree.add(self.db, 'r1', 'a/b.d')
+        self.db.commit()
+        self.assertEqual(self.rows(), sorted(before + [('r1', 'a/b.', 'd', '1')]))
+
+
+if __name__ == '__main__':
+    unittest.main()